@@ -0,0 +1,77 @@
+"""Rows/sec of `executemany` vs the COPY + staging merge BulkWriter on a local Postgres.
+
+Needs the schema (`python main.py create_schema`). Rows use throwaway `BENCH*`
+tickers which are deleted afterwards. Run from the `nsdq_scarper` folder:
+    python -m benchmarks.bench_bulk_writer --rows 50000
+"""
+import asyncio
+import argparse
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from database import Database
+from bulk_writer import BulkWriter, TABLES
+
+
+def metadata_rows(n_rows:int, tickers:list) -> list:
+    day = datetime(2024, 11, 8)
+    return [(tickers[i % len(tickers)], 'NASDAQ-GS', 'Technology', 'Computer Software', Decimal('245.00'),
+             '$228.66/$224.21', 40233521, 47382910, Decimal('225.12'), '$237.49/$164.08', 3410530128000,
+             Decimal('37.12'), Decimal('33.87'), Decimal('6.08'), Decimal('1.00'), day, day, Decimal('0.44'),
+             None, None, None) for i in range(n_rows)]
+
+
+def dividend_rows(n_rows:int, tickers:list) -> list:
+    day = datetime(2024, 11, 8)
+    return [(tickers[i % len(tickers)], day - timedelta(days=i // len(tickers)), 'Cash', Decimal('0.25'),
+             day, day, day, 'USD') for i in range(n_rows)]
+
+
+def insert_query(table:str) -> str:
+    columns = TABLES[table]['columns']
+    values = ','.join(f'${i}' for i in range(1, len(columns) + 1))
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({values}) {TABLES[table]['on_conflict']}"
+
+
+async def cleanup(db:Database):
+    for table in ('metadata', 'dividends', 'tickers'):
+        await db.execute(f"DELETE FROM {table} WHERE ticker LIKE 'BENCH%'")
+
+
+async def main(args):
+    db = Database(args.host, args.user, args.password, args.database)
+    await db.create_pool()
+    tickers = [f'BENCH{i:05d}' for i in range(args.tickers)]
+    try:
+        await cleanup(db)
+        await db.executemany(insert_query('tickers'), [(t, None, None, None, None, None, None, None) for t in tickers])
+        for table, rows in [('metadata', metadata_rows(args.rows, tickers)),
+                            ('dividends', dividend_rows(args.rows, tickers))]:
+            start = time.perf_counter()
+            query = insert_query(table)
+            for i in range(0, len(rows), args.batch_size):
+                await db.executemany(query, rows[i:i + args.batch_size])
+            executemany_rps = len(rows) / (time.perf_counter() - start)
+            await db.execute(f"DELETE FROM {table} WHERE ticker LIKE 'BENCH%'")
+
+            start = time.perf_counter()
+            async with BulkWriter(db, table, max_rows=args.batch_size) as writer:
+                await writer.add_many(rows)
+            copy_rps = len(rows) / (time.perf_counter() - start)
+            print(f"{table:<12} executemany {executemany_rps:10.0f} rows/s  "
+                  f"copy+merge {copy_rps:10.0f} rows/s  ({copy_rps / executemany_rps:.1f}x)")
+    finally:
+        await cleanup(db)
+        await db.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark executemany vs COPY bulk writer")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--tickers", type=int, default=1000)
+    parser.add_argument("--batch_size", type=int, default=5000)
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--user", type=str, default="test")
+    parser.add_argument("--password", type=str, default="test")
+    parser.add_argument("--database", type=str, default="nsdq")
+    asyncio.run(main(parser.parse_args()))
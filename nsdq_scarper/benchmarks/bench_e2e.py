@@ -0,0 +1,213 @@
+"""End-to-end throughput of the `main.py` actions: mock API -> scrape -> clean -> Postgres.
+
+Every scale gets a fresh database, `tickers` fills it from a synthetic symbols csv
+and the other actions then run over it. Each action runs as its own `main.py`
+process, its wall time and peak RSS come from the OS and its request latency
+percentiles from the metrics report it writes.
+
+Postgres is either a throwaway cluster started with `initdb`/`pg_ctl` (default,
+needs the Postgres server binaries on PATH or `--pg_bin`) or a database created
+and dropped on an existing server with `--db_host`. Run from the `nsdq_scarper` folder:
+    python -m benchmarks.bench_e2e --tickers 1000 7000 50000
+    python -m benchmarks.bench_e2e --tickers 1000 --latency 0.05 --rate_429 0.02 --json bench.json
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+import asyncpg
+from database import Database
+from partitions import maintain
+
+ACTIONS = ('tickers', 'metadata', 'dividends', 'institutionals', 'all')
+HERE = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def temp_postgres(pg_bin:str=None, user:str='test'):
+    """Throwaway cluster with fsync off in a temp folder, yields its port"""
+    def binary(name):
+        path = os.path.join(pg_bin, name) if pg_bin else shutil.which(name)
+        if not path or not os.path.exists(path):
+            sys.exit(f"'{name}' not found, pass --pg_bin or use --db_host with an existing server")
+        return path
+
+    folder = tempfile.mkdtemp(prefix='nsdq_bench_pg_')
+    data = os.path.join(folder, 'data')
+    port = free_port()
+    subprocess.run([binary('initdb'), '-D', data, '-U', user, '--auth=trust'], check=True, stdout=subprocess.DEVNULL)
+    options = f"-p {port} -k {folder} -c listen_addresses=127.0.0.1 -c fsync=off -c synchronous_commit=off"
+    subprocess.run([binary('pg_ctl'), '-D', data, '-o', options, '-l', os.path.join(folder, 'log'), '-w', 'start'],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        yield port
+    finally:
+        subprocess.run([binary('pg_ctl'), '-D', data, '-m', 'immediate', 'stop'], stdout=subprocess.DEVNULL)
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+@contextmanager
+def mock_api(latency:float, error_rate:float, rate_429:float):
+    """Mock nasdaq server in its own process, so it does not share the event loop being measured"""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.mock_nasdaq', '--port', str(port), '--latency', str(latency),
+         '--error_rate', str(error_rate), '--rate_429', str(rate_429)], cwd=HERE, stdout=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        yield f"http://127.0.0.1:{port}/api/"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def fresh_database(host:str, port:int, user:str, password:str, name:str):
+    """Drop and recreate `name` with the schema"""
+    conn = await asyncpg.connect(host=host, port=port, user=user, password=password, database='postgres')
+    try:
+        await conn.execute(f'DROP DATABASE IF EXISTS {name}')
+        await conn.execute(f'CREATE DATABASE {name}')
+    finally:
+        await conn.close()
+    db = Database(host, user, password, name, port)
+    await db.create_pool()
+    try:
+        await db.create_schema()
+        await maintain(db)
+    finally:
+        await db.close_pool()
+
+
+async def drop_database(host:str, port:int, user:str, password:str, name:str):
+    conn = await asyncpg.connect(host=host, port=port, user=user, password=password, database='postgres')
+    try:
+        await conn.execute(f'DROP DATABASE IF EXISTS {name}')
+    finally:
+        await conn.close()
+
+
+def write_symbols(file_name:str, n_tickers:int):
+    with open(file_name, 'w') as f:
+        f.write('Symbol\n')
+        f.writelines(f'B{i:06d}\n' for i in range(n_tickers))
+
+
+def run_action(action:str, n_tickers:int, base_url:str, db:dict, symbols:str, args) -> dict:
+    """Run one `main.py` action, returns wall time, peak RSS and request latency"""
+    metrics_dir = tempfile.mkdtemp(prefix='nsdq_bench_metrics_')
+    command = [sys.executable, 'main.py', action, '--base_url', base_url, '--db_host', db['host'],
+               '--db_port', str(db['port']), '--db_name', db['name'], '--db_user', args.user,
+               '--db_password', args.password, '--tickers_csv', symbols,
+               '--rate', str(args.rate), '--max_in_flight', str(args.max_in_flight),
+               '--batch_size', str(args.batch_size), '--metrics_dir', metrics_dir, '--write_unchanged']
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=HERE, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    latencies = {'p50': 0.0, 'p99': 0.0}
+    reports = glob.glob(os.path.join(metrics_dir, '*.json'))
+    if reports:
+        with open(reports[0]) as f:
+            histograms = json.load(f)['histograms'].get('nsdq_request_seconds', [])
+        if histograms:
+            # Endpoints of the action weighted by request count
+            count = sum(h['count'] for h in histograms)
+            for q in latencies:
+                latencies[q] = sum(h[q] * h['count'] for h in histograms) / count if count else 0.0
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    return {
+        'action': action,
+        'tickers': n_tickers,
+        'ok': process.returncode == 0,
+        'seconds': round(elapsed, 3),
+        'tickers_per_sec': round(n_tickers / elapsed, 1),
+        'p50_ms': round(latencies['p50'] * 1000, 2),
+        'p99_ms': round(latencies['p99'] * 1000, 2),
+        'peak_rss_mb': round(rss_mb, 1),
+    }
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def bench(args, db_host:str, db_port:int) -> list:
+    results = []
+    name = 'nsdq_bench'
+    db = {'host': db_host, 'port': db_port, 'name': name}
+    symbols = os.path.join(tempfile.mkdtemp(prefix='nsdq_bench_'), 'symbols.csv')
+    print(f"{'action':<15} {'tickers':>8} {'seconds':>9} {'tickers/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'rss MB':>8}")
+    with mock_api(args.latency, args.error_rate, args.rate_429) as base_url:
+        for n_tickers in args.tickers:
+            write_symbols(symbols, n_tickers)
+            asyncio.run(fresh_database(db_host, db_port, args.user, args.password, name))
+            for action in args.actions:
+                result = run_action(action, n_tickers, base_url, db, symbols, args)
+                results.append(result)
+                print(f"{action:<15} {n_tickers:>8} {result['seconds']:>9.1f} {result['tickers_per_sec']:>10.1f} "
+                      f"{result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['peak_rss_mb']:>8.1f}"
+                      f"{'' if result['ok'] else '  FAILED'}")
+    if not args.keep:
+        asyncio.run(drop_database(db_host, db_port, args.user, args.password, name))
+    shutil.rmtree(os.path.dirname(symbols), ignore_errors=True)
+    return results
+
+
+def main(args):
+    if args.db_host:
+        results = bench(args, args.db_host, args.db_port)
+    else:
+        with temp_postgres(args.pg_bin, args.user) as port:
+            results = bench(args, '127.0.0.1', port)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'commit': commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'settings': {k: v for k, v in vars(args).items() if k not in ('json', 'password')},
+                       'results': results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the main.py actions")
+    parser.add_argument("--tickers", type=int, nargs="+", default=[1000, 7000, 50000])
+    parser.add_argument("--actions", type=str, nargs="+", default=list(ACTIONS), choices=ACTIONS)
+    parser.add_argument("--latency", type=float, default=0.02, help="Mock API seconds per response")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Mock API fraction of 500s")
+    parser.add_argument("--rate_429", type=float, default=0.0, help="Mock API fraction of 429s")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Scraper starting requests per second")
+    parser.add_argument("--max_in_flight", type=int, default=50)
+    parser.add_argument("--batch_size", type=int, default=5000)
+    parser.add_argument("--db_host", type=str, default=None, help="Existing Postgres instead of a throwaway cluster")
+    parser.add_argument("--db_port", type=int, default=5432)
+    parser.add_argument("--user", type=str, default="test")
+    parser.add_argument("--password", type=str, default="test")
+    parser.add_argument("--pg_bin", type=str, default=None, help="Folder of initdb/pg_ctl")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark database")
+    parser.add_argument("--json", type=str, default=None, help="Also write the results as json, e.g. per commit")
+    main(parser.parse_args())
@@ -0,0 +1,77 @@
+"""Requests/sec of a fresh client per request vs the shared pooled client.
+
+Both go through `Scarper.request_json` with a scheduler whose rate is never the limit,
+only the client differs. Run from the `nsdq_scarper` folder:
+    python -m benchmarks.bench_http_client --tickers 2000 --batch_size 50
+"""
+import asyncio
+import argparse
+import time
+import httpx
+from scarper import Scarper
+from scheduler import AdaptiveScheduler
+from benchmarks.mock_nasdaq import MockNasdaq
+
+
+class PerRequestClient:
+    """Stands in for the shared client: a new AsyncClient (and TCP handshake) for every request"""
+    is_closed = False
+
+    def __init__(self, headers:dict) -> None:
+        self.headers = headers
+
+    async def get(self, url:str) -> httpx.Response:
+        async with httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0, read=20.0),
+            headers=self.headers,
+            follow_redirects=True,
+        ) as client:
+            return await client.get(url)
+
+
+class PerRequestClientScarper(Scarper):
+    """Old behaviour: `request_json` gets a fresh client for every request"""
+    @property
+    def client(self) -> PerRequestClient:
+        return PerRequestClient(self.HEADERS)
+
+
+def scheduler(max_in_flight:int) -> AdaptiveScheduler:
+    """Rate far above what the mock server serves, `max_in_flight` requests at once"""
+    return AdaptiveScheduler(rate=1e6, max_in_flight=max_in_flight)
+
+
+async def run(scraper:Scarper, tickers:list, batch_size:int) -> float:
+    start = time.perf_counter()
+    for i in range(0, len(tickers), batch_size):
+        await scraper.fetch_multiple_metadata(tickers[i:i + batch_size])
+    elapsed = time.perf_counter() - start
+    await scraper.close()
+    return len(tickers) / elapsed
+
+
+async def main(n_tickers:int, batch_size:int, latency:float, http2:bool):
+    tickers = [{"ticker": f"T{i:05d}"} for i in range(n_tickers)]
+    async with MockNasdaq(port=0, latency=latency) as server:
+        results = {}
+        for name, scraper in [
+            ("per-request client", PerRequestClientScarper(base_url=server.base_url,
+                                                           scheduler=scheduler(batch_size))),
+            ("shared client", Scarper(base_url=server.base_url, http2=http2, scheduler=scheduler(batch_size))),
+        ]:
+            server.connections = 0
+            rps = await run(scraper, tickers, batch_size)
+            results[name] = rps
+            print(f"{name:<20} {rps:10.1f} req/s  {server.connections:6d} connections")
+    speedup = results["shared client"] / results["per-request client"]
+    print(f"Speedup: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark shared vs per-request HTTP client")
+    parser.add_argument("--tickers", type=int, default=2000)
+    parser.add_argument("--batch_size", type=int, default=50, help="Tickers fetched at once, also the in-flight limit")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mock server latency per response")
+    parser.add_argument("--http2", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.tickers, args.batch_size, args.latency, args.http2))
@@ -0,0 +1,95 @@
+"""Rows/sec and memory per row of the Scarper parsers, from raw JSON to rows COPY takes as they are.
+
+Each parser runs twice: building the record types, and building the dicts with string
+keys the parsers used to, turned into tuples with `tuple(record.values())` for the
+insert like main.py did. Memory is the size of the row containers, the values they
+hold are the same either way. Run from the `nsdq_scarper` folder:
+    python -m benchmarks.bench_records --tickers 7000
+"""
+import argparse
+import contextlib
+import gc
+import io
+import sys
+import time
+import scarper
+from scarper import Scarper
+from benchmarks.bench_cleaning import payloads
+from benchmarks.mock_nasdaq import institutionals_payload
+
+# Records of the parsers of the dict days, holders came with the record types and reads fields by name
+RECORD_NAMES = ('InfoRecord', 'MetadataRecord', 'DividendRecord', 'InstitutionalRecord')
+
+
+def dict_builder(record:type):
+    """Builds the dict literal of the old parsers from the values given to `record`"""
+    items = ', '.join(f'{col!r}: values[{i}]' for i, col in enumerate(record.columns))
+    return eval(f'lambda values: {{{items}}}')
+
+
+@contextlib.contextmanager
+def dict_parsers():
+    """Scarper parsers building dicts instead of records, as before the record types"""
+    saved = {name: getattr(scarper, name) for name in RECORD_NAMES}
+    for name, record in saved.items():
+        setattr(scarper, name, dict_builder(record))
+    try:
+        yield
+    finally:
+        for name, record in saved.items():
+            setattr(scarper, name, record)
+
+
+def record_rows(scraper:Scarper, dataset:str, items:list) -> list:
+    return [row for ticker, data in items for row in scraper.parse(dataset, ticker, data)]
+
+
+def dict_rows(scraper:Scarper, dataset:str, items:list) -> list:
+    """The dicts of the old parsers, and the tuples they were turned into for the insert"""
+    dicts = []
+    for ticker, data in items:
+        parsed = scraper.parse(dataset, ticker, data)
+        dicts.extend([parsed] if isinstance(parsed, dict) else parsed)
+    return dicts, [tuple(record.values()) for record in dicts]
+
+
+def best_of(repeat:int, parse, *args):
+    """Result and best time of `repeat` runs of `parse`"""
+    elapsed = float('inf')
+    for _ in range(repeat):
+        result = None
+        gc.collect()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = parse(*args)
+            elapsed = min(elapsed, time.perf_counter() - start)
+    return result, elapsed
+
+
+def main(n_tickers:int, repeat:int=3):
+    scraper = Scarper()
+    for dataset in ('info', 'metadata', 'dividends', 'institutionals', 'holders'):
+        if dataset == 'holders':
+            # One full page of 100 holders per ticker
+            items = [(f'T{i:05d}', institutionals_payload(f'T{i:05d}', 100)) for i in range(n_tickers)]
+        else:
+            items = payloads(dataset, n_tickers)
+        rows, elapsed = best_of(repeat, record_rows, scraper, dataset, items)
+        record_bytes = sum(sys.getsizeof(row) for row in rows) / len(rows)
+        line = f"{dataset:<15} {len(rows):8d} rows  records {len(rows) / elapsed:10.0f} rows/s {record_bytes:5.0f} B/row"
+        if dataset != 'holders':
+            with dict_parsers():
+                (dicts, tuples), dict_elapsed = best_of(repeat, dict_rows, scraper, dataset, items)
+            assert tuples == [tuple(row) for row in rows], dataset
+            dict_bytes = sum(sys.getsizeof(row) for row in dicts) / len(dicts)
+            line += (f"  dicts {len(rows) / dict_elapsed:10.0f} rows/s {dict_bytes:5.0f} B/row"
+                     f"  ({dict_elapsed / elapsed:.2f}x)")
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the parsers' record types")
+    parser.add_argument("--tickers", type=int, default=7000)
+    parser.add_argument("--repeat", type=int, default=3, help="Best of this many runs")
+    args = parser.parse_args()
+    main(args.tickers, args.repeat)
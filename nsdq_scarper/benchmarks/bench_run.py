@@ -0,0 +1,93 @@
+"""Cold start and wall time of chained `main.py` invocations vs one `main.py run` of the same actions.
+
+Cold start is the best of a few `import main` in a fresh interpreter. The actions
+then run against the mock API, once as a process each and once as steps of `run`,
+sharing its HTTP client and DB pool. Postgres as in `bench_e2e`, or `--sink parquet`
+needs none. Run from the `nsdq_scarper` folder:
+    python -m benchmarks.bench_run --tickers 1000
+    python -m benchmarks.bench_run --tickers 1000 --sink parquet
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.bench_e2e import HERE, drop_database, fresh_database, mock_api, temp_postgres, write_symbols
+
+ACTIONS = ('tickers', 'metadata', 'dividends', 'institutionals')
+
+
+def cold_start(repeat:int=5) -> float:
+    """Best seconds to start an interpreter and import main.py"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import main'], cwd=HERE, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(actions:list, base_url:str, target:list, symbols:str, args) -> float:
+    """Seconds of one `main.py` process running `actions`, 'run' if several"""
+    command = [sys.executable, 'main.py', *(['run', *actions] if len(actions) > 1 else actions),
+               '--base_url', base_url, '--tickers_csv', symbols, '--rate', str(args.rate),
+               '--max_in_flight', str(args.max_in_flight), '--batch_size', str(args.batch_size),
+               '--write_unchanged', *target]
+    start = time.perf_counter()
+    subprocess.run(command, cwd=HERE, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def bench(args, target:list, reset) -> None:
+    symbols = os.path.join(tempfile.mkdtemp(prefix='nsdq_bench_'), 'symbols.csv')
+    write_symbols(symbols, args.tickers)
+    print(f"cold start {cold_start() * 1000:.0f} ms")
+    with mock_api(args.latency, 0.0, 0.0) as base_url:
+        reset()
+        chained = [run([action], base_url, target, symbols, args) for action in args.actions]
+        reset()
+        single = run(args.actions, base_url, target, symbols, args)
+    print(f"chained    {sum(chained):7.2f}s  ({' + '.join(f'{s:.2f}' for s in chained)})")
+    print(f"run        {single:7.2f}s  ({sum(chained) / single:.2f}x)")
+    shutil.rmtree(os.path.dirname(symbols), ignore_errors=True)
+
+
+def main(args):
+    if args.sink == 'parquet':
+        lake = tempfile.mkdtemp(prefix='nsdq_bench_lake_')
+        bench(args, ['--sink', 'parquet', '--lake_dir', lake], lambda: shutil.rmtree(lake, ignore_errors=True))
+        shutil.rmtree(lake, ignore_errors=True)
+        return
+
+    def database(host, port):
+        name = 'nsdq_bench_run'
+        target = ['--db_host', host, '--db_port', str(port), '--db_name', name,
+                  '--db_user', args.user, '--db_password', args.password]
+        bench(args, target, lambda: asyncio.run(fresh_database(host, port, args.user, args.password, name)))
+        asyncio.run(drop_database(host, port, args.user, args.password, name))
+
+    if args.db_host:
+        database(args.db_host, args.db_port)
+    else:
+        with temp_postgres(args.pg_bin, args.user) as port:
+            database('127.0.0.1', port)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chained main.py invocations vs one 'run'")
+    parser.add_argument("--tickers", type=int, default=1000)
+    parser.add_argument("--actions", type=str, nargs="+", default=list(ACTIONS), choices=ACTIONS)
+    parser.add_argument("--latency", type=float, default=0.02, help="Mock API seconds per response")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Scraper starting requests per second")
+    parser.add_argument("--max_in_flight", type=int, default=50)
+    parser.add_argument("--batch_size", type=int, default=5000)
+    parser.add_argument("--sink", type=str, default="postgres", choices=["postgres", "parquet"])
+    parser.add_argument("--db_host", type=str, default=None, help="Existing Postgres instead of a throwaway cluster")
+    parser.add_argument("--db_port", type=int, default=5432)
+    parser.add_argument("--user", type=str, default="test")
+    parser.add_argument("--password", type=str, default="test")
+    parser.add_argument("--pg_bin", type=str, default=None, help="Folder of initdb/pg_ctl")
+    main(parser.parse_args())
@@ -0,0 +1,241 @@
+"""Local stand-in for api.nasdaq.com used by the benchmarks.
+
+Run from the `nsdq_scarper` folder:
+    python -m benchmarks.mock_nasdaq --port 8765
+"""
+import asyncio
+import argparse
+import json
+import random
+import re
+from urllib.parse import parse_qs, urlsplit
+
+
+ROUTES = [
+    (re.compile(r"^/api/+quote/(?P<ticker>[^/]+)/info"), "info"),
+    (re.compile(r"^/api/+quote/(?P<ticker>[^/]+)/summary"), "summary"),
+    (re.compile(r"^/api/+quote/(?P<ticker>[^/]+)/dividends"), "dividends"),
+    (re.compile(r"^/api/+company/(?P<ticker>[^/]+)/institutional-holdings"), "institutionals"),
+]
+
+REASONS = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+def info_payload(ticker:str) -> dict:
+    return {"data": {
+        "symbol": ticker,
+        "companyName": f"{ticker} Corp. Common Stock",
+        "stockType": "Common Stock",
+        "exchange": "NASDAQ-GS",
+        "assetClass": "STOCKS",
+        "isNasdaqListed": True,
+        "isNasdaq100": False,
+        "isHeld": False,
+    }}
+
+
+def summary_payload(ticker:str) -> dict:
+    def value(v):
+        return {"label": "", "value": v}
+    return {"data": {"symbol": ticker, "summaryData": {
+        "Exchange": value("NASDAQ-GS"),
+        "Sector": value("Technology"),
+        "Industry": value("Computer Software: Prepackaged Software"),
+        "OneYrTarget": value("$245.00"),
+        "TodayHighLow": value("$228.66/$224.21"),
+        "ShareVolume": value("40,233,521"),
+        "AverageVolume": value("47,382,910"),
+        "PreviousClose": value("$225.12"),
+        "FiftTwoWeekHighLow": value("$237.49/$164.08"),
+        "MarketCap": value("3,410,530,128,000"),
+        "PERatio": value(37.12),
+        "ForwardPE1Yr": value("33.87"),
+        "EarningsPerShare": value("$6.08"),
+        "AnnualizedDividend": value("$1.00"),
+        "ExDividendDate": value("Nov 8, 2024"),
+        "DividendPaymentDate": value("Nov 14, 2024"),
+        "Yield": value("0.44%"),
+        "SpecialDividendDate": value("N/A"),
+        "SpecialDividendAmount": value("N/A"),
+        "SpecialDividendPaymentDate": value("N/A"),
+    }}}
+
+
+def dividends_payload(ticker:str, rows:int=40) -> dict:
+    return {"data": {"dividends": {"rows": [{
+        "exOrEffDate": f"{(12 - i % 12):02d}/08/{2024 - i // 12}",
+        "type": "Cash",
+        "amount": "$0.25",
+        "declarationDate": f"{(12 - i % 12):02d}/01/{2024 - i // 12}",
+        "recordDate": f"{(12 - i % 12):02d}/09/{2024 - i // 12}",
+        "paymentDate": f"{(12 - i % 12):02d}/14/{2024 - i // 12}",
+        "currency": "USD",
+    } for i in range(rows)]}}}
+
+
+QUARTER_ENDS = ("12/31", "09/30", "06/30", "03/31")
+
+
+def holders_count(ticker:str) -> int:
+    """Holders of a ticker, from a few dozen to a few thousand"""
+    return 20 + sum(map(ord, ticker)) * 37 % 3000
+
+
+def holder_rows(ticker:str, limit:int, offset:int) -> list:
+    """Page of the holder list sorted by filing date, newest first"""
+    rows = []
+    for i in range(offset, min(offset + limit, holders_count(ticker))):
+        quarter = i // 400
+        rows.append({
+            "ownerName": f"HOLDER {i} CAPITAL LLC",
+            "date": f"{QUARTER_ENDS[quarter % 4]}/{2024 - quarter // 4}",
+            "sharesHeld": f"{(i + 1) * 1_234:,}",
+            "sharesChange": f"{(i % 7 - 3) * 1_000:,}",
+            "sharesChangePCT": f"{(i % 7 - 3) * 1.5:.2f}%",
+            "marketValue": f"${(i + 1) * 56_789:,}",
+        })
+    return rows
+
+
+def institutionals_payload(ticker:str, limit:int=10, offset:int=0) -> dict:
+    def row(positions, holders, shares):
+        return {"positions": positions, "holders": holders, "shares": shares}
+    return {"data": {
+        "ownershipSummary": {
+            "SharesOutstandingPCT": {"label": "", "value": "61.77%"},
+            "ShareoutstandingTotal": {"label": "", "value": "15,022"},
+            "TotalHoldingsValue": {"label": "", "value": "$2,010"},
+        },
+        "activePositions": {"rows": [
+            row("Increased Positions", "1,021", "123,456,789"),
+            row("Decreased Positions", "987", "98,765,432"),
+            row("Held Positions", "210", "4,567,890,123"),
+            row("Total Institutional Shares", "2,218", "4,790,112,344"),
+        ]},
+        "newSoldOutPositions": {"rows": [
+            row("New Positions", "88", "1,234,567"),
+            row("Sold Out Positions", "41", "765,432"),
+        ]},
+        "holdingsTransactions": {
+            "totalRecords": f"{holders_count(ticker):,}",
+            "table": {"rows": holder_rows(ticker, limit, offset)},
+        },
+    }}
+
+
+PAYLOADS = {
+    "info": info_payload,
+    "summary": summary_payload,
+    "dividends": dividends_payload,
+    "institutionals": institutionals_payload,
+}
+
+
+class MockNasdaq:
+    """Minimal HTTP/1.1 keep-alive server serving nasdaq-shaped payloads
+
+    Args:
+        latency (float): Seconds added before every response
+        error_rate (float): Fraction of requests answered with a 500
+        rate_429 (float): Fraction of requests answered with a 429
+    """
+    def __init__(self, host:str="127.0.0.1", port:int=8765, latency:float=0.0,
+                 error_rate:float=0.0, rate_429:float=0.0, seed:int=0) -> None:
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.connections = 0
+        self.server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/api/"
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def route(self, path:str):
+        roll = self.random.random()
+        if roll < self.rate_429:
+            return 429, {"message": "rate limited"}
+        if roll < self.rate_429 + self.error_rate:
+            return 500, {"message": "server error"}
+        url = urlsplit(path)
+        for pattern, name in ROUTES:
+            match = pattern.match(url.path)
+            if match:
+                if name == "institutionals":
+                    query = parse_qs(url.query)
+                    return 200, institutionals_payload(match.group("ticker"), int(query.get("limit", ["10"])[0]),
+                                                       int(query.get("offset", ["0"])[0]))
+                return 200, PAYLOADS[name](match.group("ticker"))
+        return 404, {"data": None}
+
+    async def handle(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                keep_alive = True
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    if header.lower().startswith(b"connection:") and b"close" in header.lower():
+                        keep_alive = False
+                self.requests += 1
+                path = request_line.split(b" ")[1].decode()
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                status, payload = self.route(path)
+                body = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(args):
+    server = MockNasdaq(args.host, args.port, args.latency, args.error_rate, args.rate_429)
+    await server.start()
+    print(f"Mock nasdaq listening on {server.base_url}")
+    async with server.server:
+        await server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for api.nasdaq.com")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of latency per response")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of 500 responses")
+    parser.add_argument("--rate_429", type=float, default=0.0, help="Fraction of 429 responses")
+    asyncio.run(serve(parser.parse_args()))
@@ -0,0 +1,222 @@
+from typing import Iterable, List
+from database import Database
+from ledger import Ledger
+from change_detection import ChangeDetector
+from records import DividendRecord, HolderRecord, InfoRecord, InstitutionalRecord, MetadataRecord
+
+
+# Insert columns and conflict clause per target table, staging tables are `staging_<table>`.
+# Columns are those of the table's record type, the order parsers build rows in
+TABLES = {
+    'tickers': {
+        'columns': InfoRecord.columns,
+        'on_conflict': 'ON CONFLICT (ticker) DO NOTHING',
+    },
+    'dividends': {
+        'columns': DividendRecord.columns,
+        'on_conflict': 'ON CONFLICT (ticker, ex_date, payment_type, amount) DO NOTHING',
+    },
+    'metadata': {
+        'columns': MetadataRecord.columns,
+        'on_conflict': '',
+    },
+    'institutional_holdings': {
+        'columns': InstitutionalRecord.columns,
+        'on_conflict': '',
+    },
+    'institutional_holders': {
+        'columns': HolderRecord.columns,
+        'on_conflict': 'ON CONFLICT ON CONSTRAINT unique_ticker_holder_date DO NOTHING',
+    },
+}
+
+
+def row_size(row:tuple) -> int:
+    """Rough wire size of a row, strings by length and everything else as 8 bytes"""
+    return sum(len(val) if isinstance(val, str) else 8 for val in row)
+
+
+class BulkWriter:
+    """Buffers rows and writes them with binary COPY into a temporary staging table,
+    then merges into the real table with one `INSERT ... SELECT ... ON CONFLICT`.
+
+    Args:
+        db (Database): Database with an open pool
+        table (str): Target table, one of TABLES
+        columns (tuple): Override the insert columns, e.g. to also load `inserted`
+        max_rows (int): Flush once this many rows are buffered
+        max_bytes (int): Flush once the buffered rows reach this size
+        ledger (Ledger): Marks tickers done in the same transaction as their rows
+        changes (ChangeDetector): Skips tickers whose rows did not change since the last write
+        on_conflict (str): Override the table's conflict clause, e.g. to update existing rows
+    """
+    def __init__(self, db:Database, table:str, columns:tuple=None,
+                 max_rows:int=5000, max_bytes:int=8 * 1024 * 1024, ledger:Ledger=None,
+                 changes:ChangeDetector=None, on_conflict:str=None) -> None:
+        self.db = db
+        self.table = table
+        self.columns = columns or TABLES[table]['columns']
+        self.on_conflict = TABLES[table]['on_conflict'] if on_conflict is None else on_conflict
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.ledger = ledger
+        self.changes = changes
+        self.done: List[str] = []
+        self.failed = 0
+        self.skipped = 0
+        self.rows: List[tuple] = []
+        self.bytes = 0
+        self.written = 0
+        self.merged = 0
+
+    async def add(self, row:tuple):
+        """Buffer one row, flushing if a threshold is reached"""
+        self.rows.append(row)
+        self.bytes += row_size(row)
+        if len(self.rows) >= self.max_rows or self.bytes >= self.max_bytes:
+            await self.flush()
+
+    async def add_many(self, rows:Iterable[tuple]):
+        for row in rows:
+            await self.add(row)
+
+    async def add_ticker(self, ticker:str, rows:list):
+        """Buffer all rows of a ticker, unless they are unchanged since the last write
+
+        A ticker without rows has nothing to write and keeps its last fingerprint, like in MultiWriter.
+        """
+        if not rows:
+            pass
+        elif self.changes and not self.changes.changed(ticker, rows):
+            self.skipped += 1
+        else:
+            await self.add_many(rows)
+        self.ticker_done(ticker)
+
+    def ticker_done(self, ticker:str):
+        """All rows of `ticker` were added, it is marked done with the next flush"""
+        if self.ledger:
+            self.done.append(ticker)
+
+    async def ticker_failed(self, ticker:str, error:str, kind:str=None):
+        self.failed += 1
+        if self.ledger:
+            await self.ledger.fail(ticker, error, kind)
+
+    async def flush(self) -> int:
+        """COPY buffered rows into staging and merge them, returns rows merged"""
+        if not self.rows and not self.done and not (self.changes and self.changes.pending):
+            return 0
+        rows, self.rows, self.bytes = self.rows, [], 0
+        statements = []
+        if self.done:
+            statements.append(self.ledger.done_statement(self.done))
+            self.done = []
+        if self.changes and (statement := self.changes.statement()):
+            statements.append(statement)
+        merged = await self.db.copy_merge(self.table, self.columns, rows, self.on_conflict, statements)
+        self.written += len(rows)
+        self.merged += merged
+        return merged
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.flush()
+
+
+class MultiWriter:
+    """BulkWriter for several tables, every flush merges all of them in one transaction
+
+    Rows come as `(table, row)` pairs. A `(None, error)` pair marks a part of the
+    ticker that failed: rows of the other tables are still written and the ticker
+    is marked failed, so it is retried.
+
+    Args:
+        db (Database): Database with an open pool
+        tables (tuple): Target tables, merged in this order (referenced tables first)
+        max_rows (int): Flush once this many rows are buffered over all tables
+        max_bytes (int): Flush once the buffered rows reach this size
+        ledger (Ledger): Marks tickers done in the same transaction as their rows
+        changes (dict): ChangeDetector per table, skipping unchanged records of that table
+    """
+    def __init__(self, db:Database, tables:tuple, max_rows:int=5000, max_bytes:int=8 * 1024 * 1024,
+                 ledger:Ledger=None, changes:dict=None) -> None:
+        self.db = db
+        self.tables = tables
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.ledger = ledger
+        self.changes = changes or {}
+        self.done: List[str] = []
+        self.failed = 0
+        self.rows = {table: [] for table in tables}
+        self.n_rows = 0
+        self.bytes = 0
+        self.skipped = dict.fromkeys(tables, 0)
+        self.written = dict.fromkeys(tables, 0)
+        self.merged = dict.fromkeys(tables, 0)
+
+    async def add_ticker(self, ticker:str, rows:list):
+        """Buffer the `(table, row)` pairs of a ticker, flushing if a threshold is reached"""
+        by_table, errors = {}, []
+        for table, row in rows:
+            if table is None:
+                errors.append(row)
+            else:
+                by_table.setdefault(table, []).append(row)
+        for table, table_rows in by_table.items():
+            changes = self.changes.get(table)
+            if changes and not changes.changed(ticker, table_rows):
+                self.skipped[table] += 1
+                continue
+            self.rows[table].extend(table_rows)
+            self.n_rows += len(table_rows)
+            self.bytes += sum(row_size(row) for row in table_rows)
+        if errors:
+            await self.ticker_failed(ticker, '; '.join(str(e) for e in errors),
+                                     getattr(errors[0], 'kind', 'parse'))
+        else:
+            self.ticker_done(ticker)
+        if self.n_rows >= self.max_rows or self.bytes >= self.max_bytes:
+            await self.flush()
+
+    def ticker_done(self, ticker:str):
+        if self.ledger:
+            self.done.append(ticker)
+
+    async def ticker_failed(self, ticker:str, error:str, kind:str=None):
+        self.failed += 1
+        if self.ledger:
+            await self.ledger.fail(ticker, error, kind)
+
+    async def flush(self) -> dict:
+        """COPY and merge the buffered rows of every table in one transaction, returns rows merged per table"""
+        if not self.n_rows and not self.done and not any(changes.pending for changes in self.changes.values()):
+            return {}
+        batches = [(table, TABLES[table]['columns'], self.rows[table], TABLES[table]['on_conflict'])
+                   for table in self.tables if self.rows[table]]
+        for table, _, rows, _ in batches:
+            self.written[table] += len(rows)
+        self.rows = {table: [] for table in self.tables}
+        self.n_rows = self.bytes = 0
+        statements = []
+        if self.done:
+            statements.append(self.ledger.done_statement(self.done))
+            self.done = []
+        for changes in self.changes.values():
+            if statement := changes.statement():
+                statements.append(statement)
+        merged = await self.db.copy_merge_many(batches, statements)
+        for table, n in merged.items():
+            self.merged[table] += n
+        return merged
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.flush()
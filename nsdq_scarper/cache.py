@@ -0,0 +1,103 @@
+import hashlib
+import os
+import time
+import zlib
+
+
+class ResponseCache:
+    """On-disk cache of raw JSON responses, keyed by a hash of the url
+
+    Bodies are zlib compressed under `directory/<aa>/<hash>.z`. The file mtime is
+    the fetch time used for the TTL, the atime is bumped on every hit and drives
+    LRU eviction once the cache grows past `max_bytes`.
+
+    Args:
+        directory (str): Cache folder
+        ttl (dict): Seconds a response stays fresh per dataset, see DEFAULT_TTL
+        max_bytes (int): Size over which the least recently used entries are evicted
+        replay (bool): Serve everything from cache regardless of age, never hit the network
+    """
+    DEFAULT_TTL = {
+        'info': 7 * 24 * 3600,
+        'metadata': 3600,
+        'dividends': 24 * 3600,
+        'institutionals': 7 * 24 * 3600,
+        'holders': 24 * 3600,
+    }
+
+    def __init__(self, directory:str='.cache/responses', ttl:dict=None,
+                 max_bytes:int=1024 ** 3, replay:bool=False) -> None:
+        self.directory = directory
+        self.ttl = {**self.DEFAULT_TTL, **(ttl or {})}
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+
+    def path(self, url:str) -> str:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], f'{key}.z')
+
+    def get(self, url:str, dataset:str=None) -> bytes:
+        """Raw body of a fresh cached response, None if missing or expired"""
+        path = self.path(url)
+        try:
+            stat = os.stat(path)
+            if not self.replay and time.time() - stat.st_mtime > self.ttl.get(dataset, 0):
+                self.misses += 1
+                return None
+            with open(path, 'rb') as f:
+                body = zlib.decompress(f.read())
+            os.utime(path, (time.time(), stat.st_mtime))
+        except (FileNotFoundError, zlib.error):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return body
+
+    def put(self, url:str, body:bytes):
+        path = self.path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = zlib.compress(body)
+        try:
+            previous = os.path.getsize(path)
+        except FileNotFoundError:
+            previous = 0
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._size = self.size() + len(data) - previous
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.z'):
+                    yield os.path.join(root, name)
+
+    def size(self) -> int:
+        """Total bytes on disk, scanned once then kept up to date"""
+        if self._size is None:
+            self._size = sum(os.path.getsize(path) for path in self._entries())
+        return self._size
+
+    def evict(self, target:float=0.9):
+        """Remove least recently used entries until the cache is under `target` * max_bytes"""
+        entries = []
+        for path in self._entries():
+            stat = os.stat(path)
+            entries.append((stat.st_atime, stat.st_size, path))
+        entries.sort()
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_bytes * target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        self._size = size
@@ -0,0 +1,55 @@
+import hashlib
+from typing import Iterable
+from database import Database
+
+
+def fingerprint(rows:Iterable[tuple]) -> int:
+    """64-bit fingerprint of the cleaned rows of one ticker, stored as a BIGINT"""
+    digest = hashlib.blake2b(repr(list(rows)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+class ChangeDetector:
+    """Skips records identical to the last ones written for a ticker
+
+    The last fingerprint per (dataset, ticker) lives in the `fingerprints` table.
+    New fingerprints are saved in the same transaction as their rows, see `statement`.
+
+    Args:
+        db (Database): Database with an open pool
+        dataset (str): Table the rows go to
+    """
+    def __init__(self, db:Database, dataset:str) -> None:
+        self.db = db
+        self.dataset = dataset
+        self.known = {}
+        self.pending = {}
+
+    async def load(self, tickers:list=None):
+        """Load stored fingerprints, of `tickers` only or of the whole dataset"""
+        rows = await self.db.fetch(
+            """SELECT ticker, fingerprint FROM fingerprints
+               WHERE dataset = $1 AND ($2::text[] IS NULL OR ticker = ANY($2::text[]))""",
+            self.dataset, tickers)
+        self.known.update((row['ticker'], row['fingerprint']) for row in rows or [])
+
+    def changed(self, ticker:str, rows:list) -> bool:
+        """True if `rows` differ from the last ones written, the new fingerprint is then pending"""
+        value = fingerprint(rows)
+        if self.known.get(ticker) == value:
+            return False
+        self.known[ticker] = value
+        self.pending[ticker] = value
+        return True
+
+    def statement(self) -> tuple:
+        """`(query, *args)` upserting the pending fingerprints, None if there are none"""
+        if not self.pending:
+            return None
+        tickers, values = list(self.pending), list(self.pending.values())
+        self.pending = {}
+        return ("""INSERT INTO fingerprints (dataset, ticker, fingerprint)
+                   SELECT $1, unnest($2::text[]), unnest($3::bigint[])
+                   ON CONFLICT (dataset, ticker)
+                   DO UPDATE SET fingerprint = EXCLUDED.fingerprint, updated = CURRENT_TIMESTAMP""",
+                self.dataset, tickers, values)
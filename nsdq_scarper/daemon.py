@@ -0,0 +1,135 @@
+import asyncio
+import heapq
+import time
+from typing import List, Tuple
+from database import Database
+from pipeline import ACTIONS, SNAPSHOT_TABLES, scrape_tickers
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Seconds after which a dataset of a ticker is due for a refresh
+INTERVALS = {
+    'metadata': HOUR,
+    'dividends': 7 * DAY,
+    'institutionals': 90 * DAY,
+}
+# Dividends of a ticker whose latest metadata has an ex-dividend date within
+# DIVIDENDS_NEAR days, before or after today, are refreshed every DIVIDENDS_NEAR_INTERVAL
+DIVIDENDS_NEAR = 3
+DIVIDENDS_NEAR_INTERVAL = 12 * HOUR
+# A failed refresh waits RETRY_BASE * 2^failures seconds, at most the dataset interval
+RETRY_BASE = 300
+
+# Staleness is the age of the last refresh in intervals, >= 1 means due
+STALENESS_QUERY = """
+SELECT t.ticker, EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - COALESCE(f.refreshed, 'epoch')) / {interval} AS staleness
+FROM tickers t
+LEFT JOIN freshness f ON f.dataset = $1 AND f.ticker = t.ticker
+{join}
+WHERE t.delisted IS NULL AND (f.retry_after IS NULL OR f.retry_after < CURRENT_TIMESTAMP)
+ORDER BY staleness DESC
+LIMIT $3
+"""
+DIVIDENDS_JOIN = "LEFT JOIN latest_metadata m ON m.ticker = t.ticker"
+DIVIDENDS_INTERVAL = """(CASE WHEN m.ex_dividend_date BETWEEN CURRENT_DATE - $4::int AND CURRENT_DATE + $4::int
+                      THEN $5::float8 ELSE $2::float8 END)"""
+
+
+class Freshness:
+    """Last refresh per (dataset, ticker) in the `freshness` table
+
+    Used in place of a `Ledger` by the writer: refreshed tickers are stamped in
+    the transaction writing their rows, failed ones are pushed back with backoff.
+
+    Args:
+        db (Database): Database with an open pool
+        dataset (str): Action name, one of INTERVALS
+        interval (float): Refresh interval of the dataset, caps the retry backoff
+    """
+    def __init__(self, db:Database, dataset:str, interval:float) -> None:
+        self.db = db
+        self.dataset = dataset
+        self.interval = interval
+
+    def done_statement(self, tickers:list) -> tuple:
+        """`(query, *args)` stamping tickers refreshed, run in the transaction writing their rows"""
+        return ("""INSERT INTO freshness (dataset, ticker, refreshed)
+                   SELECT $1, ticker, CURRENT_TIMESTAMP FROM unnest($2::text[]) AS ticker
+                   ON CONFLICT (dataset, ticker) DO UPDATE SET refreshed = EXCLUDED.refreshed,
+                       failures = 0, retry_after = NULL, last_error = NULL, error_kind = NULL""",
+                self.dataset, tickers)
+
+    async def fail(self, ticker:str, error:str, kind:str=None):
+        await self.db.execute(
+            """INSERT INTO freshness AS f (dataset, ticker, failures, retry_after, last_error, error_kind)
+               VALUES ($1, $2, 1, CURRENT_TIMESTAMP + $3::float8 * INTERVAL '1 second', $5, $6)
+               ON CONFLICT (dataset, ticker) DO UPDATE SET failures = f.failures + 1,
+                   retry_after = CURRENT_TIMESTAMP + LEAST($3::float8 * 2 ^ f.failures, $4::float8) * INTERVAL '1 second',
+                   last_error = EXCLUDED.last_error, error_kind = EXCLUDED.error_kind""",
+            self.dataset, ticker, float(RETRY_BASE), float(self.interval), error, kind)
+
+
+async def due(db:Database, dataset:str, interval:float, limit:int) -> List[Tuple[float, str, str]]:
+    """Up to `limit` most stale due tickers of a dataset as (staleness, dataset, ticker)"""
+    args = [dataset, float(interval), limit]
+    if dataset == 'dividends':
+        query = STALENESS_QUERY.format(interval=DIVIDENDS_INTERVAL, join=DIVIDENDS_JOIN)
+        args += [DIVIDENDS_NEAR, float(DIVIDENDS_NEAR_INTERVAL)]
+    else:
+        query = STALENESS_QUERY.format(interval='$2::float8', join='')
+    rows = await db.fetch(query, *args) or []
+    return [(float(row['staleness']), dataset, row['ticker']) for row in rows if row['staleness'] >= 1]
+
+
+async def plan(db:Database, budget:int, intervals:dict=None) -> dict:
+    """Pick the `budget` most stale (ticker, dataset) refreshes across datasets
+
+    Returns:
+        dict: Tickers to refresh per dataset, most stale first
+    """
+    intervals = intervals or INTERVALS
+    queue = []
+    for dataset, interval in intervals.items():
+        queue.extend(await due(db, dataset, interval, budget))
+    picked = {}
+    for _, dataset, ticker in heapq.nlargest(budget, queue):
+        picked.setdefault(dataset, []).append(ticker)
+    return picked
+
+
+async def run_daemon(db:Database, scraper, budget:int=600, cycle:float=HOUR, intervals:dict=None,
+                     batch_size:int=1000, skip_unchanged:bool=True, engine:str='python', cycles:int=None,
+                     incremental:bool=True):
+    """Keep every dataset fresh spending at most `budget` requests per `cycle` seconds
+
+    Each cycle refreshes the most stale (ticker, dataset) pairs first, staleness being
+    the time since the last refresh divided by the dataset interval, see INTERVALS.
+
+    Args:
+        budget (int): Requests per cycle
+        cycle (float): Seconds per cycle, a cycle taking longer starts the next one right away
+        intervals (dict): Refresh interval per dataset, defaults to INTERVALS
+        skip_unchanged (bool): Do not write snapshot records identical to the last ones
+        engine (str): 'python' or 'vector' record cleaning
+        cycles (int): Stop after this many cycles, None runs forever
+        incremental (bool): Write only dividends past the latest stored ex_date of a ticker
+    """
+    intervals = {**INTERVALS, **(intervals or {})}
+    done = 0
+    while cycles is None or done < cycles:
+        started = time.monotonic()
+        # A run per cycle, readers of `Database.latest` drop their cache when it changes
+        run_id = await db.fetchone("INSERT INTO runs (action) VALUES ('daemon') RETURNING id")
+        picked = await plan(db, budget, intervals)
+        for action, tickers in picked.items():
+            dataset, table = ACTIONS[action]
+            freshness = Freshness(db, action, intervals[action])
+            await scrape_tickers(db, scraper, dataset, table, tickers, batch_size, freshness,
+                                 skip_unchanged and table in SNAPSHOT_TABLES, engine, incremental=incremental)
+        await db.execute("UPDATE runs SET status = 'finished', finished = CURRENT_TIMESTAMP WHERE id = $1", run_id)
+        refreshed = ', '.join(f"{len(tickers)} {dataset}" for dataset, tickers in picked.items())
+        print(f"Cycle {done + 1}: refreshed {refreshed or 'nothing, all fresh'}")
+        done += 1
+        if cycles is None or done < cycles:
+            await asyncio.sleep(max(0.0, cycle - (time.monotonic() - started)))
@@ -1,17 +1,49 @@
+from collections import OrderedDict
 from typing import List
 import asyncpg
 import asyncio
 import os
+import time
+from metrics import registry
+
+
+def latest_upsert(table, columns, where=''):
+    """Upsert the newest staged row per ticker into the latest table of `table`, run before truncating staging"""
+    latest = LATEST_TABLES[table]
+    columns = tuple(columns) + (() if 'inserted' in columns else ('inserted',))
+    cols = ', '.join(columns)
+    updates = ', '.join(f'{col} = EXCLUDED.{col}' for col in columns if col != 'ticker')
+    # Older rows, e.g. loaded history, never replace a newer snapshot
+    return f"""INSERT INTO {latest} ({cols})
+               SELECT DISTINCT ON (ticker) {cols} FROM staging_{table} {where} ORDER BY ticker, inserted DESC
+               ON CONFLICT (ticker) DO UPDATE SET {updates} WHERE {latest}.inserted <= EXCLUDED.inserted"""
+
+
+async def insert_prepared(conn, query) -> int:
+    """Run an INSERT through the statement cache of the connection, returns rows inserted
+
+    asyncpg prepares a statement that returns rows once per connection and reuses it by
+    query text, a plain `execute` sends the text to be parsed again every flush.
+    """
+    return await conn.fetchval(f"WITH inserted AS ({query} RETURNING 1) SELECT count(*) FROM inserted")
 
 
 class Database:
-    def __init__(self, host, user, password, database, port=5432) -> None:
+    def __init__(self, host, user, password, database, port=5432, cache_size=20000, run_ttl=5.0) -> None:
         self.host = host
         self.user = user
         self.password = password
         self.database = database
         self.port = port
         self.pool = None
+        self.metrics = registry
+        # LRU of latest snapshot rows by (table, ticker), cleared when the run id changes
+        self.cache_size = cache_size
+        self.latest_cache = OrderedDict()
+        self.latest_run = None
+        # Seconds the latest run id is trusted before `latest` reads it again
+        self.run_ttl = run_ttl
+        self.run_checked = float('-inf')
 
     
     async def create_pool(self):
@@ -31,7 +63,7 @@ class Database:
     async def create_database(self):
         """Create the database if it does not exist"""
         # Connect to the default 'postgres' database first to create the new one
-        connection = await asyncpg.connect(user=self.user, password=self.password, database="postgres", host="127.0.0.1")
+        connection = await asyncpg.connect(user=self.user, password=self.password, database="postgres", host=self.host, port=self.port)
         try:
             await connection.execute(f"CREATE DATABASE {self.database};")
             print(f"Database {self.database} created successfully.")
@@ -76,6 +108,153 @@ class Database:
             return await conn.executemany(query, *args)
         
         
+    async def copy_records(self, table, columns, records):
+        """Binary COPY records straight into a table."""
+        async with self.pool.acquire() as conn:
+            return await conn.copy_records_to_table(table, records=records, columns=columns)
+
+    async def copy_merge(self, table, columns, records, on_conflict='', statements=(), where=''):
+        """Binary COPY records into a temporary `staging_<table>` and merge them into `table` in one statement.
+
+        `statements` are extra `(query, *args)` run in the same transaction, e.g. ledger updates.
+        `where` filters the staged rows merged, e.g. a semi-join on `tickers`.
+
+        Returns:
+            int: Rows inserted into `table`
+        """
+        merged = await self.copy_merge_many([(table, columns, records, on_conflict, where)], statements)
+        return merged[table]
+
+    async def copy_merge_many(self, batches, statements=()):
+        """`copy_merge` of several tables in one transaction.
+
+        `batches` are `(table, columns, records, on_conflict[, where])`, merged in the given order
+        so referenced tables (tickers) go first. Callers keep the same order to avoid deadlocks.
+
+        Returns:
+            dict: Rows inserted per table
+        """
+        merged = {}
+        start = time.perf_counter()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                for table, columns, records, on_conflict, *where in batches:
+                    where = where[0] if where else ''
+                    merged[table] = 0
+                    if not records:
+                        continue
+                    staging = f'staging_{table}'
+                    cols = ', '.join(columns)
+                    # Temporary copy of the staging table per connection, flushes of other
+                    # connections and processes run in parallel. It shadows `public.staging_<table>`
+                    # in the search path, so merges and `where` clauses name it as usual.
+                    await conn.execute(
+                        f'CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE public.{staging} INCLUDING DEFAULTS) '
+                        'ON COMMIT DELETE ROWS')
+                    await conn.copy_records_to_table(staging, records=records, columns=columns)
+                    if table in LATEST_TABLES:
+                        # Before the merge, `where` may exclude rows already in `table`
+                        await insert_prepared(conn, latest_upsert(table, columns, where))
+                    merged[table] = await insert_prepared(
+                        conn, f'INSERT INTO {table} ({cols}) SELECT {cols} FROM {staging} {where} {on_conflict}')
+                    await conn.execute(f'TRUNCATE {staging}')
+                for query, *args in statements:
+                    await conn.execute(query, *args)
+        self.metrics.observe('nsdq_db_flush_seconds', time.perf_counter() - start)
+        for table, columns, records, *_ in batches:
+            self.metrics.inc('nsdq_db_rows_total', len(records), table=table)
+            self.metrics.inc('nsdq_db_merged_rows_total', merged[table], table=table)
+            if table in LATEST_TABLES and records:
+                ticker = list(columns).index('ticker')
+                self.evict_latest(table, {row[ticker] for row in records})
+        return merged
+
+    async def refresh_latest(self, tables=None):
+        """Rebuild latest tables from the full history, e.g. after creating them on an existing database.
+
+        Flushes keep them up to date afterwards, see `latest_upsert`.
+        """
+        for table in tables or LATEST_TABLES:
+            latest = LATEST_TABLES[table]
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    columns = await conn.fetch(
+                        """SELECT column_name FROM information_schema.columns
+                           WHERE table_schema = 'public' AND table_name = $1 ORDER BY ordinal_position""", latest)
+                    cols = ', '.join(row['column_name'] for row in columns)
+                    await conn.execute(f'TRUNCATE {latest}')
+                    status = await conn.execute(
+                        f"""INSERT INTO {latest} ({cols})
+                            SELECT DISTINCT ON (ticker) {cols} FROM {table} ORDER BY ticker, inserted DESC, id DESC""")
+            print(f"Refreshed {latest}: {status.split()[-1]} tickers")
+        self.latest_cache.clear()
+
+    def evict_latest(self, table, tickers):
+        """Drop cached latest rows of `tickers`, they were just written"""
+        self.latest_cache.pop((table, None), None)
+        for ticker in tickers:
+            self.latest_cache.pop((table, ticker), None)
+
+    def _cache_latest(self, key, value):
+        self.latest_cache[key] = value
+        self.latest_cache.move_to_end(key)
+        while len(self.latest_cache) > self.cache_size:
+            self.latest_cache.popitem(last=False)
+
+    async def latest(self, table, tickers=None, run_id=None):
+        """Latest snapshot per ticker of `metadata` or `institutional_holdings`.
+
+        Reads the latest tables, so the cost grows with the tickers asked for and not with
+        the history. Rows are served from an in-process LRU cache, cleared whenever the
+        run id changes: a new scrape, daemon cycle or worker run means new snapshots.
+        Without `run_id` the latest one is read at most once per `run_ttl` seconds, so a
+        cache hit costs no round trip. Flushes of this process evict the tickers they write right away.
+
+        Args:
+            table (str): Snapshot table, one of LATEST_TABLES
+            tickers (list): Tickers to look up, None for every ticker
+            run_id (int): Run the data should be as fresh as, defaults to the latest one in `runs`
+
+        Returns:
+            dict: Row per ticker, tickers without a snapshot are left out
+        """
+        latest = LATEST_TABLES[table]
+        if run_id is None:
+            if time.monotonic() - self.run_checked < self.run_ttl:
+                run_id = self.latest_run
+            else:
+                run_id = await self.fetchone("SELECT MAX(id) FROM runs")
+                self.run_checked = time.monotonic()
+        if run_id != self.latest_run:
+            self.latest_cache.clear()
+            self.latest_run = run_id
+        if tickers is None:
+            key = (table, None)
+            if key not in self.latest_cache:
+                rows = await self.fetch(f"SELECT * FROM {latest}") or []
+                self._cache_latest(key, {row['ticker']: row for row in rows})
+            self.latest_cache.move_to_end(key)
+            return self.latest_cache[key]
+        found, missing = {}, []
+        for ticker in tickers:
+            key = (table, ticker)
+            if key in self.latest_cache:
+                self.latest_cache.move_to_end(key)
+                if self.latest_cache[key] is not None:
+                    found[ticker] = self.latest_cache[key]
+            else:
+                missing.append(ticker)
+        if missing:
+            rows = await self.fetch(f"SELECT * FROM {latest} WHERE ticker = ANY($1::text[])", missing) or []
+            rows = {row['ticker']: row for row in rows}
+            for ticker in missing:
+                # Tickers without a snapshot are cached too, as None
+                self._cache_latest((table, ticker), rows.get(ticker))
+            found.update(rows)
+        self.metrics.inc('nsdq_latest_cache_hits_total', len(tickers) - len(missing), table=table)
+        self.metrics.inc('nsdq_latest_cache_misses_total', len(missing), table=table)
+        return found
+
     async def fetch(self, query, *args):
         """Execute a query and return results."""
         async with self.pool.acquire() as conn:
@@ -84,6 +263,11 @@ class Database:
                 return [dict(record) for record in records]
             return None
  
+    async def fetch_values(self, query, *args) -> list:
+        """First column of the results as a list, e.g. tickers for the scraper"""
+        async with self.pool.acquire() as conn:
+            return [record[0] for record in await conn.fetch(query, *args)]
+
     async def fetchone(self, query, *args):
         """Execute a query and return one result."""
         async with self.pool.acquire() as conn:
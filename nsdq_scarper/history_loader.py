@@ -0,0 +1,177 @@
+import glob
+import os
+from typing import Dict, Iterator, List, Union
+import polars as pl
+from bulk_writer import TABLES
+from database import Database
+from partitions import PARTITIONED, ensure_partitions
+
+# Postgres column types to the polars types csv strings are cast to
+PG_TYPES = {
+    'bigint': pl.Int64,
+    'integer': pl.Int32,
+    'text': pl.String,
+    'boolean': pl.Boolean,
+    'date': pl.Date,
+    'timestamp without time zone': pl.Datetime('us'),
+}
+# Staged rows go in only for known tickers (semi-join) and snapshots not loaded yet (anti-join),
+# so loading the same files twice is a no-op
+HISTORY_FILTER = """WHERE ticker IN (SELECT ticker FROM tickers)
+    AND NOT EXISTS (SELECT 1 FROM {table} h
+                    WHERE h.ticker = staging_{table}.ticker AND h.inserted = staging_{table}.inserted)"""
+
+
+def normalize(name:str) -> str:
+    """Column name key matching csv `sharesOutstandingPCT` to table `shares_outstanding_pct`"""
+    return name.replace('_', '').lower()
+
+
+def expand(paths:Union[str, List[str]]) -> List[str]:
+    """Files of paths and glob patterns, sorted and without duplicates"""
+    files = []
+    for path in [paths] if isinstance(paths, str) else paths:
+        matches = sorted(glob.glob(path)) if glob.has_magic(path) else [path]
+        files.extend(f for f in matches if f not in files)
+    if not files:
+        raise FileNotFoundError(f"No file matches {paths}")
+    return files
+
+
+async def column_types(db:Database, table:str) -> Dict[str, pl.DataType]:
+    """Polars type per column of `staging_<table>`, in table order"""
+    rows = await db.fetch(
+        """SELECT column_name, data_type, numeric_precision, numeric_scale FROM information_schema.columns
+           WHERE table_schema = 'public' AND table_name = $1 ORDER BY ordinal_position""", f'staging_{table}')
+    types = {}
+    for row in rows or []:
+        if row['data_type'] == 'numeric':
+            types[row['column_name']] = pl.Decimal(row['numeric_precision'] or 38, row['numeric_scale'] or 0)
+        else:
+            types[row['column_name']] = PG_TYPES.get(row['data_type'], pl.String)
+    return types
+
+
+def cast(name:str, dtype:pl.DataType, datetime_format:str=None) -> pl.Expr:
+    """Expression turning the csv strings of `name` into `dtype`, numbers may use thousands separators"""
+    col = pl.col(name).str.strip_chars()
+    if dtype == pl.String:
+        return col
+    if dtype == pl.Datetime:
+        return col.str.to_datetime(datetime_format)
+    if dtype == pl.Date:
+        return col.str.to_date()
+    if dtype == pl.Boolean:
+        return col.str.to_lowercase().is_in(['true', 't', '1'])
+    return col.str.replace_all(',', '').cast(dtype)
+
+
+def history_columns(names:List[str], types:Dict[str, pl.DataType], datetime_format:str=None) -> Dict[str, pl.Expr]:
+    """Expression per table column renaming and casting the csv column of `names` matching it
+
+    Csv columns are matched to table columns ignoring case and underscores, the
+    others are dropped.
+    """
+    by_key = {normalize(name): name for name in names}
+    columns = {col: by_key[normalize(col)] for col in types if normalize(col) in by_key}
+    if 'ticker' not in columns or 'inserted' not in columns:
+        raise ValueError(f"Csv needs 'ticker' and 'inserted' columns, found {names}")
+    return {col: cast(csv_name, types[col], datetime_format).alias(col) for col, csv_name in columns.items()}
+
+
+def batches(frame:pl.LazyFrame, chunk_size:int) -> Iterator[pl.DataFrame]:
+    """Frames of up to `chunk_size` rows of a lazy scan, collected one slice at a time
+
+    The slice is pushed down into the csv or parquet reader, memory stays at one
+    chunk whatever the size of the file.
+    """
+    offset = 0
+    while True:
+        chunk = frame.slice(offset, chunk_size).collect()
+        if chunk.height:
+            yield chunk
+        if chunk.height < chunk_size:
+            return
+        offset += chunk.height
+
+
+async def load_history(db:Database, paths:Union[str, List[str]], table:str='institutional_holdings',
+                       chunk_size:int=50000, datetime_format:str=None) -> dict:
+    """Stream historical snapshot csvs into `table` in roughly constant memory
+
+    Files are read and cast with polars in chunks of `chunk_size` rows, each chunk is
+    binary COPYed into staging and merged with a server-side semi-join on `tickers`,
+    see HISTORY_FILTER. Partitions are created back to the oldest snapshot.
+
+    Args:
+        paths (str | list): Csv files or glob patterns
+        table (str): Snapshot table with an `inserted` column
+        chunk_size (int): Rows per chunk and COPY
+        datetime_format (str): strftime format of `inserted`, inferred by default
+
+    Returns:
+        dict: Rows read and rows inserted
+    """
+    files = expand(paths)
+    types = await column_types(db, table)
+    where = HISTORY_FILTER.format(table=table)
+    covered = None
+    read = inserted = 0
+    print(f"Loading {len(files)} file(s) into {table}")
+    for file_name in files:
+        try:
+            exprs = history_columns(pl.read_csv(file_name, n_rows=0, infer_schema=False).columns,
+                                    types, datetime_format)
+        except ValueError as e:
+            raise ValueError(f"{file_name}: {e}") from e
+        columns = tuple(exprs)
+        scan = pl.scan_csv(file_name, infer_schema=False).select(list(exprs.values()))
+        for chunk in batches(scan, chunk_size):
+            oldest = chunk['inserted'].min()
+            if table in PARTITIONED and oldest and (covered is None or oldest < covered):
+                await ensure_partitions(db, table, start=oldest)
+                covered = oldest
+            inserted += await db.copy_merge(table, columns, list(chunk.iter_rows()), where=where)
+            read += chunk.height
+            print(f"{read} rows read, {inserted} inserted")
+    return {'read': read, 'inserted': inserted}
+
+
+async def load_parquet(db:Database, root:str, tables:List[str]=None, chunk_size:int=50000) -> dict:
+    """Load a ParquetSink dataset into Postgres, chunk by chunk through COPY and merge
+
+    Tables go in TABLES order so tickers exist before the rows referencing them.
+    Snapshot tables keep the scrape time of the files and skip snapshots already
+    loaded, like `load_history`, the others rely on their conflict clause.
+
+    Returns:
+        dict: Rows read and inserted per table
+    """
+    counts = {}
+    for table in tables or TABLES:
+        files = sorted(glob.glob(os.path.join(root, table, '**', '*.parquet'), recursive=True))
+        if not files:
+            continue
+        columns = TABLES[table]['columns']
+        where = ''
+        if table in PARTITIONED:
+            columns += ('inserted',)
+            where = HISTORY_FILTER.format(table=table)
+        elif table != 'tickers':
+            where = 'WHERE ticker IN (SELECT ticker FROM tickers)'
+        covered = None
+        read = inserted = 0
+        print(f"Loading {len(files)} file(s) into {table}")
+        chunks = (chunk for file_name in files
+                  for chunk in batches(pl.scan_parquet(file_name).select(list(columns)), chunk_size))
+        for chunk in chunks:
+            if 'inserted' in columns:
+                oldest = chunk['inserted'].min()
+                if oldest and (covered is None or oldest < covered):
+                    await ensure_partitions(db, table, start=oldest)
+                    covered = oldest
+            inserted += await db.copy_merge(table, columns, list(chunk.iter_rows()),
+                                            TABLES[table]['on_conflict'], where=where)
+            read += chunk.height
+        counts[table] = {'read': read, 'inserted': inserted}
+    return counts
@@ -0,0 +1,136 @@
+import asyncio
+from datetime import date, datetime
+from typing import Dict, Iterable, Tuple
+from bulk_writer import BulkWriter
+from database import Database
+from metrics import registry
+
+# Holders per page request
+PAGE_SIZE = 100
+# Pages of one ticker requested at once
+PAGE_FAN_OUT = 4
+
+
+class HolderSync:
+    """Newest fully fetched filing date per ticker in `holders_synced`
+
+    Used in place of a `Ledger` by the writer: a ticker is stamped in the transaction
+    writing its last rows, so a holder list cut short by a failure or a crash is
+    fetched in full again next time.
+
+    Args:
+        db (Database): Database with an open pool
+    """
+    def __init__(self, db:Database) -> None:
+        self.db = db
+
+    async def load(self) -> Dict[str, date]:
+        """Synced date of every ticker, in one query"""
+        rows = await self.db.fetch("SELECT ticker, synced_date FROM holders_synced") or []
+        return {row['ticker']: row['synced_date'] for row in rows}
+
+    def done_statement(self, tickers:list) -> tuple:
+        """`(query, *args)` stamping tickers synced, run in the transaction writing their rows"""
+        return ("""INSERT INTO holders_synced (ticker, synced_date, refreshed)
+                   SELECT ticker, MAX(date), CURRENT_TIMESTAMP FROM institutional_holders
+                   WHERE ticker = ANY($1::text[]) GROUP BY ticker
+                   ON CONFLICT (ticker) DO UPDATE SET synced_date = EXCLUDED.synced_date, refreshed = EXCLUDED.refreshed""",
+                tickers)
+
+    async def fail(self, ticker:str, error:str, kind:str=None):
+        # Not stamped, the next refresh fetches every page again
+        pass
+
+
+def reached(records:list, synced:date) -> bool:
+    """True once a page holds filings older than the synced date, the rest is already stored"""
+    if not synced:
+        return False
+    for record in records:
+        filed = record.date.date() if isinstance(record.date, datetime) else record.date
+        if filed < synced:
+            return True
+    return False
+
+
+async def fetch_holders(scraper, ticker:str, writer:BulkWriter, synced:date=None, page_size:int=PAGE_SIZE,
+                        fan_out:int=PAGE_FAN_OUT) -> Tuple[int, bool]:
+    """Stream the holder list of a ticker into `writer` page by page, newest filings first
+
+    The first page gives the holder count, the next ones are fetched `fan_out` at a
+    time and written in order as they arrive. Paging stops at the first page reaching
+    filings older than `synced`, rows already stored are dropped by the conflict clause,
+    at a page shorter than `page_size` as sent, or past the holder count.
+
+    Returns:
+        tuple: Pages fetched, and whether the list was read to one of those ends. An unknown
+            holder count stops after a full first page without reaching one.
+    """
+    async def page(offset):
+        return await scraper.fetch_raw('holders', ticker, strict=True, limit=page_size, offset=offset)
+
+    first = await page(0)
+    total = scraper.holders_total(first)
+    records = scraper.parse_holders(ticker, first)
+    await writer.add_many(records)
+    pages = 1
+    # Parsing drops rows without a holder or date, only the rows sent tell the last page
+    done = reached(records, synced) or scraper.holders_page_rows(first) < page_size
+    offset = page_size
+    while not done and offset < total:
+        offsets = range(offset, min(total, offset + fan_out * page_size), page_size)
+        for data in await asyncio.gather(*(page(o) for o in offsets)):
+            records = scraper.parse_holders(ticker, data)
+            await writer.add_many(records)
+            pages += 1
+            if reached(records, synced) or scraper.holders_page_rows(data) < page_size:
+                done = True
+                break
+        offset += fan_out * page_size
+    registry.inc('nsdq_holder_pages_total', pages)
+    if offset < total:
+        registry.inc('nsdq_holder_pages_saved_total', (total - offset + page_size - 1) // page_size)
+    return pages, done or 0 < total <= offset
+
+
+async def scrape_holders(db:Database, scraper, tickers:Iterable[str], batch_size:int=5000,
+                         page_size:int=PAGE_SIZE, fan_out:int=PAGE_FAN_OUT, full:bool=False) -> BulkWriter:
+    """Fetch the full institutional holder list of every ticker into `institutional_holders`
+
+    Tickers run concurrently, each with up to `fan_out` pages in flight, the scraper's
+    scheduler bounds the requests overall. Rows are flushed every `batch_size` rows
+    whatever the ticker, so a ticker with thousands of holders is never held in memory.
+
+    Args:
+        page_size (int): Holders per request
+        fan_out (int): Concurrent pages per ticker
+        full (bool): Fetch every page, ignoring what is already stored
+    """
+    sync = HolderSync(db)
+    synced = {} if full else await sync.load()
+    queue = asyncio.Queue()
+    for ticker in tickers:
+        queue.put_nowait(ticker)
+    workers = max(1, scraper.scheduler.max_in_flight // fan_out)
+    pages = 0
+
+    async with BulkWriter(db, 'institutional_holders', max_rows=batch_size, ledger=sync) as writer:
+        async def work():
+            nonlocal pages
+            while not queue.empty():
+                ticker = queue.get_nowait()
+                try:
+                    fetched, complete = await fetch_holders(scraper, ticker, writer, synced.get(ticker),
+                                                            page_size, fan_out)
+                    pages += fetched
+                    if complete:
+                        writer.ticker_done(ticker)
+                    else:
+                        # Not stamped, a later refresh would stop at the filings written so far
+                        await writer.ticker_failed(ticker, 'holder list cut short, unknown holder count', 'incomplete')
+                except Exception as e:
+                    await writer.ticker_failed(ticker, str(e), getattr(e, 'kind', 'parse'))
+
+        await asyncio.gather(*(work() for _ in range(workers)))
+    print(f"Fetched {pages} holder pages, {writer.written} rows, saved {writer.merged} new, {writer.failed} tickers failed")
+    return writer
@@ -0,0 +1,110 @@
+from typing import Iterable
+from database import Database
+
+
+class Ledger:
+    """Run/job ledger making long scrapes resumable
+
+    Every ticker of a run gets a row in `run_tickers`. Tickers are marked done in
+    the same transaction that merges their rows (see `Database.copy_merge`), so a
+    crash never leaves a ticker marked done without its data, or the reverse.
+
+    Args:
+        db (Database): Database with an open pool
+        action (str): Action name the run belongs to
+        resume (bool): Continue the latest unfinished run of `action` if there is one
+        max_attempts (int): Failed tickers are retried on resume until this many attempts
+        run_id (int): Attach to an existing run, e.g. from a worker
+        queued (bool): A new run is for workers (`enqueue`), they never claim tickers of other runs
+    """
+    # Tickers left to process, a claim whose lease expired belongs to a dead worker
+    PENDING = """(status = 'pending' OR (status = 'failed' AND attempts < $2)
+                  OR (status = 'claimed' AND lease_until < CURRENT_TIMESTAMP))"""
+
+    def __init__(self, db:Database, action:str, resume:bool=False, max_attempts:int=3,
+                 run_id:int=None, queued:bool=False) -> None:
+        self.db = db
+        self.action = action
+        self.resume = resume
+        self.max_attempts = max_attempts
+        self.run_id = run_id
+        self.queued = queued
+
+    async def start(self, tickers:Iterable[str]=None):
+        """Resume or create the run, a new run is seeded with `tickers` or every listed ticker"""
+        if self.run_id:
+            return
+        if self.resume:
+            self.run_id = await self.db.fetchone(
+                """SELECT id FROM runs WHERE action = $1 AND status <> 'finished' AND queued = $2
+                   ORDER BY id DESC LIMIT 1""",
+                self.action, self.queued)
+            if self.run_id:
+                await self.db.execute("UPDATE runs SET status = 'running' WHERE id = $1", self.run_id)
+                print(f"Resuming run {self.run_id} for '{self.action}'")
+                return
+        self.run_id = await self.db.fetchone(
+            "INSERT INTO runs (action, queued) VALUES ($1, $2) RETURNING id", self.action, self.queued)
+        if tickers is None:
+            await self.db.execute(
+                "INSERT INTO run_tickers (run_id, ticker) SELECT $1, ticker FROM tickers WHERE delisted IS NULL",
+                self.run_id)
+        else:
+            await self.db.copy_records('run_tickers', ('run_id', 'ticker'),
+                                       [(self.run_id, ticker) for ticker in set(tickers)])
+        print(f"Started run {self.run_id} for '{self.action}'")
+
+    async def pending(self) -> list:
+        """Tickers still to process: pending, failed with attempts left or with an expired claim
+
+        Read up front in one short query, a cursor open for the whole run would hold a
+        pooled connection and a snapshot that keeps vacuum from cleaning up for hours.
+        """
+        return await self.db.fetch_values(
+            f"SELECT ticker FROM run_tickers WHERE run_id = $1 AND {self.PENDING} ORDER BY ticker",
+            self.run_id, self.max_attempts)
+
+    async def claim(self, worker_id:str, limit:int=100, lease:float=300.0) -> list:
+        """Lease up to `limit` pending tickers to a worker, concurrent workers never get the same ones"""
+        rows = await self.db.fetch(
+            f"""UPDATE run_tickers SET status = 'claimed', claimed_by = $3,
+                    lease_until = CURRENT_TIMESTAMP + $5::float8 * INTERVAL '1 second', updated = CURRENT_TIMESTAMP
+                WHERE run_id = $1 AND ticker IN (
+                    SELECT ticker FROM run_tickers
+                    WHERE run_id = $1 AND {self.PENDING}
+                    ORDER BY ticker LIMIT $4
+                    FOR UPDATE SKIP LOCKED)
+                RETURNING ticker""",
+            self.run_id, self.max_attempts, worker_id, limit, float(lease))
+        return [row['ticker'] for row in rows or []]
+
+    def done_statement(self, tickers:list) -> tuple:
+        """`(query, *args)` marking tickers done, run in the transaction writing their rows"""
+        return ("""UPDATE run_tickers SET status = 'done', attempts = attempts + 1, last_error = NULL, error_kind = NULL,
+                       claimed_by = NULL, lease_until = NULL, updated = CURRENT_TIMESTAMP
+                   WHERE run_id = $1 AND ticker = ANY($2::text[])""",
+                self.run_id, tickers)
+
+    async def fail(self, ticker:str, error:str, kind:str=None):
+        """Mark a ticker failed, `kind` is the error class, see `resilience.FetchError`"""
+        await self.db.execute(
+            """UPDATE run_tickers SET status = 'failed', attempts = attempts + 1, last_error = $3, error_kind = $4,
+                   claimed_by = NULL, lease_until = NULL, updated = CURRENT_TIMESTAMP
+               WHERE run_id = $1 AND ticker = $2""",
+            self.run_id, ticker, error, kind)
+
+    async def finish(self) -> dict:
+        """Close the run, it stays resumable while tickers are not done. Returns counts per status
+
+        A run with tickers still pending or claimed by other workers is left running.
+        """
+        counts = await self.db.fetch(
+            "SELECT status, COUNT(1) AS n FROM run_tickers WHERE run_id = $1 GROUP BY status", self.run_id)
+        counts = {row['status']: row['n'] for row in counts or []}
+        if 'pending' in counts or 'claimed' in counts:
+            return counts
+        status = 'finished' if set(counts) <= {'done'} else 'incomplete'
+        await self.db.execute(
+            "UPDATE runs SET status = $2, finished = CURRENT_TIMESTAMP WHERE id = $1", self.run_id, status)
+        print(f"Run {self.run_id} {status}: {counts}")
+        return counts
@@ -1,142 +1,299 @@
 import asyncio
-import itertools
+import csv
+import os
 import time
 import argparse
-import polars as pl
 from scarper import Scarper
 from database import Database
+from scheduler import AdaptiveScheduler
+from pipeline import scrape_all, scrape_tickers
+from ledger import Ledger
+from work_queue import enqueue, run_worker
+from cache import ResponseCache
+from ticker_sync import sync_tickers
+from daemon import run_daemon
+from resilience import RetryPolicy
+from partitions import maintain
+from holders import scrape_holders
+import metrics
 
 
-async def insert_tickers(db, scraper, batch_size=10):
-    """Inserts tickers data"""
-    tickers = pl.scan_csv('tickers2.csv').select('Symbol').collect()
+async def run_pipeline(db, scraper, dataset, table, tickers=None, batch_size=1000, ledger=None,
+                       skip_unchanged=False, engine='python', sink=None, incremental=False):
+    """Stream tickers through fetch -> parse -> bulk write for a dataset
+
+    `tickers` defaults to every listed ticker, with a ledger only its pending tickers are processed.
+    `sink` defaults to Postgres, see sinks.py. `incremental` as in `scrape_tickers`.
+    """
+    if ledger:
+        await ledger.start(tickers)
+        tickers = await ledger.pending()
+    elif tickers is None:
+        tickers = await listed_tickers(db)
+
+    writer = await scrape_tickers(db, scraper, dataset, table, tickers, batch_size, ledger, skip_unchanged, engine,
+                                  sink=sink, incremental=incremental)
+    if ledger:
+        await ledger.finish()
+    return writer
 
-    tickers = tickers['Symbol'].to_list()
-    for chunk in itertools.batched(tickers, batch_size):
-        tickers_records = await scraper.fetch_multiple_tickers(chunk)
-        query = """INSERT INTO tickers (ticker, company_name, stock_type, exchange, asset_class, is_nasdaq_listed, is_nasdaq100, is_held) 
-            VALUES ($1,$2,$3,$4,$5,$6,$7,$8) 
-            ON CONFLICT (ticker) DO NOTHING"""
-        data = [tuple(record.values()) for record in tickers_records if len(record) >0]
-        await db.executemany(query, data)
+
+async def insert_tickers(db, scraper, batch_size=1000, ledger=None, engine='python', file_name='tickers2.csv',
+                         sink=None):
+    """Inserts tickers data"""
+    tickers = csv_tickers(file_name)
+    await run_pipeline(db, scraper, 'info', 'tickers', tickers, batch_size, ledger, engine=engine, sink=sink)
 
     print("Tickers Inserted")
     
     
-async def insert_old_institutionals(db):
-    """Inserts institutional_holdings old  data"""
-    df = pl.read_csv('institutional_holdings_old.csv', try_parse_dates=True) #string to datetime
-
-    #  Clean the error 
-    df = df.with_columns(
-        pl.col('sharesOutstandingTotal').str.replace_all(",", "").cast(pl.Int64),
-        pl.col('increasedPositionsHolders').str.replace_all(",", "").cast(pl.Int64),
-        pl.col('totalHoldingsValue').str.replace_all(",", "").cast(pl.Int64),
-        pl.col('totalPositionsHolders').str.replace_all(",", "").cast(pl.Int64),
-        pl.col('decreasedPositionsHolders').str.replace_all(",", "").cast(pl.Int64))
-    # Filter only if i have those tickers
-    tickers = await db.fetch("SELECT ticker FROM tickers")
-    tickers = [item['ticker'] for item in tickers]
-
-    df_filtered = df.filter(pl.col("ticker").is_in(tickers))
-
-    records = [tuple(row)for row in df_filtered.iter_rows()]
-    
-    query = """INSERT INTO institutional_holdings (ticker, shares_outstanding_pct, shares_outstanding_total, total_holdings_value, increased_positions_holders, increased_positions_shares, decreased_positions_holders, decreased_positions_shares, held_positions_holders, held_positions_shares, total_positions_holders, total_positions_shares, new_positions_holders, new_positions_shares, sold_out_positions_holders, sold_out_positions_shares, inserted) 
-            VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11,$12,$13,$14,$15,$16,$17) 
-            """
-
-    await db.executemany(query, records)
-    print("Old Data Inserted")
-       
-async def scrape_dividends(db, scraper, batch_size=10):
-    """Fetch dividends for a list of tickers and store them in the database."""
-    counter = 0
-    tickers = await db.fetch("SELECT ticker FROM tickers;")
-    for chunk in itertools.batched(tickers, batch_size):
-        dividends = await scraper.fetch_multiple_dividends(chunk)
-        clean_records = [(item['ticker'], item['ex_date'], item['payment_type'], item['amount'],
-                        item['declaration_date'], item['record_date'], item['payment_date'], item['currency'])
-                        for sublist in dividends if len(sublist)>0 for item in sublist]
-        time.sleep(1)
-        await db.executemany(
-            """INSERT INTO dividends (ticker, ex_date, payment_type, amount, declaration_date, record_date, payment_date, currency) 
-               VALUES ($1,$2,$3,$4,$5,$6,$7,$8) 
-               ON CONFLICT (ticker, ex_date, payment_type, amount, declaration_date, record_date, payment_date, currency) DO NOTHING""", 
-            clean_records
-        )
-        counter += len(clean_records)
+async def insert_old_institutionals(db, files=('institutional_holdings_old.csv',), chunk_size=50000):
+    """Inserts institutional_holdings old data, streamed from csv files or globs"""
+    from history_loader import load_history
+    counts = await load_history(db, list(files), 'institutional_holdings', chunk_size)
+    print(f"Old Data Inserted: {counts['inserted']} of {counts['read']} rows")
+
+
+async def scrape_dividends(db, scraper, batch_size=1000, ledger=None, engine='python', tickers=None, sink=None,
+                           incremental=True):
+    """Fetch dividends for a list of tickers and store them in the database, only those past the stored ex_dates."""
+    writer = await run_pipeline(db, scraper, 'dividends', 'dividends', tickers, batch_size, ledger,
+                                engine=engine, sink=sink, incremental=incremental)
     
-    print(f"Scraped and saved {counter} dividend records")
+    print(f"Scraped {writer.written} dividend records, saved {writer.merged} new")
     
 
 
-async def scrape_institutionals(db, scraper,batch_size=10):
+async def scrape_institutionals(db, scraper,batch_size=1000, ledger=None, skip_unchanged=True, engine='python',
+                                tickers=None, sink=None):
     """Fetch metadata for tickers and store it in the database."""
-    tickers = await db.fetch("SELECT ticker FROM tickers;")
-    
-    
     #  asyncpg.exceptions.DataError: invalid input for query argument $3 in element #2 of executemany() sequence: '15,022'
-    counter = 0
-    for chunk in itertools.batched(tickers, batch_size):
-        institutionals_records = await scraper.fetch_multiple_institutionals(chunk)
-        clean_records = [tuple(record.values()) for record in institutionals_records if len(record)>0]
-        time.sleep(1)
-        await db.executemany(
-            """INSERT INTO institutional_holdings (ticker, shares_outstanding_pct, shares_outstanding_total, total_holdings_value, increased_positions_holders, increased_positions_shares, decreased_positions_holders, decreased_positions_shares, held_positions_holders, held_positions_shares, total_positions_holders, total_positions_shares, new_positions_holders, new_positions_shares, sold_out_positions_holders, sold_out_positions_shares) 
-                VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11,$12,$13,$14,$15,$16) 
-            """, clean_records    
-        )
-        
-        counter += len(clean_records)
-    print(f"Scraped and saved metadata for {chunk} tickers")
+    writer = await run_pipeline(db, scraper, 'institutionals', 'institutional_holdings', tickers, batch_size,
+                                ledger, skip_unchanged, engine, sink)
+    print(f"Scraped and saved institutionals for {writer.merged} tickers, skipped {writer.skipped} unchanged")
     
     
-async def scrape_metadata(db, scraper, batch_size=10):
+async def scrape_metadata(db, scraper, batch_size=1000, ledger=None, skip_unchanged=True, engine='python',
+                          tickers=None, sink=None):
     """Fetch metadata for tickers and store it in the database."""
-    tickers = await db.fetch("SELECT ticker FROM tickers;")
-    counter = 0
-    for chunk in itertools.batched(tickers, batch_size):
-        metadata_records = await scraper.fetch_multiple_metadata(chunk)
-        clean_records = [tuple(record.values()) for record in metadata_records if len(record)>0]
-        time.sleep(1)
-        await db.executemany(
-            """INSERT INTO metadata (ticker, exchange, sector, industry, one_yr_target, today_high_low, share_volume, 
-                                    average_volume, previous_close, fiftytwo_week_high_low, market_cap, pe_ratio, 
-                                    forward_pe_1yr, earnings_per_share, annualized_dividend, ex_dividend_date, 
-                                    dividend_payment_date, yield, special_dividend_date, special_dividend_amount, 
-                                    special_dividend_payment_date) 
-            VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11,$12,$13,$14,$15,$16,$17,$18,$19,$20,$21) 
-            """, clean_records
-        )
-        counter += len(clean_records)
-
-    print(f"Scraped and saved metadata for {counter} tickers")
-
-
-async def main(action:str, batch_size:int=10):
-    scraper = Scarper()
-    db = Database('127.0.0.1','test', 'test', 'nsdq') 
-    
-    await db.create_pool() 
-    
+    writer = await run_pipeline(db, scraper, 'metadata', 'metadata', tickers, batch_size,
+                                ledger, skip_unchanged, engine, sink)
+
+    print(f"Scraped and saved metadata for {writer.merged} tickers, skipped {writer.skipped} unchanged")
+
+
+async def scrape_everything(db, scraper, batch_size=1000, ledger=None, skip_unchanged=True, engine='python',
+                            tickers=None, sink=None, incremental=True):
+    """Fetch info, metadata, dividends and institutionals of every ticker in one pass."""
+    if ledger:
+        await ledger.start(tickers)
+        tickers = await ledger.pending()
+    elif tickers is None:
+        tickers = await listed_tickers(db)
+    writer = await scrape_all(db, scraper, tickers, batch_size, ledger, skip_unchanged, engine, sink, incremental)
+    if ledger:
+        await ledger.finish()
+    for table in writer.tables:
+        print(f"{table}: scraped {writer.written[table]} records, saved {writer.merged[table]} new, "
+              f"skipped {writer.skipped[table]} unchanged")
+
+
+LEDGER_ACTIONS = ("tickers", "institutionals", "dividends", "metadata", "all")
+# Actions that can write to a parquet sink, without a database
+LAKE_ACTIONS = ("tickers", "institutionals", "dividends", "metadata", "all")
+# Actions that cannot be a step of 'run': itself and the interactive tests
+NOT_RUNNABLE = ("run", "test_institutional", "test_info", "test_dividend", "test_metadata")
+# Options read once per process, before any step: HTTP client, scheduler, cache, database, sink and metrics
+PROCESS_OPTIONS = ("max_connections", "http2", "rate", "max_in_flight", "retries", "breaker_threshold",
+                   "breaker_cooldown", "cache", "cache_dir", "cache_max_mb", "replay", "base_url", "db_host",
+                   "db_port", "db_name", "db_user", "db_password", "sink", "lake_dir", "file_rows",
+                   "failures_csv", "metrics_dir", "metrics_port", "metrics_host", "job")
+
+
+def load_job(file_name:str) -> dict:
+    """Read a TOML job file, or YAML if pyyaml is installed"""
+    if os.path.splitext(file_name)[1] in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise SystemExit(f"Reading {file_name} needs 'pip install pyyaml', or write the job as TOML")
+        with open(file_name) as f:
+            return yaml.safe_load(f) or {}
+    import tomllib
+    with open(file_name, 'rb') as f:
+        return tomllib.load(f)
+
+
+def job_steps(args:argparse.Namespace) -> list:
+    """`(action, args)` of every step to run, in order
+
+    A single action is one step. 'run' takes its actions from `targets` or from a `--job` file:
+
+        batch_size = 5000                 # options of every step, named like the flags
+        rate = 20.0                       # PROCESS_OPTIONS only at the top, they are set on `args`
+        actions = ["tickers", "metadata"]
+        [[steps]]                         # or steps with their own options, after `actions`
+        action = "dividends"
+        full_dividends = true
+    """
+    if args.action != "run":
+        return [(args.action, args)]
+    job = load_job(args.job) if args.job else {}
+    defaults = {key: value for key, value in job.items() if key not in ("actions", "steps")}
+    unknown = [key for key in defaults if not hasattr(args, key) or key == "job"]
+    if unknown:
+        raise SystemExit(f"Unknown job options {unknown}")
+    # The process is set up once from these, before the first step
+    for key in PROCESS_OPTIONS:
+        if key in defaults:
+            setattr(args, key, defaults.pop(key))
+    entries = list(args.targets) + list(job.get("actions", [])) + list(job.get("steps", []))
+    if not entries:
+        raise SystemExit("'run' needs actions, e.g. 'python main.py run tickers metadata' or --job job.toml")
+    steps = []
+    for entry in entries:
+        options = dict(defaults, **(entry if isinstance(entry, dict) else {"action": entry}))
+        action = options.pop("action", None)
+        unknown = [key for key in options if not hasattr(args, key)]
+        process = [key for key in options if key in PROCESS_OPTIONS]
+        if action is None or action in NOT_RUNNABLE or unknown or process:
+            raise SystemExit(f"Invalid step '{action}'" + (f", unknown options {unknown}" if unknown else "")
+                             + (f", {process} apply to the whole run, set them at the top of the job" if process else ""))
+        # `targets` of a step are its own, e.g. what an 'enqueue' step enqueues
+        steps.append((action, argparse.Namespace(**{**vars(args), "targets": [], **options, "action": action})))
+    return steps
+
+
+def csv_tickers(file_name='tickers2.csv'):
+    """Symbols of the tickers csv"""
+    with open(file_name, newline='') as f:
+        return [row['Symbol'] for row in csv.DictReader(f)]
+
+
+async def listed_tickers(db):
+    """Every ticker not delisted, the default of the scraping actions"""
+    return await db.fetch_values("SELECT ticker FROM tickers WHERE delisted IS NULL ORDER BY ticker")
+
+
+async def main(args:argparse.Namespace):
+    # First, a job file may set the options the process is built from
+    steps = job_steps(args)
+    scheduler = AdaptiveScheduler(rate=args.rate, max_in_flight=args.max_in_flight)
+    cache = None
+    if args.cache or args.replay:
+        cache = ResponseCache(args.cache_dir, max_bytes=args.cache_max_mb * 1024 * 1024, replay=args.replay)
+    scraper = Scarper(max_connections=args.max_connections, http2=args.http2, base_url=args.base_url,
+                      scheduler=scheduler, cache=cache,
+                      retry=RetryPolicy(args.retries), breaker_threshold=args.breaker_threshold,
+                      breaker_cooldown=args.breaker_cooldown)
+    sink, db = None, None
+    # Steps share one HTTP client and one DB pool
+    if args.sink == "parquet":
+        needs_db = [action for action, _ in steps if action not in LAKE_ACTIONS]
+        if needs_db:
+            raise SystemExit(f"--sink parquet only writes {list(LAKE_ACTIONS)}, {needs_db} need Postgres")
+        from sinks import ParquetSink
+        sink = ParquetSink(args.lake_dir, args.file_rows)
+    else:
+        db = Database(args.db_host, args.db_user, args.db_password, args.db_name, args.db_port)
+        await db.create_pool() 
+    loop_lag = asyncio.create_task(metrics.monitor_loop_lag())
+    daemon = any(action == "daemon" for action, _ in steps)
+    metrics_port = args.metrics_port if args.metrics_port is not None else (9108 if daemon else 0)
+    server = await metrics.serve(metrics_port, args.metrics_host) if metrics_port else None
+    try:
+        for action, step_args in steps:
+            start = time.time()
+            ledger = None
+            if db and action in LEDGER_ACTIONS:
+                ledger = Ledger(db, action, step_args.resume, step_args.max_attempts)
+            await run_action(action, db, scraper, step_args, ledger, sink)
+            if len(steps) > 1:
+                print(f"Step '{action}' finished in {time.time()-start:6f}s")
+        if scraper.failures:
+            print(f"Failed requests/records: {scraper.failures.summary()}")
+            if args.failures_csv:
+                scraper.failures.to_csv(args.failures_csv)
+                print(f"Failures per ticker written to {args.failures_csv}")
+    finally:
+        loop_lag.cancel()
+        if server:
+            server.close()
+        if args.metrics_dir:
+            report = f"{args.metrics_dir}/{args.action}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+            metrics.registry.write_json(report, action=args.action)
+            print(f"Metrics report written to {report}")
+        await scraper.close()
+        if db:
+            await db.close_pool()
+
+
+async def run_action(action:str, db, scraper, args:argparse.Namespace, ledger=None, sink=None):
+    batch_size = args.batch_size
+    if sink:
+        # No database to read tickers from, every symbol of the csv is scraped
+        tickers = None if action == "tickers" else csv_tickers(args.tickers_csv)
+        # The sink is shared by the steps of a run, count only the files of this one
+        written = len(sink.files)
+        if action == "tickers":
+            await insert_tickers(db, scraper, batch_size, engine=args.engine, file_name=args.tickers_csv, sink=sink)
+        elif action == "all":
+            await scrape_everything(db, scraper, batch_size, engine=args.engine, tickers=tickers, sink=sink)
+        elif action == "institutionals":
+            await scrape_institutionals(db, scraper, batch_size, engine=args.engine, tickers=tickers, sink=sink)
+        elif action == "dividends":
+            await scrape_dividends(db, scraper, batch_size, engine=args.engine, tickers=tickers, sink=sink)
+        elif action == "metadata":
+            await scrape_metadata(db, scraper, batch_size, engine=args.engine, tickers=tickers, sink=sink)
+        print(f"Wrote {len(sink.files) - written} parquet files to {sink.root}")
+        return
     if action == "create_schema":
         await db.create_database()
         await db.create_schema()
+        await maintain(db)
+        await db.refresh_latest()
+    elif action == "partitions":
+        await maintain(db, args.months_ahead, args.retention_months, args.drop_detached)
     elif action == "load_old":
-        await insert_old_institutionals(db)
+        await insert_old_institutionals(db, args.files, args.batch_size)
+    elif action == "load_lake":
+        from history_loader import load_parquet
+        counts = await load_parquet(db, args.lake_dir, chunk_size=max(batch_size, 50000))
+        print(", ".join(f"{table}: {n['inserted']} of {n['read']} rows inserted" for table, n in counts.items()))
     elif action == "tickers":
         start_counter = await db.fetchone('SELECT COUNT(1) FROM tickers')
         start_counter = start_counter or 0
-        await insert_tickers(db, scraper, batch_size)
+        await insert_tickers(db, scraper, batch_size, ledger, args.engine, args.tickers_csv)
         end_counter = await db.fetchone('SELECT COUNT(1) FROM tickers')
         print(f'Total Inserted: {end_counter-start_counter}')
+    elif action == "all":
+        await scrape_everything(db, scraper, batch_size, ledger, not args.write_unchanged, args.engine,
+                                incremental=not args.full_dividends)
+    elif action == "sync_tickers":
+        changes = await sync_tickers(db, scraper, csv_tickers(args.tickers_csv), args.refresh_days, batch_size, args.engine)
+        print(", ".join(f"{len(tickers)} {change}" for change, tickers in changes.items()))
     elif action == "institutionals":
-        await scrape_institutionals(db, scraper)
+        await scrape_institutionals(db, scraper, batch_size, ledger, not args.write_unchanged, args.engine)
     elif action == "dividends":
-        await scrape_dividends(db, scraper, batch_size)
+        await scrape_dividends(db, scraper, batch_size, ledger, args.engine, incremental=not args.full_dividends)
     elif action == "metadata":        
-        await scrape_metadata(db, scraper)
+        await scrape_metadata(db, scraper, batch_size, ledger, not args.write_unchanged, args.engine)
+    elif action == "holders":
+        tickers = await listed_tickers(db)
+        await scrape_holders(db, scraper, tickers, max(batch_size, 5000), args.page_size, args.page_fan_out,
+                             args.full_holders)
+    elif action == "enqueue":
+        for target in args.targets:
+            run_id = await enqueue(db, target, csv_tickers(args.tickers_csv) if target == "tickers" else None)
+            print(f"Enqueued '{target}' as run {run_id}")
+    elif action == "worker":
+        await run_worker(db, scraper, args.worker_id, args.claim_size, args.lease,
+                         batch_size, args.max_attempts, args.poll, not args.write_unchanged, args.engine,
+                         not args.full_dividends)
+    elif action == "daemon":
+        await run_daemon(db, scraper, args.budget, args.cycle, batch_size=batch_size,
+                         skip_unchanged=not args.write_unchanged, engine=args.engine,
+                         incremental=not args.full_dividends)
     elif action == "test_institutional":
         ticker = input("Enter a ticker to test institutional fetch: ").strip().upper()
         print(await scraper.fetch_institutionals(ticker)) 
@@ -151,29 +308,80 @@ async def main(action:str, batch_size:int=10):
         print(await scraper.fetch_metadata(ticker))
     else:
         print("Invalid action. ",
-              "Use 'create_schema', 'tickers', 'dividends', 'metadata', 'test_dividend', or 'test_metadata'.")
+              "Use 'create_schema', 'partitions', 'load_old', 'load_lake', 'tickers', 'sync_tickers', 'dividends', 'metadata', 'all', 'holders', 'enqueue', 'worker', 'daemon', 'run', 'test_dividend', or 'test_metadata'.")
 
-    
-    # print(f"Scraped and saved {counter} records")
-    # # print(scraper.INVALID_TICKERS)
-    # if scraper.INVALID_TICKERS:
-    #         with open("invalid_tickers.csv", "w") as csvfile:
-    #             # Write the header
-    #             csvfile.write("Ticker\n")
-    #             # Write each ticker on a new line
-    #             for ticker in scraper.INVALID_TICKERS:
-    #                 csvfile.write(f"{ticker}\n")
-    #         print("Invalid tickers written to invalid_tickers.csv")
-    # print('F I N I S H E D')
+
+def arg_parser() -> argparse.ArgumentParser:
+    """Command line options, also the keys of a job file"""
+    parser = argparse.ArgumentParser(description="Run Scarper with different actions")
+    parser.add_argument("action", type=str, help="Chose 'dividends, 'metadata, 'bla'")
+    parser.add_argument("targets", type=str, nargs="*", help="Actions to enqueue with 'enqueue' or to run with 'run'")
+    parser.add_argument("--job", type=str, default=None, help="TOML (or YAML) job file of 'run', see job_steps")
+    parser.add_argument("--batch_size", type=int, default=1000, help="Number of records per DB flush")
+    parser.add_argument("--max_connections", type=int, default=100, help="Max pooled HTTP connections")
+    parser.add_argument("--http2", action="store_true", help="Use HTTP/2 multiplexing (needs httpx[http2])")
+    parser.add_argument("--rate", type=float, default=10.0, help="Starting requests per second")
+    parser.add_argument("--max_in_flight", type=int, default=10, help="Max concurrent requests")
+    parser.add_argument("--resume", action="store_true", help="Continue the last unfinished run of the action")
+    parser.add_argument("--max_attempts", type=int, default=3, help="Attempts per ticker before giving up on resume")
+    parser.add_argument("--db_host", type=str, default="127.0.0.1", help="Postgres host, shared by all workers")
+    parser.add_argument("--db_port", type=int, default=5432, help="Postgres port")
+    parser.add_argument("--db_name", type=str, default="nsdq", help="Postgres database")
+    parser.add_argument("--db_user", type=str, default="test", help="Postgres user")
+    parser.add_argument("--db_password", type=str, default="test", help="Postgres password")
+    parser.add_argument("--tickers_csv", type=str, default="tickers2.csv", help="Symbols csv of 'tickers'/'sync_tickers'")
+    parser.add_argument("--base_url", type=str, default=None, help="API root, e.g. a local mock of api.nasdaq.com")
+    parser.add_argument("--worker_id", type=str, default=None, help="Worker name, defaults to host-pid")
+    parser.add_argument("--claim_size", type=int, default=100, help="Tickers a worker claims at once")
+    parser.add_argument("--lease", type=float, default=300.0, help="Seconds before a claim of a dead worker expires")
+    parser.add_argument("--poll", type=float, default=0.0, help="Worker waits this long for new runs when idle, 0 exits")
+    parser.add_argument("--write_unchanged", action="store_true", help="Write metadata/institutionals even if unchanged")
+    parser.add_argument("--engine", type=str, default="python", choices=["python", "vector"],
+                        help="Record cleaning: per-field python, or batched polars for dividends")
+    parser.add_argument("--refresh_days", type=float, default=None,
+                        help="With 'sync_tickers', also re-fetch info older than this many days")
+    parser.add_argument("--retries", type=int, default=4,
+                        help="Attempts per request on 429/5xx/timeouts, 1 disables retries")
+    parser.add_argument("--breaker_threshold", type=int, default=5,
+                        help="Consecutive throttled requests pausing an endpoint")
+    parser.add_argument("--breaker_cooldown", type=float, default=30.0, help="Seconds an endpoint is first paused")
+    parser.add_argument("--failures_csv", type=str, default=None, help="Write the failure of every ticker to this csv")
+    parser.add_argument("--metrics_dir", type=str, default=None, help="Write a JSON metrics report of the run to this folder")
+    parser.add_argument("--metrics_port", type=int, default=None,
+                        help="Serve Prometheus metrics on this port, 'daemon' defaults to 9108, 0 disables it")
+    parser.add_argument("--metrics_host", type=str, default="127.0.0.1",
+                        help="Address of the metrics port, 0.0.0.0 to let other hosts scrape it")
+    parser.add_argument("--files", type=str, nargs="+", default=["institutional_holdings_old.csv"],
+                        help="Csv files or globs of 'load_old'")
+    parser.add_argument("--sink", type=str, default="postgres", choices=["postgres", "parquet"],
+                        help="Write scraped rows to Postgres or to parquet files under --lake_dir, without a database")
+    parser.add_argument("--lake_dir", type=str, default="lake", help="Parquet dataset of --sink parquet and 'load_lake'")
+    parser.add_argument("--file_rows", type=int, default=250000, help="Rows per table per parquet file")
+    parser.add_argument("--page_size", type=int, default=100, help="'holders' rows per page request")
+    parser.add_argument("--page_fan_out", type=int, default=4, help="'holders' pages of a ticker fetched at once")
+    parser.add_argument("--full_dividends", action="store_true",
+                        help="Parse and write every dividend, not only those past the stored ex_dates")
+    parser.add_argument("--full_holders", action="store_true", help="'holders' fetches every page, not only new filings")
+    parser.add_argument("--months_ahead", type=int, default=2, help="'partitions' creates this many future months")
+    parser.add_argument("--retention_months", type=int, default=None,
+                        help="'partitions' detaches snapshot partitions older than this many months")
+    parser.add_argument("--drop_detached", action="store_true", help="Drop partitions past retention instead")
+    parser.add_argument("--budget", type=int, default=600, help="Daemon requests per cycle")
+    parser.add_argument("--cycle", type=float, default=3600.0, help="Daemon cycle length in seconds")
+    parser.add_argument("--cache", action="store_true", help="Cache responses on disk, fresh ones are not re-fetched")
+    parser.add_argument("--cache_dir", type=str, default=".cache/responses", help="Response cache folder")
+    parser.add_argument("--cache_max_mb", type=int, default=1024, help="Cache size before LRU eviction")
+    parser.add_argument("--replay", action="store_true", help="Run entirely from the response cache, no requests")
+    return parser
 
 
 # Run the async main
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Run Scarper with different actions")
-    parser.add_argument("action", type=str, help="Chose 'dividends, 'metadata, 'bla'")
-    parser.add_argument("--batch_size", type=int, default=10, help="Number of tickers per batch")
+    parser = arg_parser()
     args = parser.parse_args()
+    if args.retries < 1:
+        parser.error("--retries counts the first attempt, it must be at least 1")
     start = time.time()
-    asyncio.run(main(args.action, args.batch_size))
+    asyncio.run(main(args))
     print(f"Action '{args.action}' finished in {time.time()-start:6f}s")
     
\ No newline at end of file
@@ -0,0 +1,195 @@
+import asyncio
+import bisect
+import json
+import os
+import time
+from typing import Dict, Tuple
+
+# Seconds, from a cache hit to a slow upstream
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, Prometheus style"""
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets:tuple=LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value:float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q:float) -> float:
+        """Estimate, interpolated inside the bucket holding the q-th value"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                low = self.buckets[i - 1] if i else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': round(self.quantile(0.5), 6),
+            'p90': round(self.quantile(0.9), 6),
+            'p99': round(self.quantile(0.99), 6),
+        }
+
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    """In-process registry of counters, gauges and histograms
+
+    Exported as Prometheus text (`render`) or a JSON report (`report`).
+    Names follow Prometheus conventions, labels are keyword arguments.
+    """
+    def __init__(self) -> None:
+        self.started = time.time()
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.help: Dict[str, str] = {}
+
+    @staticmethod
+    def _labels(labels:dict) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name:str, value:float=1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = self._labels(labels)
+        series[key] = series.get(key, 0) + value
+
+    def set(self, name:str, value:float, **labels):
+        self.gauges.setdefault(name, {})[self._labels(labels)] = value
+
+    def observe(self, name:str, value:float, buckets:tuple=LATENCY_BUCKETS, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = self._labels(labels)
+        if key not in series:
+            series[key] = Histogram(buckets)
+        series[key].observe(value)
+
+    def describe(self, name:str, text:str):
+        self.help[name] = text
+
+    def total(self, name:str, **labels) -> float:
+        """Sum of a counter over the series matching `labels`"""
+        wanted = set(self._labels(labels))
+        return sum(value for key, value in self.counters.get(name, {}).items() if wanted <= set(key))
+
+    @staticmethod
+    def _format(labels:Labels, extra:str='') -> str:
+        parts = [f'{key}="{value}"' for key, value in labels]
+        if extra:
+            parts.append(extra)
+        return '{' + ','.join(parts) + '}' if parts else ''
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for kind, families in (('counter', self.counters), ('gauge', self.gauges)):
+            for name, series in families.items():
+                if name in self.help:
+                    lines.append(f'# HELP {name} {self.help[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in series.items():
+                    lines.append(f'{name}{self._format(labels)} {value}')
+        for name, series in self.histograms.items():
+            if name in self.help:
+                lines.append(f'# HELP {name} {self.help[name]}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, hist in series.items():
+                cumulative = 0
+                for bound, n in zip(hist.buckets + ('+Inf',), hist.counts):
+                    cumulative += n
+                    le = f'le="{bound}"'
+                    lines.append(f'{name}_bucket{self._format(labels, le)} {cumulative}')
+                lines.append(f'{name}_sum{self._format(labels)} {hist.sum}')
+                lines.append(f'{name}_count{self._format(labels)} {hist.count}')
+        return '\n'.join(lines) + '\n'
+
+    def report(self) -> dict:
+        """Everything recorded, histograms summarized with count, mean and p50/p90/p99"""
+        def series(family, value):
+            return {name: [{'labels': dict(labels), **value(v)} for labels, v in items.items()]
+                    for name, items in family.items()}
+        elapsed = time.time() - self.started
+        rows = self.total('nsdq_db_rows_total')
+        derived = {
+            'db_rows_per_sec': round(rows / elapsed, 1) if elapsed else 0.0,
+            'requests_per_sec': round(self.total('nsdq_responses_total') / elapsed, 1) if elapsed else 0.0,
+        }
+        parse_seconds = {dict(k).get('dataset'): h.sum for k, h in self.histograms.get('nsdq_parse_seconds', {}).items()}
+        for labels, n in self.counters.get('nsdq_parsed_records_total', {}).items():
+            dataset = dict(labels).get('dataset')
+            if n:
+                derived.setdefault('parse_seconds_per_record', {})[dataset] = parse_seconds.get(dataset, 0.0) / n
+        return {
+            'started': self.started,
+            'elapsed': round(elapsed, 3),
+            'derived': derived,
+            'counters': series(self.counters, lambda v: {'value': v}),
+            'gauges': series(self.gauges, lambda v: {'value': v}),
+            'histograms': series(self.histograms, lambda h: h.summary()),
+        }
+
+    def write_json(self, file_name:str, **extra):
+        """Write `report()` plus `extra` keys, e.g. the action name"""
+        os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+        with open(file_name, 'w') as f:
+            json.dump({**extra, **self.report()}, f, indent=2, default=str)
+
+
+# Process-wide registry used by Scarper, Database and the pipeline
+registry = Metrics()
+
+
+async def monitor_loop_lag(metrics:Metrics=None, interval:float=0.5):
+    """Record how late the event loop wakes up a sleeping task, runs until cancelled"""
+    metrics = metrics or registry
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - start - interval)
+        metrics.observe('nsdq_event_loop_lag_seconds', lag)
+        metrics.set('nsdq_event_loop_lag_last_seconds', lag)
+
+
+async def serve(port:int, host:str='127.0.0.1', metrics:Metrics=None) -> asyncio.AbstractServer:
+    """Serve `metrics.render()` over HTTP for Prometheus to scrape, on localhost unless `host` says otherwise"""
+    metrics = metrics or registry
+
+    async def handle(reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+            path = request.split(b' ', 2)[1] if request.count(b' ') >= 2 else b'/'
+            if path.startswith(b'/metrics'):
+                body, status = metrics.render().encode(), b'200 OK'
+            else:
+                body, status = b'not found\n', b'404 Not Found'
+            writer.write(b'HTTP/1.1 ' + status + b'\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Metrics on http://{host}:{port}/metrics")
+    return server
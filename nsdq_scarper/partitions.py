@@ -0,0 +1,201 @@
+from datetime import date, datetime
+from typing import List
+from database import Database
+
+# Snapshot tables partitioned by month on `inserted`
+PARTITIONED = ('metadata', 'institutional_holdings')
+
+
+def month_start(day) -> date:
+    return date(day.year, day.month, 1)
+
+
+def next_month(day:date) -> date:
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def partition_name(table:str, month:date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def index_statements(table:str) -> List[str]:
+    """Indexes of a partitioned snapshot table, created on every partition"""
+    return [
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_ticker_inserted ON {table} (ticker, inserted DESC)",
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_inserted_brin ON {table} USING BRIN (inserted)",
+    ]
+
+
+async def lock_partitions(conn, table:str):
+    """Serialize partition changes of `table` across processes until the transaction ends"""
+    await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", f"partitions:{table}")
+
+
+async def is_partitioned(db:Database, table:str) -> bool:
+    kind = await db.fetchone("SELECT relkind::text FROM pg_class WHERE oid = to_regclass($1)", table)
+    return kind == 'p'
+
+
+async def create_partition(db:Database, table:str, month:date) -> bool:
+    """Create the partition of `month`, moving its rows out of the default partition.
+
+    Safe to call from several workers at once: the creation runs under an advisory
+    lock and checks again for the partition once it holds it.
+
+    Returns:
+        bool: False if it already existed
+    """
+    name = partition_name(table, month)
+    if await db.fetchone("SELECT to_regclass($1)::text", name):
+        return False
+    start, end = month, next_month(month)
+    async with db.pool.acquire() as conn:
+        async with conn.transaction():
+            await lock_partitions(conn, table)
+            if await conn.fetchval("SELECT to_regclass($1)::text", name):
+                # Another process created it while we waited for the lock
+                return False
+            await conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+            # Attaching checks the default partition holds no row of the new range
+            await conn.execute(
+                f"""WITH moved AS (
+                        DELETE FROM {table}_default WHERE inserted >= $1 AND inserted < $2 RETURNING *)
+                    INSERT INTO {name} SELECT * FROM moved""", start, end)
+            await conn.execute(
+                f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')")
+    print(f"Created partition {name}")
+    return True
+
+
+async def ensure_partitions(db:Database, table:str, start:datetime=None, months_ahead:int=2) -> int:
+    """Create missing monthly partitions from `start` (default this month) to `months_ahead` months ahead.
+
+    Rows outside every partition land in `<table>_default`, so a missing partition
+    never fails a write, its rows are moved when the partition gets created.
+
+    Returns:
+        int: Partitions created
+    """
+    if not await db.fetchone("SELECT to_regclass($1)::text", f"{table}_default"):
+        async with db.pool.acquire() as conn:
+            async with conn.transaction():
+                # IF NOT EXISTS alone still fails when two processes create it at once
+                await lock_partitions(conn, table)
+                await conn.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+    month = month_start(start or date.today())
+    last = month_start(date.today())
+    for _ in range(months_ahead):
+        last = next_month(last)
+    created = 0
+    while month <= last:
+        created += await create_partition(db, table, month)
+        month = next_month(month)
+    return created
+
+
+_ensured = {}
+
+
+async def ensure_current(db:Database, table:str):
+    """`ensure_partitions` once a month per process, called before writing to a snapshot table"""
+    month = month_start(date.today())
+    if _ensured.get(table) == month:
+        return
+    if await is_partitioned(db, table):
+        await ensure_partitions(db, table)
+    else:
+        print(f"Warning: {table} is not partitioned yet, run 'python main.py partitions' to migrate it")
+    _ensured[table] = month
+
+
+async def migrate(db:Database, table:str) -> bool:
+    """Turn a plain snapshot table of an older schema into a partitioned one, keeping its rows and ids.
+
+    Returns:
+        bool: False if the table was already partitioned
+    """
+    if await is_partitioned(db, table):
+        return False
+    old = f"{table}_unpartitioned"
+    print(f"Partitioning {table}...")
+    async with db.pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+            sequence = await conn.fetchval("SELECT pg_get_serial_sequence($1, 'id')", table)
+            await conn.execute(f"ALTER TABLE {table} RENAME TO {old}")
+            for index in ('ticker', 'ticker_inserted', 'inserted_brin'):
+                await conn.execute(f"DROP INDEX IF EXISTS idx_{table}_{index}")
+            await conn.execute(f"UPDATE {old} SET inserted = CURRENT_TIMESTAMP WHERE inserted IS NULL")
+            await conn.execute(
+                f"""CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS,
+                        PRIMARY KEY (id, inserted),
+                        FOREIGN KEY (ticker) REFERENCES tickers (ticker))
+                    PARTITION BY RANGE (inserted)""")
+            await conn.execute(f"ALTER TABLE {table} ALTER COLUMN inserted SET NOT NULL")
+            for statement in index_statements(table):
+                await conn.execute(statement)
+            await conn.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+            first, last = await conn.fetchrow(f"SELECT MIN(inserted), MAX(inserted) FROM {old}")
+            month = month_start(first) if first else None
+            while month and month <= month_start(last):
+                start, end = month, next_month(month)
+                await conn.execute(
+                    f"""CREATE TABLE {partition_name(table, month)} PARTITION OF {table}
+                        FOR VALUES FROM ('{start}') TO ('{end}')""")
+                month = end
+            await conn.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+            if sequence:
+                # The id sequence belongs to the old table, keep it for the new one
+                await conn.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+            await conn.execute(f"DROP TABLE {old}")
+    print(f"Partitioned {table}")
+    return True
+
+
+async def partitions(db:Database, table:str) -> List[tuple]:
+    """Monthly partitions of `table` as (month, name), oldest first"""
+    rows = await db.fetch(
+        """SELECT c.relname AS name FROM pg_inherits i
+           JOIN pg_class c ON c.oid = i.inhrelid
+           WHERE i.inhparent = to_regclass($1)""", table) or []
+    prefix = f"{table}_p"
+    months = []
+    for row in rows:
+        suffix = row['name'].removeprefix(prefix)
+        if suffix != row['name'] and suffix.isdigit():
+            months.append((date(int(suffix[:4]), int(suffix[4:]), 1), row['name']))
+    return sorted(months)
+
+
+async def apply_retention(db:Database, table:str, keep_months:int, drop:bool=False) -> List[str]:
+    """Detach (or drop) partitions entirely older than `keep_months` months
+
+    Detached partitions stay as plain tables, e.g. to archive with pg_dump, and no
+    longer slow down queries on the parent.
+
+    Returns:
+        list: Names of the partitions detached
+    """
+    cutoff = month_start(date.today())
+    for _ in range(keep_months):
+        cutoff = date(cutoff.year - (cutoff.month == 1), (cutoff.month - 2) % 12 + 1, 1)
+    detached = []
+    for month, name in await partitions(db, table):
+        if next_month(month) > cutoff:
+            break
+        await db.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+        if drop:
+            await db.execute(f"DROP TABLE {name}")
+        detached.append(name)
+        print(f"{'Dropped' if drop else 'Detached'} partition {name}")
+    return detached
+
+
+async def maintain(db:Database, months_ahead:int=2, keep_months:int=None, drop:bool=False):
+    """Migrate, create upcoming partitions and apply retention for every partitioned table"""
+    for table in PARTITIONED:
+        await migrate(db, table)
+        await ensure_partitions(db, table, months_ahead=months_ahead)
+        if keep_months:
+            await apply_retention(db, table, keep_months, drop)
@@ -0,0 +1,322 @@
+import asyncio
+import time
+from functools import partial
+from datetime import date
+from typing import AsyncIterable, Awaitable, Callable, Dict, Iterable, Union
+from bulk_writer import BulkWriter, MultiWriter
+from sinks import PostgresSink
+from change_detection import ChangeDetector
+from metrics import registry
+from partitions import PARTITIONED, ensure_current
+
+# main.py action -> (Scarper dataset, target table)
+ACTIONS = {
+    'tickers': ('info', 'tickers'),
+    'metadata': ('metadata', 'metadata'),
+    'dividends': ('dividends', 'dividends'),
+    'institutionals': ('institutionals', 'institutional_holdings'),
+}
+# Datasets `engine='vector'` cleans in batches, the one-record-per-ticker ones parse faster field by field
+VECTOR_DATASETS = ('dividends',)
+# Append-only snapshot tables, where skipping unchanged records saves rows
+SNAPSHOT_TABLES = ('metadata', 'institutional_holdings')
+# Latest stored ex_date of every ticker, each one an index-only lookup on unique_dividend_key
+LATEST_EX_DATES = """SELECT t.ticker, d.ex_date FROM tickers t
+    CROSS JOIN LATERAL (SELECT MAX(ex_date) AS ex_date FROM dividends WHERE ticker = t.ticker) d
+    WHERE d.ex_date IS NOT NULL"""
+
+_STOP = object()
+
+
+class StageStats:
+    """Items processed and time spent by one pipeline stage"""
+    __slots__ = ('name', 'items', 'busy')
+
+    def __init__(self, name:str) -> None:
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+
+    def rate(self, elapsed:float) -> float:
+        return self.items / elapsed if elapsed else 0.0
+
+
+class Pipeline:
+    """Staged producer/consumer pipeline: source -> fetch -> parse -> writer
+
+    Stages are connected by bounded queues, a full queue blocks the stage
+    feeding it so memory stays flat however many tickers the source yields.
+
+    Args:
+        source (Iterable): Tickers to process, sync or async iterable
+        fetch (Callable): `async fetch(ticker) -> raw`, raising marks the ticker failed
+        parse (Callable): `parse(ticker, raw) -> iterable of row tuples`, raising marks the ticker failed
+        writer (BulkWriter): Batching DB writer receiving the rows
+        fetch_workers (int): Concurrent fetch tasks
+        queue_size (int): Max items waiting between two stages
+        report_every (float): Seconds between progress reports, 0 disables them
+        parse_batch (Callable): Replaces `parse`, `parse_batch([(ticker, raw), ...]) -> [(ticker, rows), ...]`
+            where rows may be an exception marking the ticker failed
+        parse_batch_size (int): Max raw items handed to `parse_batch` at once
+        name (str): Dataset label of the parse metrics
+    """
+    def __init__(self, source:Union[Iterable, AsyncIterable], fetch:Callable[[str], Awaitable],
+                 parse:Callable, writer:BulkWriter, fetch_workers:int=10, queue_size:int=100,
+                 report_every:float=10.0, parse_batch:Callable=None, parse_batch_size:int=100,
+                 name:str='') -> None:
+        self.source = source
+        self.fetch = fetch
+        self.parse = parse
+        self.parse_batch = parse_batch
+        self.parse_batch_size = parse_batch_size if parse_batch else 1
+        self.writer = writer
+        self.name = name
+        self.fetch_workers = fetch_workers
+        self.report_every = report_every
+        self.tickers = asyncio.Queue(queue_size)
+        self.raw = asyncio.Queue(queue_size)
+        self.rows = asyncio.Queue(queue_size)
+        self.stats = {name: StageStats(name) for name in ('source', 'fetch', 'parse', 'write')}
+        self.started = None
+
+    async def _source(self):
+        if hasattr(self.source, '__aiter__'):
+            async for ticker in self.source:
+                await self.tickers.put(ticker)
+                self.stats['source'].items += 1
+        else:
+            for ticker in self.source:
+                await self.tickers.put(ticker)
+                self.stats['source'].items += 1
+        for _ in range(self.fetch_workers):
+            await self.tickers.put(_STOP)
+
+    async def _fetch_all(self):
+        await asyncio.gather(self._source(), *(self._fetch() for _ in range(self.fetch_workers)))
+        await self.raw.put(_STOP)
+
+    async def _fetch(self):
+        stats = self.stats['fetch']
+        while (ticker := await self.tickers.get()) is not _STOP:
+            start = time.perf_counter()
+            try:
+                raw = await self.fetch(ticker)
+            except Exception as e:
+                raw = e
+            stats.busy += time.perf_counter() - start
+            stats.items += 1
+            await self.raw.put((ticker, raw))
+
+    def _parse_items(self, items:list) -> list:
+        failed = [(ticker, raw) for ticker, raw in items if isinstance(raw, Exception)]
+        items = [(ticker, raw) for ticker, raw in items if not isinstance(raw, Exception)]
+        if self.parse_batch:
+            return failed + self.parse_batch(items)
+        parsed = failed
+        for ticker, raw in items:
+            try:
+                parsed.append((ticker, list(self.parse(ticker, raw))))
+            except Exception as e:
+                parsed.append((ticker, e))
+        return parsed
+
+    async def _parse(self):
+        stats = self.stats['parse']
+        stopped = False
+        while not stopped:
+            # Take whatever is already queued, up to a batch
+            items = [await self.raw.get()]
+            while len(items) < self.parse_batch_size and not self.raw.empty():
+                items.append(self.raw.get_nowait())
+            if items[-1] is _STOP:
+                stopped = True
+                items.pop()
+            start = time.perf_counter()
+            parsed = self._parse_items(items) if items else []
+            elapsed = time.perf_counter() - start
+            stats.busy += elapsed
+            stats.items += len(items)
+            if items:
+                registry.observe('nsdq_parse_seconds', elapsed, dataset=self.name)
+                registry.inc('nsdq_parsed_records_total',
+                             sum(len(rows) for _, rows in parsed if not isinstance(rows, Exception)),
+                             dataset=self.name)
+            for ticker, rows in parsed:
+                if isinstance(rows, Exception):
+                    await self.writer.ticker_failed(ticker, str(rows) or type(rows).__name__,
+                                                    getattr(rows, 'kind', 'parse'))
+                else:
+                    await self.rows.put((ticker, rows))
+        await self.rows.put(_STOP)
+
+    async def _write(self):
+        stats = self.stats['write']
+        while (item := await self.rows.get()) is not _STOP:
+            ticker, rows = item
+            start = time.perf_counter()
+            await self.writer.add_ticker(ticker, rows)
+            stats.busy += time.perf_counter() - start
+            stats.items += len(rows)
+        await self.writer.flush()
+
+    def report(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        queues = f"queues tickers={self.tickers.qsize()} raw={self.raw.qsize()} rows={self.rows.qsize()}"
+        rates = ' '.join(f"{s.name}={s.items}({s.rate(elapsed):.1f}/s)" for s in self.stats.values())
+        return f"[{elapsed:7.1f}s] {queues} | {rates}"
+
+    async def _reporter(self):
+        while True:
+            await asyncio.sleep(self.report_every)
+            print(self.report())
+
+    async def run(self) -> dict:
+        """Run every stage to completion, returns per-stage stats"""
+        self.started = time.perf_counter()
+        reporter = asyncio.create_task(self._reporter()) if self.report_every else None
+        tasks = [asyncio.create_task(stage()) for stage in (self._fetch_all, self._parse, self._write)]
+        try:
+            # A failing stage must not leave the others blocked on a full queue
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if reporter:
+                reporter.cancel()
+        print(self.report())
+        return self.stats
+
+
+async def latest_ex_dates(db, tickers:list=None) -> Dict[str, date]:
+    """Latest stored dividend ex_date per ticker, of `tickers` only if a list, in one query"""
+    if isinstance(tickers, list):
+        rows = await db.fetch(LATEST_EX_DATES + " AND t.ticker = ANY($1::text[])", tickers)
+    else:
+        rows = await db.fetch(LATEST_EX_DATES)
+    rows = rows or []
+    return {row['ticker']: row['ex_date'] for row in rows}
+
+
+async def scrape_tickers(db, scraper, dataset:str, table:str, tickers, batch_size:int=1000,
+                         ledger=None, skip_unchanged:bool=False, engine:str='python',
+                         on_conflict:str=None, sink=None, incremental:bool=False) -> BulkWriter:
+    """Stream `tickers` through fetch -> parse -> bulk write for one Scarper dataset
+
+    With `skip_unchanged`, tickers whose rows match the last written fingerprint are not written.
+    `engine` is 'python' for the per-field Scarper cleaners or 'vector' for batched polars cleaning
+    of the VECTOR_DATASETS, the others stay per-field.
+    `on_conflict` overrides the table's conflict clause of the writer.
+    `sink` defaults to Postgres through `db`, a ParquetSink writes files instead and needs no `db`.
+    With `incremental`, dividends are parsed and written only past the latest stored ex_date of the ticker.
+    """
+    sink = sink or PostgresSink(db)
+    if sink.db and table in PARTITIONED:
+        await ensure_current(db, table)
+    changes = None
+    if skip_unchanged and sink.db:
+        changes = ChangeDetector(db, table)
+        await changes.load(tickers if isinstance(tickers, list) else None)
+    since = {}
+    if incremental and sink.db and dataset == 'dividends':
+        since = await latest_ex_dates(db, tickers)
+
+    def parse(ticker, raw):
+        return scraper.parse(dataset, ticker, raw, since.get(ticker))
+
+    parse_batch = None
+    if engine == 'vector' and dataset in VECTOR_DATASETS:
+        # Imports polars, only when asked for
+        from vector_clean import VectorCleaner
+        cleaner = VectorCleaner()
+
+        def parse_batch(items):
+            return cleaner.parse_batch(dataset, items, since)
+
+    writer = sink.writer(table, batch_size, ledger, changes, on_conflict)
+    pipeline = Pipeline(tickers, partial(scraper.fetch_raw, dataset, strict=True), parse, writer,
+                        fetch_workers=scraper.scheduler.max_in_flight, parse_batch=parse_batch, name=dataset)
+    await pipeline.run()
+    return writer
+
+
+async def scrape_all(db, scraper, tickers, batch_size:int=1000, ledger=None, skip_unchanged:bool=False,
+                     engine:str='python', sink=None, incremental:bool=False) -> MultiWriter:
+    """Stream `tickers` once, fetching every dataset of a ticker concurrently
+
+    Rows of all datasets go through one MultiWriter, so each flush is one transaction
+    over every table. A ticker with a failed dataset keeps the rows of the others and
+    is marked failed. `sink` and `incremental` as in `scrape_tickers`.
+    """
+    sink = sink or PostgresSink(db)
+    datasets = list(ACTIONS.values())
+    for _, table in datasets:
+        if sink.db and table in PARTITIONED:
+            await ensure_current(db, table)
+    changes = {}
+    if skip_unchanged and sink.db:
+        for _, table in datasets:
+            if table in SNAPSHOT_TABLES:
+                changes[table] = ChangeDetector(db, table)
+                await changes[table].load(tickers if isinstance(tickers, list) else None)
+    since = await latest_ex_dates(db, tickers) if incremental and sink.db else {}
+
+    async def fetch(ticker):
+        raw = await asyncio.gather(*(scraper.fetch_raw(dataset, ticker, strict=True) for dataset, _ in datasets),
+                                   return_exceptions=True)
+        if all(isinstance(data, Exception) for data in raw):
+            raise raw[0]
+        return raw
+
+    def parse_dataset(dataset, ticker, data):
+        # Records of one dataset or its error, the other datasets of the ticker are still written
+        try:
+            return scraper.parse(dataset, ticker, data, since.get(ticker) if dataset == 'dividends' else None)
+        except Exception as e:
+            return e
+
+    def parse(ticker, raw):
+        rows = []
+        for (dataset, table), data in zip(datasets, raw):
+            if not isinstance(data, Exception):
+                data = parse_dataset(dataset, ticker, data)
+            if isinstance(data, Exception):
+                rows.append((None, data))
+            else:
+                rows.extend((table, record) for record in data)
+        return rows
+
+    parse_batch = None
+    if engine == 'vector':
+        # Imports polars, only when asked for
+        from vector_clean import VectorCleaner
+        cleaner = VectorCleaner()
+
+        def parse_batch(items):
+            # Rows per item in item order, a ticker queued twice is parsed twice like with `parse`
+            parsed = [[] for _ in items]
+            for i, (dataset, table) in enumerate(datasets):
+                ok = []
+                for j, (ticker, raw) in enumerate(items):
+                    if isinstance(raw[i], Exception):
+                        parsed[j].append((None, raw[i]))
+                    else:
+                        ok.append(j)
+                batch = [(items[j][0], items[j][1][i]) for j in ok]
+                if dataset in VECTOR_DATASETS:
+                    results = cleaner.parse_batch(dataset, batch, since if dataset == 'dividends' else None)
+                else:
+                    results = [(ticker, parse_dataset(dataset, ticker, data)) for ticker, data in batch]
+                for j, (_, rows) in zip(ok, results):
+                    if isinstance(rows, Exception):
+                        parsed[j].append((None, rows))
+                    else:
+                        parsed[j].extend((table, row) for row in rows)
+            return [(ticker, rows) for (ticker, _), rows in zip(items, parsed)]
+
+    writer = sink.multi_writer(tuple(table for _, table in datasets), batch_size, ledger, changes)
+    pipeline = Pipeline(tickers, fetch, parse, writer, fetch_workers=scraper.scheduler.max_in_flight,
+                        parse_batch=parse_batch, name='all')
+    await pipeline.run()
+    return writer
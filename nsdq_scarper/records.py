@@ -0,0 +1,61 @@
+from operator import itemgetter
+
+
+class Record(tuple):
+    """Scraped row as a plain tuple in the insert column order of its table
+
+    Built like a tuple, `DividendRecord((ticker, ex_date, ...))`, at the same speed and
+    memory: the subclass has no instance attributes, so rows go to COPY, the change
+    fingerprints and parquet as they are. Fields also read by name, `row.ex_date`, or
+    `getattr(row, 'yield')` for keywords.
+    """
+    __slots__ = ()
+    columns: tuple = ()
+
+    def as_dict(self) -> dict:
+        return dict(zip(self.columns, self))
+
+
+def record_type(name:str, columns:tuple) -> type:
+    """Record subclass with `columns` and a read-only property per column"""
+    namespace = {'__slots__': (), 'columns': columns}
+    for i, col in enumerate(columns):
+        namespace[col] = property(itemgetter(i), doc=col)
+    return type(name, (Record,), namespace)
+
+
+InfoRecord = record_type('InfoRecord', (
+    'ticker', 'company_name', 'stock_type', 'exchange', 'asset_class',
+    'is_nasdaq_listed', 'is_nasdaq100', 'is_held'))
+
+MetadataRecord = record_type('MetadataRecord', (
+    'ticker', 'exchange', 'sector', 'industry', 'one_yr_target', 'today_high_low',
+    'share_volume', 'average_volume', 'previous_close', 'fiftytwo_week_high_low',
+    'market_cap', 'pe_ratio', 'forward_pe_1yr', 'earnings_per_share',
+    'annualized_dividend', 'ex_dividend_date', 'dividend_payment_date', 'yield',
+    'special_dividend_date', 'special_dividend_amount', 'special_dividend_payment_date'))
+
+DividendRecord = record_type('DividendRecord', (
+    'ticker', 'ex_date', 'payment_type', 'amount', 'declaration_date',
+    'record_date', 'payment_date', 'currency'))
+
+InstitutionalRecord = record_type('InstitutionalRecord', (
+    'ticker', 'shares_outstanding_pct', 'shares_outstanding_total', 'total_holdings_value',
+    'increased_positions_holders', 'increased_positions_shares',
+    'decreased_positions_holders', 'decreased_positions_shares',
+    'held_positions_holders', 'held_positions_shares',
+    'total_positions_holders', 'total_positions_shares',
+    'new_positions_holders', 'new_positions_shares',
+    'sold_out_positions_holders', 'sold_out_positions_shares'))
+
+HolderRecord = record_type('HolderRecord', (
+    'ticker', 'holder', 'date', 'shares', 'shares_change', 'shares_change_pct', 'value'))
+
+# Record type of each Scarper dataset
+RECORDS = {
+    'info': InfoRecord,
+    'metadata': MetadataRecord,
+    'dividends': DividendRecord,
+    'institutionals': InstitutionalRecord,
+    'holders': HolderRecord,
+}
@@ -0,0 +1,211 @@
+import asyncio
+import csv
+import random
+import time
+from collections import Counter, OrderedDict
+from typing import NamedTuple, Optional
+import httpx
+
+# Error kinds, transient ones are retried
+TRANSIENT = ('throttled', 'server', 'timeout', 'transport')
+# Kinds meaning the upstream is overloaded, they trip the circuit breaker
+THROTTLING = ('throttled', 'server', 'timeout')
+
+
+class FetchError(Exception):
+    """A failed request, classified by `kind`
+
+    Kinds: 'throttled' (429), 'server' (5xx), 'timeout', 'transport' (connection errors),
+    'not_found' (404), 'client' (other 4xx), 'malformed' (body is not JSON),
+    'cache_miss' (not in the replay cache)
+    """
+    def __init__(self, kind:str, message:str='', status:int=None, retry_after:float=None) -> None:
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+        self.retry_after = retry_after
+        self.attempts = 1
+
+    @property
+    def transient(self) -> bool:
+        return self.kind in TRANSIENT
+
+    @property
+    def throttling(self) -> bool:
+        return self.kind in THROTTLING
+
+    def __str__(self) -> str:
+        status = f" ({self.status})" if self.status else ''
+        attempts = f" after {self.attempts} attempts" if self.attempts > 1 else ''
+        message = f": {self.args[0]}" if self.args and self.args[0] else ''
+        return f"{self.kind}{status}{attempts}{message}"
+
+
+def classify_response(response:httpx.Response) -> Optional[FetchError]:
+    """FetchError for an unsuccessful response, None if it succeeded"""
+    status = response.status_code
+    if status < 400:
+        return None
+    if status == 429:
+        return FetchError('throttled', status=status, retry_after=retry_after(response))
+    if status >= 500:
+        return FetchError('server', status=status, retry_after=retry_after(response))
+    if status == 404:
+        return FetchError('not_found', status=status)
+    return FetchError('client', status=status)
+
+
+def classify_exception(e:Exception) -> FetchError:
+    """FetchError for an exception raised while sending a request"""
+    if isinstance(e, FetchError):
+        return e
+    if isinstance(e, httpx.TimeoutException):
+        return FetchError('timeout', type(e).__name__)
+    if isinstance(e, httpx.TransportError):
+        return FetchError('transport', f"{type(e).__name__}: {e}")
+    if isinstance(e, ValueError):
+        return FetchError('malformed', str(e))
+    return FetchError('transport', f"{type(e).__name__}: {e}")
+
+
+def retry_after(response:httpx.Response) -> Optional[float]:
+    """Seconds of a numeric Retry-After header"""
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Jittered exponential backoff for transient errors
+
+    Args:
+        attempts (int): Tries per request, 1 disables retries
+        base (float): Delay cap in seconds of the first retry, doubled every retry
+        cap (float): Max delay in seconds
+    """
+    def __init__(self, attempts:int=4, base:float=0.5, cap:float=30.0) -> None:
+        if attempts < 1:
+            raise ValueError(f"attempts counts the first try, it must be at least 1, got {attempts}")
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt:int, retry_after:float=None) -> float:
+        """Seconds to wait after failed `attempt`, full jitter, never before Retry-After"""
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+        return max(delay, min(retry_after or 0.0, self.cap))
+
+
+class CircuitBreaker:
+    """Pauses all traffic to an endpoint while the upstream is throttling
+
+    After `threshold` consecutive throttling failures the circuit opens and every
+    request waits `cooldown` seconds. Then a single probe request goes through: a
+    usable response closes the circuit, another throttling failure reopens it for
+    twice as long and any other failure hands the probe to the next request.
+
+    Args:
+        name (str): Endpoint name used in messages
+        threshold (int): Consecutive throttling failures opening the circuit
+        cooldown (float): Seconds the circuit first stays open
+        max_cooldown (float): Longest open period
+    """
+    def __init__(self, name:str, threshold:int=5, cooldown:float=30.0, max_cooldown:float=600.0) -> None:
+        self.name = name
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.opened = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self.failures >= self.threshold
+
+    async def wait(self):
+        """Return once a request may be sent"""
+        while True:
+            delay = self.open_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif not self.is_open:
+                return
+            elif not self.probing:
+                self.probing = True
+                return
+            else:
+                # Half open, wait for the probe
+                await asyncio.sleep(min(1.0, self.base_cooldown))
+
+    def success(self):
+        """The upstream answered with a usable response"""
+        if self.is_open:
+            print(f"Circuit '{self.name}' closed")
+        self.failures = 0
+        self.probing = False
+        self.cooldown = self.base_cooldown
+
+    def inconclusive(self):
+        """A failure other than throttling, only lets the next probe through"""
+        self.probing = False
+
+    def failure(self, retry_after:float=None):
+        """A throttling failure"""
+        self.failures += 1
+        # Requests already in flight when the circuit opened do not extend the pause
+        if not self.is_open or time.monotonic() < self.open_until:
+            return
+        self.probing = False
+        pause = max(self.cooldown, retry_after or 0.0)
+        self.open_until = time.monotonic() + pause
+        self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+        self.opened += 1
+        print(f"Circuit '{self.name}' open, pausing {pause:.1f}s")
+
+
+class Failure(NamedTuple):
+    ticker: str
+    dataset: str
+    kind: str
+    status: Optional[int]
+    message: str
+    attempts: int
+    at: float
+
+
+class FailureLog:
+    """Latest failure per ticker and counts per kind, bounded to `max_tickers` entries
+
+    Args:
+        max_tickers (int): Failures kept, the oldest are dropped first
+    """
+    def __init__(self, max_tickers:int=10000) -> None:
+        self.max_tickers = max_tickers
+        self.latest = OrderedDict()
+        self.counts = Counter()
+
+    def record(self, ticker:str, dataset:str, kind:str, message:str='', status:int=None, attempts:int=1):
+        self.counts[kind] += 1
+        self.latest[(ticker, dataset)] = Failure(ticker, dataset, kind, status, message, attempts, time.time())
+        self.latest.move_to_end((ticker, dataset))
+        while len(self.latest) > self.max_tickers:
+            self.latest.popitem(last=False)
+
+    def record_error(self, ticker:str, dataset:str, error:FetchError):
+        self.record(ticker, dataset, error.kind, error.args[0] if error.args else '', error.status, error.attempts)
+
+    def __len__(self) -> int:
+        return len(self.latest)
+
+    def summary(self) -> str:
+        return ', '.join(f"{n} {kind}" for kind, n in self.counts.most_common())
+
+    def to_csv(self, file_name:str):
+        with open(file_name, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(Failure._fields)
+            writer.writerows(self.latest.values())
@@ -1,8 +1,25 @@
 import httpx
 import asyncio
+import json
+import time
 from typing import List
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
+from scheduler import AdaptiveScheduler
+from cache import ResponseCache
+from metrics import Metrics, registry
+from records import DividendRecord, HolderRecord, InfoRecord, InstitutionalRecord, MetadataRecord, Record
+from resilience import (CircuitBreaker, FailureLog, FetchError, RetryPolicy,
+                        classify_exception, classify_response)
+
+def ticker_list(tickers) -> List[str]:
+    """Symbols of a polars Series or DataFrame `ticker` column, a list of str or of `{"ticker": ...}` rows"""
+    if hasattr(tickers, 'get_column'):
+        tickers = tickers.get_column('ticker')
+    if hasattr(tickers, 'to_list'):
+        return tickers.to_list()
+    return [ticker['ticker'] if isinstance(ticker, dict) else ticker for ticker in tickers]
+
 
 class Scarper:
     BASE_URL = "https://api.nasdaq.com/api/"
@@ -11,28 +28,146 @@ class Scarper:
         "Content-Type":"application/json",
         "Accept": "application/json",
     }
-    INVALID_TICKERS = []
+    ENDPOINTS = {
+        'info': "/quote/{ticker}/info?assetclass=stocks",
+        'metadata': "/quote/{ticker}/summary?assetclass=stocks",
+        'dividends': "/quote/{ticker}/dividends?assetclass=stocks",
+        'institutionals': "/company/{ticker}/institutional-holdings?limit=10&type=TOTAL&sortColumn=marketValue",
+        # One page of the holder list, newest filings first
+        'holders': ("/company/{ticker}/institutional-holdings?limit={limit}&offset={offset}"
+                    "&type=TOTAL&sortColumn=date&sortOrder=DESC"),
+    }
 
-    async def get_json_from_page(self, client: httpx.AsyncClient, url: str) -> dict:
-        """Fetch and return JSON from a page"""
-        try:
-            response = await client.get(url)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            return []
-            # There are no etf in tickers XD
-            
-            # fallback_url = url.replace('=stocks', '=etf')
-            # try:
-            #         print(f'Trying fallback URL: {fallback_url}')
-            #         response = await client.get(fallback_url)
-            #         response.raise_for_status()
-            #         return response.json()
-            # except Exception as fallback_e:
-            #     print(f'Error fetching fallback URL {fallback_url}: {str(fallback_e)}')
-        # return []
+    def __init__(self, max_connections:int=100, max_keepalive_connections:int=20,
+                 keepalive_expiry:float=30.0, http2:bool=False, base_url:str=None,
+                 scheduler:AdaptiveScheduler=None, cache:ResponseCache=None, retry:RetryPolicy=None,
+                 breaker_threshold:int=5, breaker_cooldown:float=30.0, metrics:Metrics=None) -> None:
+        """One pooled client shared by every fetcher
+
+        Args:
+            max_connections (int): Max open connections in the pool
+            max_keepalive_connections (int): Idle connections kept alive for reuse
+            keepalive_expiry (float): Seconds an idle connection is kept open
+            http2 (bool): Multiplex requests over HTTP/2 (needs `pip install httpx[http2]`)
+            base_url (str): Override BASE_URL, e.g. a local stand-in server
+            scheduler (AdaptiveScheduler): Rate/concurrency limiter wrapped around every request
+            cache (ResponseCache): On-disk response cache, in replay mode no request is sent
+            retry (RetryPolicy): Retries of transient failures (429, 5xx, timeouts, connection errors)
+            breaker_threshold (int): Consecutive throttling failures pausing an endpoint
+            breaker_cooldown (float): Seconds an endpoint is first paused
+            metrics (Metrics): Request latency, bytes, status and cache metrics, the process registry by default
+        """
+        if base_url:
+            self.BASE_URL = base_url
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self.scheduler = scheduler or AdaptiveScheduler()
+        self.cache = cache
+        self.retry = retry or RetryPolicy()
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.breakers = {}
+        self.failures = FailureLog()
+        self.metrics = metrics or registry
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Lazily create the shared client so it binds to the running event loop"""
+        if self._client is None or self._client.is_closed:
+            http2 = self.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    print("Warning: 'h2' not installed, falling back to HTTP/1.1")
+                    http2 = False
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(10.0, read=20.0),
+                headers=self.HEADERS,
+                follow_redirects=True,
+                limits=self.limits,
+                http2=http2,
+            )
+        return self._client
 
+    async def close(self):
+        """Close the shared client and its pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def breaker(self, dataset:str) -> CircuitBreaker:
+        """Circuit breaker of an endpoint"""
+        if dataset not in self.breakers:
+            self.breakers[dataset] = CircuitBreaker(dataset or 'default', self.breaker_threshold,
+                                                    self.breaker_cooldown)
+        return self.breakers[dataset]
+
+    async def request_json(self, url:str, dataset:str=None, ticker:str=None) -> dict:
+        """Fetch JSON through the response cache, retrying transient failures
+
+        Raises:
+            FetchError: Classified failure, also recorded in `failures`
+        """
+        # Keyed without the host so a cache works against any BASE_URL
+        key = url.removeprefix(self.BASE_URL)
+        endpoint = dataset or 'other'
+        if self.cache:
+            body = self.cache.get(key, dataset)
+            if body is not None:
+                self.metrics.inc('nsdq_cache_hits_total', endpoint=endpoint)
+                return json.loads(body)
+            if self.cache.replay:
+                error = FetchError('cache_miss', key)
+                self.failures.record_error(ticker or key, dataset, error)
+                raise error
+        breaker = self.breaker(dataset)
+        for attempt in range(1, self.retry.attempts + 1):
+            await breaker.wait()
+            start = time.perf_counter()
+            try:
+                async with self.scheduler.slot() as slot:
+                    response = await self.client.get(url)
+                    slot.status = response.status_code
+                self.metrics.observe('nsdq_request_seconds', time.perf_counter() - start, endpoint=endpoint)
+                self.metrics.inc('nsdq_responses_total', endpoint=endpoint, status=response.status_code)
+                self.metrics.inc('nsdq_response_bytes_total', len(response.content), endpoint=endpoint)
+                error = classify_response(response)
+                if error is None:
+                    data = response.json()
+            except Exception as e:
+                error = classify_exception(e)
+                self.metrics.inc('nsdq_responses_total', endpoint=endpoint, status=error.kind)
+            if error is None:
+                breaker.success()
+                # Out of the try, a failing cache write is not a failed request to retry
+                if self.cache:
+                    self.cache.put(key, response.content)
+                return data
+            error.attempts = attempt
+            if error.throttling:
+                breaker.failure(error.retry_after)
+            else:
+                # Says nothing about throttling, keeps the count of consecutive ones
+                breaker.inconclusive()
+            if not error.transient or attempt == self.retry.attempts:
+                break
+            self.metrics.inc('nsdq_retries_total', endpoint=endpoint, kind=error.kind)
+            await asyncio.sleep(self.retry.delay(attempt, error.retry_after))
+        self.metrics.inc('nsdq_failures_total', endpoint=endpoint, kind=error.kind)
+        self.failures.record_error(ticker or key, dataset, error)
+        raise error
 
     def clean_str(self, val:str):
         """Cleans string if empty
@@ -89,214 +224,248 @@ class Scarper:
     
     
     
+    def url(self, dataset:str, ticker:str, **params) -> str:
+        """Endpoint url of a dataset (one of ENDPOINTS) for a ticker, `params` fill the others placeholders"""
+        return f"{self.BASE_URL}{self.ENDPOINTS[dataset].format(ticker=ticker, **params)}"
+
+    async def fetch_raw(self, dataset:str, ticker:str, strict:bool=False, **params) -> dict:
+        """Fetch the unparsed JSON of a dataset for a ticker, [] on failure or with `strict` raise FetchError"""
+        try:
+            return await self.request_json(self.url(dataset, ticker, **params), dataset, ticker)
+        except FetchError:
+            if strict:
+                raise
+            return []
+
+    def parse(self, dataset:str, ticker:str, data:dict, since:date=None) -> list:
+        """Parse raw JSON of a dataset into a list of records, `since` as in `parse_dividends`"""
+        parse = getattr(self, f'parse_{dataset}')
+        parsed = parse(ticker, data, since) if since else parse(ticker, data)
+        if isinstance(parsed, Record):
+            return [parsed]
+        return parsed
+
     async def fetch_dividends(self, ticker: str):
         """Scarpe dividends"""
-        url = f"{self.BASE_URL}/quote/{ticker}/dividends?assetclass=stocks"
-        # print(url)
-        async with httpx.AsyncClient(
-            timeout=httpx.Timeout(10.0, read=20.0),
-            headers=self.HEADERS,
-            follow_redirects=True,
-        ) as client:
-            dividends = await self.get_json_from_page(client, url)
-            records = []
+        return self.parse_dividends(ticker, await self.fetch_raw('dividends', ticker))
+
+    def parse_dividends(self, ticker:str, dividends:dict, since:date=None):
+        """Dividend records, newest first. With `since`, the latest stored ex_date of the ticker,
+        parsing stops at the first row on or before it or without an ex_date"""
+        records = []
  
-            if not dividends:
-                return []
+        if not dividends:
+            return []
             
-            if not dividends.get('data') or not dividends['data'].get('dividends') or not dividends['data']['dividends'].get('rows'):
-                print(f"No dividend data found for {ticker}")
-                self.INVALID_TICKERS.append(ticker)
-                return []
+        if not dividends.get('data') or not dividends['data'].get('dividends') or not dividends['data']['dividends'].get('rows'):
+            print(f"No dividend data found for {ticker}")
+            self.failures.record(ticker, 'dividends', 'no_data')
+            return []
             
-            for dividend in dividends['data']['dividends']['rows']:
-                try:
-                    records.append({
-                        'ticker':ticker,
-                        'ex_date':self.clean_date(dividend.get('exOrEffDate', '')),
-                        'payment_type':self.clean_str(dividend.get('type', '')),
-                        'amount':self.clean_number_str(dividend.get('amount', '')),
-                        'declaration_date':self.clean_date(dividend.get('declarationDate', '')),
-                        'record_date':self.clean_date(dividend.get('recordDate', '')),
-                        'payment_date':self.clean_date(dividend.get('paymentDate', '')),
-                        'currency':self.clean_str(dividend.get('currency', '')),
-                    })
-                except Exception as e:
-                    print(f"Error processing dividend data: {str(e)}")
-                    self.INVALID_TICKERS.append(ticker)
-                    continue
-            return records
+        for dividend in dividends['data']['dividends']['rows']:
+            try:
+                ex_date = self.clean_date(dividend.get('exOrEffDate', ''))
+                if since and (ex_date is None or ex_date.date() <= since):
+                    # Rows come newest first, the rest is stored already. A row without
+                    # ex_date cannot be placed, `--full_dividends` picks it up
+                    break
+                records.append(DividendRecord((
+                    ticker,
+                    ex_date,
+                    self.clean_str(dividend.get('type', '')),
+                    self.clean_number_str(dividend.get('amount', '')),
+                    self.clean_date(dividend.get('declarationDate', '')),
+                    self.clean_date(dividend.get('recordDate', '')),
+                    self.clean_date(dividend.get('paymentDate', '')),
+                    self.clean_str(dividend.get('currency', '')),
+                )))
+            except Exception as e:
+                print(f"Error processing dividend data: {str(e)}")
+                self.failures.record(ticker, 'dividends', 'parse', str(e))
+                continue
+        return records
     
     async def fetch_metadata(self,ticker: str):
+        return self.parse_metadata(ticker, await self.fetch_raw('metadata', ticker))
+
+    def parse_metadata(self, ticker:str, metadata:dict):
         try:
-            url = f"{self.BASE_URL}/quote/{ticker}/summary?assetclass=stocks"
-            async with httpx.AsyncClient(
-                timeout=httpx.Timeout(10.0, read=20.0),
-                headers=self.HEADERS,
-                follow_redirects=True,
-            ) as client:
-                metadata = await self.get_json_from_page(client, url)
-                if not metadata:
-                    return []
-                if not metadata.get('data'):
-                    print(f'No metadata por ticker {ticker}')
-                    return []
-                summary_data = metadata.get('data', {}).get('summaryData', {})
-                if not summary_data:
-                    print(f'No summary data por ticker {ticker}')
-                    return []
-                record = {
-                    'ticker':ticker,
-                    'exchange':self.clean_str(summary_data.get('Exchange', {}).get('value', '')),
-                    'sector':self.clean_str(summary_data.get('Sector', {}).get('value', '')),
-                    'industry':self.clean_str(summary_data.get('Industry', {}).get('value', '')),
-                    'one_yr_target':self.clean_number_str(summary_data.get('OneYrTarget', {}).get('value', '')),
-                    'today_high_low':self.clean_str(summary_data.get('TodayHighLow', {}).get('value', '')),
-                    'share_volume':self.clean_number_str(summary_data.get('ShareVolume', {}).get('value', '')),
-                    'average_volume':self.clean_number_str(summary_data.get('AverageVolume', {}).get('value', '')),
-                    'previous_close':self.clean_number_str(summary_data.get('PreviousClose', {}).get('value', '')),
-                    'fiftytwo_week_high_low':self.clean_str(summary_data.get('FiftTwoWeekHighLow', {}).get('value', '')),
-                    'market_cap':self.clean_number_str(summary_data.get('MarketCap', {}).get('value', '')),
-                    'pe_ratio':self.clean_number_str(str(summary_data.get('PERatio', {}).get('value', ''))),
-                    'forward_pe_1yr':self.clean_number_str(summary_data.get('ForwardPE1Yr', {}).get('value', '')),
-                    'earnings_per_share':self.clean_number_str(summary_data.get('AnnualizedDividend', {}).get('value', '')),
-                    'annualized_dividend':self.clean_number_str(summary_data.get('AnnualizedDividend', {}).get('value', '')),
-                    'ex_dividend_date':self.clean_date(summary_data.get('ExDividendDate', {}).get('value', '')),
-                    'dividend_payment_date':self.clean_date(summary_data.get('DividendPaymentDate', {}).get('value', '')),
-                    'yield':self.clean_number_str(summary_data.get('Yield', {}).get('value', '')),
-                    'special_dividend_date':self.clean_date(summary_data.get('SpecialDividendDate', {}).get('value', '')),
-                    'special_dividend_amount':self.clean_number_str(summary_data.get('SpecialDividendAmount', {}).get('value', '')),
-                    'special_dividend_payment_date':self.clean_date(summary_data.get('SpecialDividendPaymentDate', {}).get('value', '')),
-                }
-                return record
+            if not metadata:
+                return []
+            if not metadata.get('data'):
+                print(f'No metadata por ticker {ticker}')
+                return []
+            summary_data = metadata.get('data', {}).get('summaryData', {})
+            if not summary_data:
+                print(f'No summary data por ticker {ticker}')
+                return []
+            record = MetadataRecord((
+                ticker,
+                self.clean_str(summary_data.get('Exchange', {}).get('value', '')),
+                self.clean_str(summary_data.get('Sector', {}).get('value', '')),
+                self.clean_str(summary_data.get('Industry', {}).get('value', '')),
+                self.clean_number_str(summary_data.get('OneYrTarget', {}).get('value', '')),
+                self.clean_str(summary_data.get('TodayHighLow', {}).get('value', '')),
+                self.clean_number_str(summary_data.get('ShareVolume', {}).get('value', '')),
+                self.clean_number_str(summary_data.get('AverageVolume', {}).get('value', '')),
+                self.clean_number_str(summary_data.get('PreviousClose', {}).get('value', '')),
+                self.clean_str(summary_data.get('FiftTwoWeekHighLow', {}).get('value', '')),
+                self.clean_number_str(summary_data.get('MarketCap', {}).get('value', '')),
+                self.clean_number_str(str(summary_data.get('PERatio', {}).get('value', ''))),
+                self.clean_number_str(summary_data.get('ForwardPE1Yr', {}).get('value', '')),
+                self.clean_number_str(summary_data.get('AnnualizedDividend', {}).get('value', '')),
+                self.clean_number_str(summary_data.get('AnnualizedDividend', {}).get('value', '')),
+                self.clean_date(summary_data.get('ExDividendDate', {}).get('value', '')),
+                self.clean_date(summary_data.get('DividendPaymentDate', {}).get('value', '')),
+                self.clean_number_str(summary_data.get('Yield', {}).get('value', '')),
+                self.clean_date(summary_data.get('SpecialDividendDate', {}).get('value', '')),
+                self.clean_number_str(summary_data.get('SpecialDividendAmount', {}).get('value', '')),
+                self.clean_date(summary_data.get('SpecialDividendPaymentDate', {}).get('value', '')),
+            ))
+            return record
         except Exception as e:
             print(f"<Error> In fetch_metadata: {str(e)}")
             return []
     
     async def fetch_info(self, ticker:str):
+        return self.parse_info(ticker, await self.fetch_raw('info', ticker))
+
+    def parse_info(self, ticker:str, info:dict):
         try:
-            url = f"{self.BASE_URL}/quote/{ticker}/info?assetclass=stocks"
-            async with httpx.AsyncClient(
-                timeout=httpx.Timeout(10.0, read=20.0),
-                headers=self.HEADERS,
-                follow_redirects=True,
-            ) as client:
-                info = await self.get_json_from_page(client, url)
-                if not info:
-                    return []
-                if not info.get('data'):
-                    print(f'No info por ticker {ticker}')
-                    return []
-                info = info.get('data')
-                record = {
-                    'ticker':ticker,
-                    'company_name': self.clean_str(info.get('companyName', '')),
-                    'stock_type':self.clean_str(info.get('stockType', '')),
-                    'exchange':self.clean_str(info.get('exchange', '')),
-                    'asset_class': info.get('assetClass', ''),
-                    'is_nasdaq_listed': info.get('isNasdaqListed', ''),
-                    'is_nasdaq100': info.get('isNasdaq100', ''),
-                    'is_held': info.get('isHeld', ''),
-                }
-                return record
+            if not info:
+                return []
+            if not info.get('data'):
+                print(f'No info por ticker {ticker}')
+                return []
+            info = info.get('data')
+            record = InfoRecord((
+                ticker,
+                self.clean_str(info.get('companyName', '')),
+                self.clean_str(info.get('stockType', '')),
+                self.clean_str(info.get('exchange', '')),
+                info.get('assetClass', ''),
+                info.get('isNasdaqListed', ''),
+                info.get('isNasdaq100', ''),
+                info.get('isHeld', ''),
+            ))
+            return record
         except Exception as e:
             print(f"<Error> In fet_info: {str(e)}")
             return []
 
     async def fetch_institutionals(self,ticker: str):
+        return self.parse_institutionals(ticker, await self.fetch_raw('institutionals', ticker))
+
+    def parse_institutionals(self, ticker:str, json_data:dict):
         try:
-            url = f"{self.BASE_URL}/company/{ticker}/institutional-holdings?limit=10&type=TOTAL&sortColumn=marketValue"
-            async with httpx.AsyncClient(
-                timeout=httpx.Timeout(10.0, read=20.0),
-                headers=self.HEADERS,
-                follow_redirects=True,
-            ) as client:
-                json_data = await self.get_json_from_page(client, url)
-                if not json_data:
-                    return []
-                if not json_data.get('data'):
-                    print(f'No institutional data for ticker {ticker}')
-                    return []
-                ownershipSummary = json_data.get('data', {}).get('ownershipSummary',{})
-                activePositions = json_data.get('data', {}).get('activePositions',{}).get('rows', {})
-                newSoldOutPositions = json_data.get('data', {}).get('newSoldOutPositions',{}).get('rows', {})
-
-                final_list = activePositions + newSoldOutPositions
-
-                for item in final_list:
-                    if item.get('positions','') == 'Increased Positions':
-                        IncreasedPositionsHolders=self.clean_number_str(item.get('holders', ''))
-                        IncreasedPositionsShares=self.clean_number_str(item.get('shares', ''))
-                    elif item.get('positions') == 'Decreased Positions':
-                        DecreasedPositionsHolders=self.clean_number_str(item.get('holders', ''))
-                        DecreasedPositionsShares=self.clean_number_str(item.get('shares', ''))
-                    elif item.get('positions') == 'Held Positions':
-                        HeldPositionsHolders=self.clean_number_str(item.get('holders', ''))
-                        HeldPositionsShares=self.clean_number_str(item.get('shares', ''))
-                    elif item.get('positions') == 'Total Institutional Shares':
-                        TotalPositionsHolders=self.clean_number_str(item.get('holders', ''))
-                        TotalPositionsShares=self.clean_number_str(item.get('shares', ''))
-                    elif item.get('positions') == 'New Positions':
-                        NewPositionsHolders=self.clean_number_str(item.get('holders', ''))
-                        NewPositionsShares=self.clean_number_str(item.get('shares', ''))
-                    elif item.get('positions') == 'Sold Out Positions':
-                        SoldOutPositionsHolders=self.clean_number_str(item.get('holders', ''))
-                        SoldOutPositionsShares=self.clean_number_str(item.get('shares', ''))
-                    else:
-                        print('Some error getting instutionanals, poisitions not found')
+            if not json_data:
+                return []
+            if not json_data.get('data'):
+                print(f'No institutional data for ticker {ticker}')
+                return []
+            ownershipSummary = json_data.get('data', {}).get('ownershipSummary',{})
+            activePositions = json_data.get('data', {}).get('activePositions',{}).get('rows', {})
+            newSoldOutPositions = json_data.get('data', {}).get('newSoldOutPositions',{}).get('rows', {})
+
+            final_list = activePositions + newSoldOutPositions
+
+            for item in final_list:
+                if item.get('positions','') == 'Increased Positions':
+                    IncreasedPositionsHolders=self.clean_number_str(item.get('holders', ''))
+                    IncreasedPositionsShares=self.clean_number_str(item.get('shares', ''))
+                elif item.get('positions') == 'Decreased Positions':
+                    DecreasedPositionsHolders=self.clean_number_str(item.get('holders', ''))
+                    DecreasedPositionsShares=self.clean_number_str(item.get('shares', ''))
+                elif item.get('positions') == 'Held Positions':
+                    HeldPositionsHolders=self.clean_number_str(item.get('holders', ''))
+                    HeldPositionsShares=self.clean_number_str(item.get('shares', ''))
+                elif item.get('positions') == 'Total Institutional Shares':
+                    TotalPositionsHolders=self.clean_number_str(item.get('holders', ''))
+                    TotalPositionsShares=self.clean_number_str(item.get('shares', ''))
+                elif item.get('positions') == 'New Positions':
+                    NewPositionsHolders=self.clean_number_str(item.get('holders', ''))
+                    NewPositionsShares=self.clean_number_str(item.get('shares', ''))
+                elif item.get('positions') == 'Sold Out Positions':
+                    SoldOutPositionsHolders=self.clean_number_str(item.get('holders', ''))
+                    SoldOutPositionsShares=self.clean_number_str(item.get('shares', ''))
+                else:
+                    print('Some error getting instutionanals, poisitions not found')
                         
                     
-                record = {
-                    'ticker':ticker,
-                    'shares_outstanding_pct':self.clean_number_str(ownershipSummary.get('SharesOutstandingPCT', {}).get('value', '')),
-                    'shares_outstanding_total':self.clean_number_str(ownershipSummary.get('ShareoutstandingTotal', {}).get('value', '')),
-                    'total_holdings_value':self.clean_number_str(ownershipSummary.get('TotalHoldingsValue', {}).get('value', '')),
-                    'increased_positions_holders':IncreasedPositionsHolders,
-                    'increased_positions_shares':IncreasedPositionsShares,
-                    'decreased_positions_holders':DecreasedPositionsHolders,
-                    'decreased_positions_shares':DecreasedPositionsShares,
-                    'held_positions_holders':HeldPositionsHolders,
-                    'held_positions_shares':HeldPositionsShares,
-                    'total_positions_holders':TotalPositionsHolders,
-                    'total_positions_shares':TotalPositionsShares,
-                    'new_positions_holders':NewPositionsHolders,
-                    'new_positions_shares':NewPositionsShares,
-                    'sold_out_positions_holders':SoldOutPositionsHolders,
-                    'sold_out_positions_shares':SoldOutPositionsShares,
-                    }
-                return record
+            record = InstitutionalRecord((
+                ticker,
+                self.clean_number_str(ownershipSummary.get('SharesOutstandingPCT', {}).get('value', '')),
+                self.clean_number_str(ownershipSummary.get('ShareoutstandingTotal', {}).get('value', '')),
+                self.clean_number_str(ownershipSummary.get('TotalHoldingsValue', {}).get('value', '')),
+                IncreasedPositionsHolders,
+                IncreasedPositionsShares,
+                DecreasedPositionsHolders,
+                DecreasedPositionsShares,
+                HeldPositionsHolders,
+                HeldPositionsShares,
+                TotalPositionsHolders,
+                TotalPositionsShares,
+                NewPositionsHolders,
+                NewPositionsShares,
+                SoldOutPositionsHolders,
+                SoldOutPositionsShares,
+            ))
+            return record
         except Exception as e:
             print(f"<Error> In institutionals: {str(e)}")
             return []
         
     
+    def parse_holders(self, ticker:str, json_data:dict) -> list:
+        """Holder rows of one page of the institutional holdings, rows without a holder or date are dropped"""
+        if not json_data or not json_data.get('data'):
+            return []
+        table = (json_data['data'].get('holdingsTransactions') or {}).get('table') or {}
+        records = []
+        for row in table.get('rows') or []:
+            record = HolderRecord((
+                ticker,
+                self.clean_str(row.get('ownerName')),
+                self.clean_date(row.get('date')),
+                self.clean_number_str(row.get('sharesHeld')),
+                self.clean_number_str(row.get('sharesChange')),
+                self.clean_number_str(row.get('sharesChangePCT')),
+                self.clean_number_str(row.get('marketValue')),
+            ))
+            if record.holder and record.date:
+                records.append(record)
+        return records
+
+    def holders_page_rows(self, json_data:dict) -> int:
+        """Rows of one page as sent, before `parse_holders` drops any"""
+        if not json_data or not json_data.get('data'):
+            return 0
+        table = (json_data['data'].get('holdingsTransactions') or {}).get('table') or {}
+        return len(table.get('rows') or [])
+
+    def holders_total(self, json_data:dict) -> int:
+        """Holders of the ticker according to a page, 0 if unknown"""
+        if not json_data or not json_data.get('data'):
+            return 0
+        total = (json_data['data'].get('holdingsTransactions') or {}).get('totalRecords')
+        return self.clean_number_str(str(total)) or 0 if total else 0
+
     async def fetch_multiple_tickers(self, tickers: list):
-        tasks = [self.fetch_info(ticker) for ticker in tickers]
+        tasks = [self.fetch_info(ticker) for ticker in ticker_list(tickers)]
         results = await asyncio.gather(*tasks)
         return results
       
     async def fetch_multiple_dividends(self, tickers: list):
-        tasks = [self.fetch_dividends(ticker["ticker"]) for ticker in tickers]
+        tasks = [self.fetch_dividends(ticker) for ticker in ticker_list(tickers)]
         results = await asyncio.gather(*tasks)
         return results
 
     async def fetch_multiple_metadata(self, tickers: list):
-        tasks = [self.fetch_metadata(ticker["ticker"]) for ticker in tickers]
+        tasks = [self.fetch_metadata(ticker) for ticker in ticker_list(tickers)]
         results = await asyncio.gather(*tasks)
         return results
     
     async def fetch_multiple_institutionals(self, tickers: list):
-        tasks = [self.fetch_institutionals(ticker["ticker"]) for ticker in tickers]
+        tasks = [self.fetch_institutionals(ticker) for ticker in ticker_list(tickers)]
         results = await asyncio.gather(*tasks)
         return results
-    
-    # def __del__(self):
-    #     """Write invalid tickers to a CSV file without using external libraries."""
-    #     if self.INVALID_TICKERS:
-    #         with open("invalid_tickers.csv", "w") as csvfile:
-    #             # Write the header
-    #             csvfile.write("Ticker\n")
-    #             # Write each ticker on a new line
-    #             for ticker in self.INVALID_TICKERS:
-    #                 csvfile.write(f"{ticker}\n")
-    #         print("Invalid tickers written to invalid_tickers.csv")
@@ -0,0 +1,174 @@
+import asyncio
+import time
+from typing import AsyncIterator, Awaitable, Callable, Iterable
+
+_DONE = object()
+
+
+class TokenBucket:
+    """Token bucket limiting the average request rate
+
+    Args:
+        rate (float): Tokens added per second
+        capacity (float): Max tokens stored, i.e. the allowed burst
+    """
+    def __init__(self, rate:float, capacity:float=None) -> None:
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until one token is available and take it"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Slot:
+    """One in-flight request, the caller sets `status` with the response code"""
+    __slots__ = ('scheduler', 'status')
+
+    def __init__(self, scheduler) -> None:
+        self.scheduler = scheduler
+        self.status = None
+
+    async def __aenter__(self):
+        await self.scheduler.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is not None and issubclass(exc_type, asyncio.CancelledError):
+            # A cancelled run says nothing about the upstream
+            self.scheduler.release(adapt=False)
+        else:
+            # A transport error (timeout, reset) counts as congestion
+            self.scheduler.release(self.status if exc_type is None else 0)
+        return False
+
+
+class AdaptiveScheduler:
+    """Rate limited, concurrency bounded scheduler with AIMD backoff
+
+    Requests start as soon as an in-flight slot and a token are free. A 429/5xx
+    or transport error cuts rate and in-flight limit multiplicatively, healthy
+    responses grow them back additively.
+
+    Args:
+        rate (float): Starting requests per second
+        max_in_flight (int): Max concurrent requests
+        min_rate (float): Floor for the rate after backoff
+        max_rate (float): Ceiling for the rate when ramping up
+        increase (float): Requests/sec added after each healthy window
+        decrease (float): Factor applied to rate and in-flight limit on backoff
+        window (int): Healthy responses needed before ramping up
+        cooldown (float): Seconds between two backoffs, a burst of 429s counts once
+    """
+    def __init__(self, rate:float=10.0, max_in_flight:int=10, min_rate:float=0.5,
+                 max_rate:float=50.0, increase:float=1.0, decrease:float=0.5,
+                 window:int=20, cooldown:float=2.0) -> None:
+        self.bucket = TokenBucket(rate)
+        self.min_rate = min_rate
+        # A starting rate above the ceiling would drop to it on the first ramp up
+        self.max_rate = max(max_rate, rate)
+        self.max_in_flight = max_in_flight
+        self.limit = max_in_flight
+        self.increase = increase
+        self.decrease = decrease
+        self.window = window
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.healthy = 0
+        self.last_backoff = 0.0
+        self.backoffs = 0
+        self._cond = asyncio.Condition()
+        # The loop only keeps weak references to tasks, pending notifications are kept here
+        self._notifications = set()
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    def slot(self) -> Slot:
+        return Slot(self)
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        try:
+            await self.bucket.acquire()
+        except BaseException:
+            self.in_flight -= 1
+            raise
+
+    def release(self, status:int=None, adapt:bool=True):
+        """Free a slot, `status` 0/429/5xx backs off and others ramp up unless `adapt` is False"""
+        self.in_flight -= 1
+        if not adapt:
+            pass
+        elif status is not None and (status == 0 or status == 429 or status >= 500):
+            self._backoff()
+        else:
+            self._ramp_up()
+        task = asyncio.get_running_loop().create_task(self._notify())
+        self._notifications.add(task)
+        task.add_done_callback(self._notifications.discard)
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    def _backoff(self):
+        self.healthy = 0
+        now = time.monotonic()
+        if now - self.last_backoff < self.cooldown:
+            return
+        self.last_backoff = now
+        self.backoffs += 1
+        self.bucket.rate = max(self.min_rate, self.bucket.rate * self.decrease)
+        self.limit = max(1, int(self.limit * self.decrease))
+        print(f"Backing off: {self.bucket.rate:.2f} req/s, {self.limit} in flight")
+
+    def _ramp_up(self):
+        self.healthy += 1
+        if self.healthy < self.window:
+            return
+        self.healthy = 0
+        self.bucket.rate = min(self.max_rate, self.bucket.rate + self.increase)
+        self.limit = min(self.max_in_flight, self.limit + 1)
+
+    async def imap(self, func:Callable[..., Awaitable], items:Iterable) -> AsyncIterator:
+        """Run `func` on every item, yield results as they complete
+
+        Only a bounded window of tasks exists at a time, a new one is started
+        as soon as one finishes.
+        """
+        items = iter(items)
+        pending = set()
+        window = self.max_in_flight * 2
+        try:
+            while True:
+                while len(pending) < window:
+                    item = next(items, _DONE)
+                    if item is _DONE:
+                        break
+                    pending.add(asyncio.ensure_future(func(item)))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,198 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+from typing import List
+from bulk_writer import TABLES, BulkWriter, MultiWriter
+
+# Scarper dataset of each table, its FIELDS give the parquet column types
+TABLE_DATASETS = {
+    'tickers': 'info',
+    'metadata': 'metadata',
+    'dividends': 'dividends',
+    'institutional_holdings': 'institutionals',
+}
+
+
+def kind_types() -> dict:
+    """Polars type of each vector_clean field kind"""
+    import polars as pl
+    return {
+        'str': pl.String,
+        'int': pl.Int64,
+        # NUMERIC(12,2) of the Postgres tables
+        'decimal': pl.Decimal(12, 2),
+        'date': pl.Date,
+    }
+
+
+def table_schema(table:str) -> dict:
+    """Parquet column types of a table: its insert columns plus `inserted`, the scrape time
+
+    Polars is imported by the parquet sink only, the Postgres one never loads it.
+    """
+    import polars as pl
+    from vector_clean import FIELDS
+    types = kind_types()
+    kinds = {name: kind for name, _, kind in FIELDS[TABLE_DATASETS[table]]}
+    schema = {}
+    for col in TABLES[table]['columns']:
+        kind = kinds.get(col, 'str')
+        if kind == 'raw':
+            # Passed through from the API: isNasdaqListed, isNasdaq100, isHeld and assetClass
+            schema[col] = pl.Boolean if col.startswith('is_') else pl.String
+        else:
+            schema[col] = types[kind]
+    schema['inserted'] = pl.Datetime('us')
+    return schema
+
+
+class PostgresSink:
+    """Default sink: binary COPY into staging and merge, see BulkWriter and MultiWriter"""
+    def __init__(self, db) -> None:
+        self.db = db
+
+    def writer(self, table:str, max_rows:int=5000, ledger=None, changes=None, on_conflict:str=None) -> BulkWriter:
+        return BulkWriter(self.db, table, max_rows=max_rows, ledger=ledger, changes=changes, on_conflict=on_conflict)
+
+    def multi_writer(self, tables:tuple, max_rows:int=5000, ledger=None, changes=None) -> MultiWriter:
+        return MultiWriter(self.db, tables, max_rows=max_rows, ledger=ledger, changes=changes)
+
+
+class ParquetSink:
+    """Writes scraped rows to a Hive partitioned parquet dataset instead of Postgres
+
+    Files are `<root>/<table>/date=<YYYY-MM-DD>/part-<time>-<id>.parquet`, zstd compressed
+    and written to a hidden temp file first, then renamed into place, so readers never
+    see a partial file. Query them with
+    `pl.scan_parquet(f'{root}/metadata/**/*.parquet', hive_partitioning=True)` or load
+    them into Postgres with `history_loader.load_parquet`.
+
+    There is no database: no ledger, change detection or partition upkeep.
+
+    Args:
+        root (str): Dataset folder
+        file_rows (int): Rows buffered per table before a file is written
+        row_group_size (int): Rows per parquet row group
+        compression_level (int): zstd level
+    """
+    db = None
+
+    def __init__(self, root:str, file_rows:int=250000, row_group_size:int=50000, compression_level:int=3) -> None:
+        self.root = root
+        self.file_rows = file_rows
+        self.row_group_size = row_group_size
+        self.compression_level = compression_level
+        self.files: List[str] = []
+
+    def writer(self, table:str, max_rows:int=None, ledger=None, changes=None, on_conflict:str=None) -> 'ParquetWriter':
+        return ParquetWriter(self, table)
+
+    def multi_writer(self, tables:tuple, max_rows:int=None, ledger=None, changes=None) -> 'ParquetMultiWriter':
+        return ParquetMultiWriter(self, tables)
+
+    def write(self, table:str, rows:List[tuple]) -> str:
+        """Write rows of `table` as one file of today's partition, returns its path"""
+        import polars as pl
+        now = datetime.now()
+        schema = table_schema(table)
+        columns = list(zip(*rows))
+        # The cast pins types the values do not imply, e.g. dates cleaned into datetimes
+        frame = pl.DataFrame([pl.Series(name, values, dtype=dtype, strict=False).cast(dtype, strict=False)
+                              for (name, dtype), values in zip(schema.items(), columns)])
+        frame = frame.with_columns(pl.lit(now, dtype=schema['inserted']).alias('inserted'))
+        folder = os.path.join(self.root, table, f"date={now:%Y-%m-%d}")
+        os.makedirs(folder, exist_ok=True)
+        name = f"part-{now:%H%M%S}-{uuid.uuid4().hex[:12]}.parquet"
+        temp = os.path.join(folder, f".{name}.tmp")
+        path = os.path.join(folder, name)
+        try:
+            frame.write_parquet(temp, compression='zstd', compression_level=self.compression_level,
+                                row_group_size=self.row_group_size, statistics=True)
+            os.replace(temp, path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        self.files.append(path)
+        return path
+
+
+class ParquetWriter:
+    """BulkWriter counterpart of ParquetSink, buffers rows of one table and writes a file per `file_rows`"""
+    def __init__(self, sink:ParquetSink, table:str) -> None:
+        self.sink = sink
+        self.table = table
+        self.rows: List[tuple] = []
+        self.failed = 0
+        self.skipped = 0
+        self.written = 0
+        self.merged = 0
+
+    async def add_ticker(self, ticker:str, rows:list):
+        self.rows.extend(rows)
+        if len(self.rows) >= self.sink.file_rows:
+            await self.flush()
+
+    async def ticker_failed(self, ticker:str, error:str, kind:str=None):
+        self.failed += 1
+
+    async def flush(self) -> int:
+        """Write the buffered rows as one file, returns rows written"""
+        if not self.rows:
+            return 0
+        rows, self.rows = self.rows, []
+        # Encoding and compression run off the event loop, polars releases the GIL
+        await asyncio.to_thread(self.sink.write, self.table, rows)
+        self.written += len(rows)
+        self.merged += len(rows)
+        return len(rows)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.flush()
+
+
+class ParquetMultiWriter:
+    """MultiWriter counterpart of ParquetSink, `(table, row)` pairs go to a ParquetWriter per table"""
+    def __init__(self, sink:ParquetSink, tables:tuple) -> None:
+        self.tables = tables
+        self.writers = {table: ParquetWriter(sink, table) for table in tables}
+        self.failed = 0
+
+    @property
+    def written(self) -> dict:
+        return {table: writer.written for table, writer in self.writers.items()}
+
+    @property
+    def merged(self) -> dict:
+        return self.written
+
+    @property
+    def skipped(self) -> dict:
+        return dict.fromkeys(self.tables, 0)
+
+    async def add_ticker(self, ticker:str, rows:list):
+        by_table = {}
+        for table, row in rows:
+            if table is not None:
+                by_table.setdefault(table, []).append(row)
+        if any(table is None for table, _ in rows):
+            self.failed += 1
+        for table, table_rows in by_table.items():
+            await self.writers[table].add_ticker(ticker, table_rows)
+
+    async def ticker_failed(self, ticker:str, error:str, kind:str=None):
+        self.failed += 1
+
+    async def flush(self) -> dict:
+        return {table: await writer.flush() for table, writer in self.writers.items()}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.flush()
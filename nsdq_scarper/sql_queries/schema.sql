@@ -7,13 +7,21 @@ CREATE TABLE IF NOT EXISTS tickers (
     asset_class TEXT,
     is_nasdaq_listed BOOLEAN,
     is_nasdaq100 BOOLEAN,
-    is_held BOOLEAN
+    is_held BOOLEAN,
+    updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- last info fetch
+    delisted TIMESTAMP -- set once the symbol left the tickers csv
 );
 
+-- Databases created before the ticker sync
+ALTER TABLE tickers ADD COLUMN IF NOT EXISTS updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE tickers ADD COLUMN IF NOT EXISTS delisted TIMESTAMP;
+
 CREATE INDEX IF NOT EXISTS idx_ticker_tickers ON tickers (ticker);
 
+-- Snapshot tables are range partitioned by month on `inserted`, partitions are created
+-- by partitions.py (databases from before partitioning are migrated there too)
 CREATE TABLE IF NOT EXISTS metadata (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     ticker TEXT NOT NULL,
     exchange TEXT,
     sector TEXT,
@@ -35,11 +43,13 @@ CREATE TABLE IF NOT EXISTS metadata (
     special_dividend_date DATE,
     special_dividend_amount  NUMERIC(12,2),
     special_dividend_payment_date DATE,
-    inserted TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    inserted TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, inserted),
     FOREIGN KEY (ticker) REFERENCES tickers (ticker)
-);
+) PARTITION BY RANGE (inserted);
 
-CREATE INDEX IF NOT EXISTS idx_metadata_ticker ON metadata (ticker);
+CREATE INDEX IF NOT EXISTS idx_metadata_ticker_inserted ON metadata (ticker, inserted DESC);
+CREATE INDEX IF NOT EXISTS idx_metadata_inserted_brin ON metadata USING BRIN (inserted);
 
 CREATE TABLE IF NOT EXISTS dividends (
     id SERIAL PRIMARY KEY,
@@ -52,14 +62,42 @@ CREATE TABLE IF NOT EXISTS dividends (
     payment_date DATE,
     currency TEXT,
     inserted TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (ticker) REFERENCES tickers (ticker),
-    CONSTRAINT unique_ticker_dividend UNIQUE (ticker, ex_date, payment_type, amount, declaration_date, record_date, payment_date, currency)
+    FOREIGN KEY (ticker) REFERENCES tickers (ticker)
 );
 
-CREATE INDEX IF NOT EXISTS idx_dividends_ticker ON dividends (ticker);
+-- Older schemas keyed dividends on all 8 columns, keep one row per natural key before narrowing it
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'unique_ticker_dividend') THEN
+        DELETE FROM dividends d USING dividends newer
+        WHERE newer.ticker = d.ticker AND newer.ex_date IS NOT DISTINCT FROM d.ex_date
+            AND newer.payment_type IS NOT DISTINCT FROM d.payment_type
+            AND newer.amount IS NOT DISTINCT FROM d.amount AND newer.id > d.id;
+        ALTER TABLE dividends DROP CONSTRAINT unique_ticker_dividend;
+    END IF;
+END $$;
+
+-- A key with NULLs let the same dividend in again on every run, rebuild it with NULLS NOT DISTINCT
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+               WHERE c.relname = 'unique_dividend_key' AND NOT i.indnullsnotdistinct) THEN
+        DELETE FROM dividends d USING dividends newer
+        WHERE newer.ticker = d.ticker AND newer.ex_date IS NOT DISTINCT FROM d.ex_date
+            AND newer.payment_type IS NOT DISTINCT FROM d.payment_type
+            AND newer.amount IS NOT DISTINCT FROM d.amount AND newer.id > d.id;
+        DROP INDEX unique_dividend_key;
+    END IF;
+END $$;
+
+-- Natural key of a dividend, also serves the ticker lookups and the latest ex_date per ticker.
+-- NULLs are equal in it (Postgres 15+), a dividend without ex_date, type or amount is stored once
+CREATE UNIQUE INDEX IF NOT EXISTS unique_dividend_key ON dividends (ticker, ex_date, payment_type, amount)
+    NULLS NOT DISTINCT;
+DROP INDEX IF EXISTS idx_dividends_ticker;
 
 CREATE TABLE IF NOT EXISTS institutional_holdings (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     ticker text NOT NULL,
     shares_outstanding_pct NUMERIC(12,2),
     shares_outstanding_total BIGINT,
@@ -76,8 +114,185 @@ CREATE TABLE IF NOT EXISTS institutional_holdings (
     new_positions_shares BIGINT,
     sold_out_positions_holders BIGINT,
     sold_out_positions_shares BIGINT,
+    inserted TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, inserted),
+    FOREIGN KEY (ticker) REFERENCES tickers (ticker)
+) PARTITION BY RANGE (inserted);
+
+CREATE INDEX IF NOT EXISTS idx_institutional_holdings_ticker_inserted
+    ON institutional_holdings (ticker, inserted DESC);
+CREATE INDEX IF NOT EXISTS idx_institutional_holdings_inserted_brin
+    ON institutional_holdings USING BRIN (inserted);
+
+-- Every institutional holder of a ticker per filing date, from the paginated holder list
+CREATE TABLE IF NOT EXISTS institutional_holders (
+    id SERIAL PRIMARY KEY,
+    ticker TEXT NOT NULL,
+    holder TEXT NOT NULL,
+    date DATE NOT NULL, -- filing date of the position
+    shares BIGINT,
+    shares_change BIGINT,
+    shares_change_pct NUMERIC(12,2),
+    value BIGINT,
     inserted TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT unique_ticker_holder_date UNIQUE (ticker, holder, date),
     FOREIGN KEY (ticker) REFERENCES tickers (ticker)
 );
 
-CREATE INDEX IF NOT EXISTS idx_institutional_holdings_ticker ON institutional_holdings (ticker);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_institutional_holders_ticker_date ON institutional_holders (ticker, date DESC);
+
+-- Newest filing date of a ticker whose holder list was last fetched completely,
+-- refreshes stop paging once they reach older filings
+CREATE TABLE IF NOT EXISTS holders_synced (
+    ticker TEXT PRIMARY KEY,
+    synced_date DATE NOT NULL,
+    refreshed TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Unlogged templates of the staging tables of the COPY bulk writer, every connection
+-- flushes into its own temporary copy, see Database.copy_merge_many
+CREATE UNLOGGED TABLE IF NOT EXISTS staging_tickers (
+    ticker TEXT,
+    company_name TEXT,
+    stock_type TEXT,
+    exchange TEXT,
+    asset_class TEXT,
+    is_nasdaq_listed BOOLEAN,
+    is_nasdaq100 BOOLEAN,
+    is_held BOOLEAN
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS staging_metadata (
+    ticker TEXT,
+    exchange TEXT,
+    sector TEXT,
+    industry TEXT,
+    one_yr_target NUMERIC(12, 2),
+    today_high_low TEXT,
+    share_volume BIGINT,
+    average_volume BIGINT,
+    previous_close NUMERIC(12,2),
+    fiftytwo_week_high_low TEXT,
+    market_cap BIGINT,
+    pe_ratio NUMERIC(12,2),
+    forward_pe_1yr  NUMERIC(12,2),
+    earnings_per_share  NUMERIC(12,2),
+    annualized_dividend  NUMERIC(12,2),
+    ex_dividend_date DATE,
+    dividend_payment_date DATE,
+    yield  NUMERIC(12,2),
+    special_dividend_date DATE,
+    special_dividend_amount  NUMERIC(12,2),
+    special_dividend_payment_date DATE,
+    inserted TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS staging_dividends (
+    ticker TEXT,
+    ex_date DATE,
+    payment_type TEXT,
+    amount NUMERIC(12, 2),
+    declaration_date DATE,
+    record_date DATE,
+    payment_date DATE,
+    currency TEXT
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS staging_institutional_holdings (
+    ticker text,
+    shares_outstanding_pct NUMERIC(12,2),
+    shares_outstanding_total BIGINT,
+    total_holdings_value BIGINT,
+    increased_positions_holders BIGINT,
+    increased_positions_shares BIGINT,
+    decreased_positions_holders BIGINT,
+    decreased_positions_shares BIGINT,
+    held_positions_holders BIGINT,
+    held_positions_shares BIGINT,
+    total_positions_holders BIGINT,
+    total_positions_shares BIGINT,
+    new_positions_holders  BIGINT,
+    new_positions_shares BIGINT,
+    sold_out_positions_holders BIGINT,
+    sold_out_positions_shares BIGINT,
+    inserted TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS staging_institutional_holders (
+    ticker TEXT,
+    holder TEXT,
+    date DATE,
+    shares BIGINT,
+    shares_change BIGINT,
+    shares_change_pct NUMERIC(12,2),
+    value BIGINT
+);
+
+
+-- Latest snapshot per ticker, upserted in the transaction of every flush into the snapshot table
+-- (Database.copy_merge_many), so reads are O(tickers) instead of DISTINCT ON over the history
+CREATE TABLE IF NOT EXISTS latest_metadata (
+    LIKE staging_metadata INCLUDING DEFAULTS,
+    PRIMARY KEY (ticker)
+);
+
+CREATE TABLE IF NOT EXISTS latest_institutionals (
+    LIKE staging_institutional_holdings INCLUDING DEFAULTS,
+    PRIMARY KEY (ticker)
+);
+
+
+-- Job ledger, one run per action invocation and one row per ticker of the run
+CREATE TABLE IF NOT EXISTS runs (
+    id SERIAL PRIMARY KEY,
+    action TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running', -- running, incomplete, finished
+    queued BOOLEAN NOT NULL DEFAULT FALSE, -- created by 'enqueue', only these are claimed by workers
+    started TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished TIMESTAMP
+);
+
+ALTER TABLE runs ADD COLUMN IF NOT EXISTS queued BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE INDEX IF NOT EXISTS idx_runs_action ON runs (action, status);
+
+CREATE TABLE IF NOT EXISTS run_tickers (
+    run_id INTEGER NOT NULL,
+    ticker TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending', -- pending, claimed, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    error_kind TEXT, -- throttled, server, timeout, transport, not_found, client, malformed, parse...
+    claimed_by TEXT, -- worker id holding the lease
+    lease_until TIMESTAMP,
+    updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (run_id, ticker),
+    FOREIGN KEY (run_id) REFERENCES runs (id) ON DELETE CASCADE
+);
+
+ALTER TABLE run_tickers ADD COLUMN IF NOT EXISTS error_kind TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_run_tickers_status ON run_tickers (run_id, status);
+
+
+-- Last written fingerprint per ticker and dataset, unchanged snapshots are not written again
+CREATE TABLE IF NOT EXISTS fingerprints (
+    dataset TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    fingerprint BIGINT NOT NULL,
+    updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (dataset, ticker)
+);
+
+
+-- Last refresh per dataset and ticker, drives the staleness priority of the daemon
+CREATE TABLE IF NOT EXISTS freshness (
+    dataset TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    refreshed TIMESTAMP,
+    failures INTEGER NOT NULL DEFAULT 0,
+    retry_after TIMESTAMP, -- failed refreshes back off until then
+    last_error TEXT,
+    error_kind TEXT,
+    PRIMARY KEY (dataset, ticker)
+);
@@ -0,0 +1,80 @@
+from typing import Iterable
+from database import Database
+from bulk_writer import TABLES
+from pipeline import scrape_tickers
+
+# Diff of the csv symbols against the tickers table in one statement: symbols missing
+# from the table are new, listed tickers missing from the csv get delisted and
+# delisted tickers back in the csv are listed again.
+SYNC_QUERY = """
+WITH listed AS (
+    SELECT DISTINCT ticker FROM unnest($1::text[]) AS ticker WHERE ticker IS NOT NULL
+), delisted AS (
+    UPDATE tickers t SET delisted = CURRENT_TIMESTAMP
+    WHERE t.delisted IS NULL AND NOT EXISTS (SELECT 1 FROM listed l WHERE l.ticker = t.ticker)
+    RETURNING t.ticker
+), relisted AS (
+    UPDATE tickers t SET delisted = NULL
+    FROM listed l
+    WHERE t.ticker = l.ticker AND t.delisted IS NOT NULL
+    RETURNING t.ticker
+)
+SELECT 'new' AS change, l.ticker FROM listed l
+WHERE NOT EXISTS (SELECT 1 FROM tickers t WHERE t.ticker = l.ticker)
+UNION ALL SELECT 'delisted', ticker FROM delisted
+UNION ALL SELECT 'relisted', ticker FROM relisted
+"""
+
+# Listed tickers whose info is older than $1 days, oldest first
+STALE_QUERY = """
+SELECT ticker FROM tickers
+WHERE delisted IS NULL AND updated < CURRENT_TIMESTAMP - $1::float8 * INTERVAL '1 day'
+ORDER BY updated
+"""
+
+# Refreshed info replaces the stored one
+REFRESH_CONFLICT = 'ON CONFLICT (ticker) DO UPDATE SET ' + ', '.join(
+    [f'{col} = EXCLUDED.{col}' for col in TABLES['tickers']['columns'][1:]] + ['updated = CURRENT_TIMESTAMP'])
+
+
+async def diff_tickers(db:Database, symbols:Iterable[str]) -> dict:
+    """Mark delisted/relisted tickers, returns {'new': [...], 'delisted': [...], 'relisted': [...]}"""
+    symbols = list(symbols)
+    if not symbols:
+        # An empty or broken csv would delist every ticker
+        raise ValueError("No symbols to sync against")
+    changes = {'new': [], 'delisted': [], 'relisted': []}
+    for row in await db.fetch(SYNC_QUERY, symbols) or []:
+        changes[row['change']].append(row['ticker'])
+    return changes
+
+
+async def sync_tickers(db:Database, scraper, symbols:Iterable[str], refresh_days:float=None,
+                       batch_size:int=1000, engine:str='python') -> dict:
+    """Sync the tickers table with the current symbol list
+
+    Info is fetched only for new symbols, and with `refresh_days` for listed
+    tickers whose info is older than that.
+
+    Args:
+        db (Database): Database with an open pool
+        scraper (Scarper): Scraper used for the info requests
+        symbols (Iterable): Current symbols, e.g. from the tickers csv
+        refresh_days (float): Re-fetch info older than this many days, None never refreshes
+        batch_size (int): Number of records per DB flush
+        engine (str): Record cleaning engine, 'python' or 'vector'
+
+    Returns:
+        dict: Tickers per change, 'new', 'delisted', 'relisted' and 'refreshed'
+    """
+    changes = await diff_tickers(db, symbols)
+    if changes['new']:
+        await scrape_tickers(db, scraper, 'info', 'tickers', changes['new'], batch_size, engine=engine)
+    changes['refreshed'] = []
+    if refresh_days is not None:
+        stale = await db.fetch(STALE_QUERY, float(refresh_days)) or []
+        changes['refreshed'] = [row['ticker'] for row in stale]
+        if changes['refreshed']:
+            await scrape_tickers(db, scraper, 'info', 'tickers', changes['refreshed'], batch_size,
+                                 engine=engine, on_conflict=REFRESH_CONFLICT)
+    return changes
@@ -0,0 +1,242 @@
+from datetime import date, datetime
+from decimal import Decimal
+import polars as pl
+from records import RECORDS
+
+# Columns after `ticker` in the order of the dataset's record type, see records.py.
+# Field kinds: 'str' -> Scarper.clean_str, 'int'/'decimal' -> Scarper.clean_number_str
+# into a BIGINT/NUMERIC column, 'date' -> Scarper.clean_date, 'raw' -> passed through
+FIELDS = {
+    'info': [
+        ('company_name', 'companyName', 'str'),
+        ('stock_type', 'stockType', 'str'),
+        ('exchange', 'exchange', 'str'),
+        ('asset_class', 'assetClass', 'raw'),
+        ('is_nasdaq_listed', 'isNasdaqListed', 'raw'),
+        ('is_nasdaq100', 'isNasdaq100', 'raw'),
+        ('is_held', 'isHeld', 'raw'),
+    ],
+    'metadata': [
+        ('exchange', 'Exchange', 'str'),
+        ('sector', 'Sector', 'str'),
+        ('industry', 'Industry', 'str'),
+        ('one_yr_target', 'OneYrTarget', 'decimal'),
+        ('today_high_low', 'TodayHighLow', 'str'),
+        ('share_volume', 'ShareVolume', 'int'),
+        ('average_volume', 'AverageVolume', 'int'),
+        ('previous_close', 'PreviousClose', 'decimal'),
+        ('fiftytwo_week_high_low', 'FiftTwoWeekHighLow', 'str'),
+        ('market_cap', 'MarketCap', 'int'),
+        ('pe_ratio', 'PERatio', 'decimal'),
+        ('forward_pe_1yr', 'ForwardPE1Yr', 'decimal'),
+        # Same source field as Scarper.fetch_metadata, outputs must match
+        ('earnings_per_share', 'AnnualizedDividend', 'decimal'),
+        ('annualized_dividend', 'AnnualizedDividend', 'decimal'),
+        ('ex_dividend_date', 'ExDividendDate', 'date'),
+        ('dividend_payment_date', 'DividendPaymentDate', 'date'),
+        ('yield', 'Yield', 'decimal'),
+        ('special_dividend_date', 'SpecialDividendDate', 'date'),
+        ('special_dividend_amount', 'SpecialDividendAmount', 'decimal'),
+        ('special_dividend_payment_date', 'SpecialDividendPaymentDate', 'date'),
+    ],
+    'dividends': [
+        ('ex_date', 'exOrEffDate', 'date'),
+        ('payment_type', 'type', 'str'),
+        ('amount', 'amount', 'decimal'),
+        ('declaration_date', 'declarationDate', 'date'),
+        ('record_date', 'recordDate', 'date'),
+        ('payment_date', 'paymentDate', 'date'),
+        ('currency', 'currency', 'str'),
+    ],
+    'institutionals': [
+        ('shares_outstanding_pct', 'SharesOutstandingPCT', 'decimal'),
+        ('shares_outstanding_total', 'ShareoutstandingTotal', 'int'),
+        ('total_holdings_value', 'TotalHoldingsValue', 'int'),
+        ('increased_positions_holders', ('Increased Positions', 'holders'), 'int'),
+        ('increased_positions_shares', ('Increased Positions', 'shares'), 'int'),
+        ('decreased_positions_holders', ('Decreased Positions', 'holders'), 'int'),
+        ('decreased_positions_shares', ('Decreased Positions', 'shares'), 'int'),
+        ('held_positions_holders', ('Held Positions', 'holders'), 'int'),
+        ('held_positions_shares', ('Held Positions', 'shares'), 'int'),
+        ('total_positions_holders', ('Total Institutional Shares', 'holders'), 'int'),
+        ('total_positions_shares', ('Total Institutional Shares', 'shares'), 'int'),
+        ('new_positions_holders', ('New Positions', 'holders'), 'int'),
+        ('new_positions_shares', ('New Positions', 'shares'), 'int'),
+        ('sold_out_positions_holders', ('Sold Out Positions', 'holders'), 'int'),
+        ('sold_out_positions_shares', ('Sold Out Positions', 'shares'), 'int'),
+    ],
+}
+
+NUMBER_CHARS = r'[%$,]'
+
+
+def number(value:str):
+    """`Scarper.clean_number_str` of a string already stripped of NUMBER_CHARS, raises the same way"""
+    return Decimal(value) if '.' in value else int(value)
+
+
+def raw_date(value) -> date:
+    """Date of a raw API string in either format, None if it does not parse"""
+    if not isinstance(value, str) or not value or value == 'N/A':
+        return None
+    try:
+        return datetime.strptime(value, '%b %d, %Y' if ',' in value else '%m/%d/%Y').date()
+    except ValueError:
+        return None
+
+
+class VectorCleaner:
+    """Columnar alternative to the per-field Scarper cleaners
+
+    Raw field strings of a whole batch are collected per column and cleaned with
+    polars expressions. Output rows equal what `Scarper.parse` gives, down to the
+    scale of each Decimal so change fingerprints do not depend on the engine or the
+    batch, including dropping the rows whose numbers do not parse. Two deliberate
+    differences: a decimal value in a BIGINT column drops the row, where the per-field
+    path hands Postgres a Decimal and fails the whole flush, and so does a date that
+    does not parse, which the per-field path stores as NULL.
+    """
+    def extract(self, dataset:str, ticker:str, data:dict, since:date=None) -> list:
+        """Raw field values of a ticker as `(ticker, *fields)` tuples, [] where the Scarper parser returns nothing
+
+        `since` cuts dividends at the latest stored ex_date like `Scarper.parse_dividends`.
+        A malformed payload raises, `parse_batch` hands the error back for that ticker.
+        """
+        extract = getattr(self, f'_extract_{dataset}')
+        return extract(ticker, data, since) if since else extract(ticker, data)
+
+    def _extract_info(self, ticker, info):
+        if not info or not info.get('data'):
+            return []
+        info = info['data']
+        return [(ticker, *[info.get(key, '') for _, key, _ in FIELDS['info']])]
+
+    def _extract_metadata(self, ticker, metadata):
+        if not metadata or not metadata.get('data'):
+            return []
+        summary_data = metadata.get('data', {}).get('summaryData', {})
+        if not summary_data:
+            return []
+        record = [ticker]
+        for col, key, _ in FIELDS['metadata']:
+            value = summary_data.get(key, {}).get('value', '')
+            record.append(str(value) if col == 'pe_ratio' else value)
+        return [tuple(record)]
+
+    def _extract_dividends(self, ticker, dividends, since=None):
+        if not dividends or not dividends.get('data') or not dividends['data'].get('dividends') \
+                or not dividends['data']['dividends'].get('rows'):
+            return []
+        keys = [key for _, key, _ in FIELDS['dividends']]
+        rows = dividends['data']['dividends']['rows']
+        if since:
+            for i, row in enumerate(rows):
+                ex_date = raw_date(row.get('exOrEffDate'))
+                if ex_date is None or ex_date <= since:
+                    rows = rows[:i]
+                    break
+        return [(ticker, *[row.get(key, '') for key in keys]) for row in rows]
+
+    def _extract_institutionals(self, ticker, json_data):
+        if not json_data or not json_data.get('data'):
+            return []
+        data = json_data['data']
+        summary = data.get('ownershipSummary', {})
+        positions = {row.get('positions'): row for row in
+                     data.get('activePositions', {}).get('rows', {}) + data.get('newSoldOutPositions', {}).get('rows', {})}
+        record = [ticker]
+        for _, key, _ in FIELDS['institutionals']:
+            if isinstance(key, tuple):
+                # The Scarper parser fails on a missing position
+                record.append(positions[key[0]].get(key[1], ''))
+            else:
+                record.append(summary.get(key, {}).get('value', ''))
+        return [tuple(record)]
+
+    def clean(self, dataset:str, records:list) -> list:
+        """Clean raw records in bulk, returns records of the dataset's type or None for dropped rows"""
+        if not records:
+            return []
+        fields = FIELDS[dataset]
+        columns = list(zip(*records))
+        frame = pl.DataFrame({col: self._as_str(columns[i + 1]) for i, (col, _, kind) in enumerate(fields)
+                              if kind != 'raw'})
+        exprs, bad = [], []
+        for col, _, kind in fields:
+            if kind == 'raw':
+                continue
+            value = pl.col(col)
+            empty = value.is_null() | value.is_in(['', 'N/A'])
+            if kind == 'str':
+                exprs.append(pl.when(empty).then(None).otherwise(value).alias(col))
+            elif kind == 'date':
+                parsed = (pl.when(value.str.contains(',', literal=True))
+                          .then(value.str.strptime(pl.Datetime('us'), '%b %d, %Y', strict=False))
+                          .otherwise(value.str.strptime(pl.Datetime('us'), '%m/%d/%Y', strict=False)))
+                exprs.append(pl.when(empty).then(None).otherwise(parsed).alias(col))
+                # clean_date warns and stores NULL, a date that does not parse drops the row here
+                bad.append(~empty & parsed.is_null())
+            elif kind == 'decimal':
+                # Stripped strings, made Decimal one by one below: a column cast would give
+                # every value the largest scale of the batch
+                exprs.append(pl.when(empty).then(None).otherwise(value.str.replace_all(NUMBER_CHARS, '')).alias(col))
+            else:
+                parsed = value.str.replace_all(NUMBER_CHARS, '').cast(pl.Int64, strict=False)
+                exprs.append(pl.when(empty).then(None).otherwise(parsed).alias(col))
+                # clean_number_str raises on these, the Scarper parser drops the row
+                bad.append(~empty & parsed.is_null())
+        frame = frame.select(*exprs, pl.any_horizontal(bad).alias('_bad') if bad else pl.lit(False).alias('_bad'))
+        drops = frame['_bad'].to_list()
+        output = [columns[0]]
+        for i, (col, _, kind) in enumerate(fields):
+            if kind == 'raw':
+                output.append(columns[i + 1])
+            elif kind == 'decimal':
+                output.append(self._numbers(frame[col].to_list(), drops))
+            else:
+                output.append(frame[col].to_list())
+        record = RECORDS[dataset]
+        return [None if drop else record(row) for row, drop in zip(zip(*output), drops)]
+
+    def parse_batch(self, dataset:str, items:list, since:dict=None) -> list:
+        """Parse `[(ticker, raw), ...]` at once, returns `[(ticker, rows), ...]` like `Scarper.parse` per ticker
+
+        Items keep their order, a ticker listed twice gets its own rows twice. `rows` is the
+        exception of a ticker whose payload failed to extract, the pipeline marks it failed.
+        `since` maps tickers to their latest stored ex_date, see `extract`.
+        """
+        since = since or {}
+        records, spans = [], []
+        for ticker, raw in items:
+            try:
+                extracted = self.extract(dataset, ticker, raw, since.get(ticker))
+            except Exception as e:
+                spans.append(e)
+                continue
+            spans.append((len(records), len(records) + len(extracted)))
+            records.extend(extracted)
+        cleaned = self.clean(dataset, records)
+        return [(ticker, span if isinstance(span, Exception)
+                 else [row for row in cleaned[span[0]:span[1]] if row is not None])
+                for (ticker, _), span in zip(items, spans)]
+
+    @staticmethod
+    def _numbers(values:list, drops:list) -> list:
+        """`number` of every stripped string, marks the rows of those that do not parse in `drops`"""
+        numbers = []
+        for i, value in enumerate(values):
+            if value is not None:
+                try:
+                    value = number(value)
+                except (ValueError, ArithmeticError):
+                    value, drops[i] = None, True
+            numbers.append(value)
+        return numbers
+
+    @staticmethod
+    def _as_str(values:tuple) -> pl.Series:
+        try:
+            return pl.Series(values, dtype=pl.String)
+        except TypeError:
+            # clean_number_str fails on non strings, make them unparseable
+            return pl.Series([v if v is None or isinstance(v, str) else f'\0{v}' for v in values], dtype=pl.String)
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import socket
+from database import Database
+from ledger import Ledger
+from pipeline import ACTIONS, SNAPSHOT_TABLES, scrape_all, scrape_tickers
+
+
+async def enqueue(db:Database, action:str, tickers:list=None) -> int:
+    """Coordinator: create a run of `action` for every ticker, workers pick it up. Returns the run id"""
+    if action not in ACTIONS and action != 'all':
+        raise ValueError(f"Unknown action '{action}', use one of {list(ACTIONS) + ['all']}")
+    ledger = Ledger(db, action, queued=True)
+    await ledger.start(tickers)
+    return ledger.run_id
+
+
+async def run_worker(db:Database, scraper, worker_id:str=None, claim_size:int=100, lease:float=300.0,
+                     batch_size:int=1000, max_attempts:int=3, poll:float=0.0, skip_unchanged:bool=True,
+                     engine:str='python', incremental:bool=True):
+    """Claim and process tickers of every open queued run until there is nothing left
+
+    Tickers are claimed with `FOR UPDATE SKIP LOCKED`, so any number of workers, on
+    one box or several, split the work with no overlap. A claim not finished within
+    `lease` seconds is handed to another worker. Runs of the CLI actions are not queued,
+    they stay with their own process and its `--resume`.
+
+    Args:
+        worker_id (str): Name recorded on claims, defaults to host-pid
+        claim_size (int): Tickers claimed at once, keep them doable within `lease`
+        poll (float): Seconds to wait for new runs when idle, 0 exits instead
+        skip_unchanged (bool): Do not write snapshot records identical to the last ones
+        engine (str): 'python' or 'vector' record cleaning
+        incremental (bool): Only parse and write dividends past the latest stored ex_date
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    print(f"Worker {worker_id} started")
+    processed = 0
+    while True:
+        claimed_any = False
+        runs = await db.fetch("SELECT id, action FROM runs WHERE queued AND status <> 'finished' ORDER BY id")
+        for run in runs or []:
+            if run['action'] not in ACTIONS and run['action'] != 'all':
+                continue
+            ledger = Ledger(db, run['action'], max_attempts=max_attempts, run_id=run['id'])
+            while tickers := await ledger.claim(worker_id, claim_size, lease):
+                claimed_any = True
+                if run['action'] == 'all':
+                    await scrape_all(db, scraper, tickers, batch_size, ledger, skip_unchanged, engine,
+                                     incremental=incremental)
+                else:
+                    dataset, table = ACTIONS[run['action']]
+                    await scrape_tickers(db, scraper, dataset, table, tickers, batch_size, ledger,
+                                         skip_unchanged and table in SNAPSHOT_TABLES, engine,
+                                         incremental=incremental)
+                processed += len(tickers)
+            await ledger.finish()
+        if not claimed_any:
+            if not poll:
+                break
+            await asyncio.sleep(poll)
+    print(f"Worker {worker_id} processed {processed} tickers")
+    return processed
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules of nsdq_scarper import each other by name, as when run from that folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'nsdq_scarper'))
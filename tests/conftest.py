@@ -0,0 +1,42 @@
+import pytest
+
+
+class FakeDatabase:
+    """Records every call, `fetchone`/`fetch`/`fetch_values` answer from the given values"""
+    def __init__(self, fetchone=(), fetch=None, values=None) -> None:
+        self.fetchones = list(fetchone)
+        self.rows = fetch
+        self.values = values or []
+        self.calls = []
+
+    async def fetchone(self, query, *args):
+        self.calls.append(('fetchone', query, args))
+        return self.fetchones.pop(0)
+
+    async def fetch(self, query, *args):
+        self.calls.append(('fetch', query, args))
+        return self.rows
+
+    async def fetch_values(self, query, *args):
+        self.calls.append(('fetch_values', query, args))
+        return self.values
+
+    async def execute(self, query, *args):
+        self.calls.append(('execute', query, args))
+
+    async def copy_records(self, table, columns, records):
+        self.calls.append(('copy_records', table, records))
+
+    async def copy_merge(self, table, columns, records, on_conflict='', statements=(), where=''):
+        self.calls.append(('copy_merge', table, records, list(statements)))
+        return len(records)
+
+    async def copy_merge_many(self, batches, statements=()):
+        self.calls.append(('copy_merge_many', [(batch[0], batch[2]) for batch in batches], list(statements)))
+        return {batch[0]: len(batch[2]) for batch in batches}
+
+
+@pytest.fixture
+def fake_db():
+    """FakeDatabase class, tests build one with the answers they need"""
+    return FakeDatabase
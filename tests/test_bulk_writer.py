@@ -0,0 +1,51 @@
+import asyncio
+from bulk_writer import BulkWriter, MultiWriter
+from change_detection import ChangeDetector
+
+
+def write(writer, tickers:list) -> None:
+    async def run():
+        async with writer:
+            for ticker, rows in tickers:
+                await writer.add_ticker(ticker, rows)
+    asyncio.run(run())
+
+
+def test_unchanged_tickers_are_skipped(fake_db):
+    db = fake_db()
+    writer = BulkWriter(db, 'metadata', changes=ChangeDetector(db, 'metadata'))
+    write(writer, [('AAPL', [('AAPL', 1)]), ('AAPL', [('AAPL', 1)]), ('MSFT', [('MSFT', 2)])])
+    assert writer.skipped == 1
+    [(_, _, records, statements)] = db.calls
+    assert records == [('AAPL', 1), ('MSFT', 2)]
+    assert statements[0][2] == ['AAPL', 'MSFT']
+
+
+def test_pending_fingerprints_are_flushed_without_rows(fake_db):
+    db = fake_db()
+    changes = ChangeDetector(db, 'metadata')
+    changes.changed('AAPL', [('AAPL', 1)])
+    writer = BulkWriter(db, 'metadata', changes=changes)
+    asyncio.run(writer.flush())
+    [(_, _, records, [statement])] = db.calls
+    assert (records, statement[2]) == ([], ['AAPL'])
+
+
+def test_empty_results_keep_their_fingerprint_in_both_writers(fake_db):
+    db = fake_db()
+    single = BulkWriter(db, 'metadata', changes=ChangeDetector(db, 'metadata'))
+    write(single, [('AAPL', [])])
+    multi = MultiWriter(db, ('metadata',), changes={'metadata': ChangeDetector(db, 'metadata')})
+    write(multi, [('AAPL', [])])
+    assert (single.skipped, multi.skipped['metadata']) == (0, 0)
+    assert single.changes.known == multi.changes['metadata'].known == {}
+    assert db.calls == []
+
+
+def test_multi_writer_flushes_pending_fingerprints(fake_db):
+    db = fake_db()
+    changes = ChangeDetector(db, 'metadata')
+    changes.changed('AAPL', [('AAPL', 1)])
+    asyncio.run(MultiWriter(db, ('metadata',), changes={'metadata': changes}).flush())
+    [(_, batches, [statement])] = db.calls
+    assert (batches, statement[2]) == ([], ['AAPL'])
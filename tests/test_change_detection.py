@@ -0,0 +1,50 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+from change_detection import ChangeDetector, fingerprint
+from records import MetadataRecord
+
+
+def rows(target=Decimal('1.5')) -> list:
+    return [MetadataRecord(('AAPL', 'NASDAQ', 'Technology', 'Computers', target, None, 1000, 900, Decimal('1.2'),
+                            None, 5, None, None, None, None, datetime(2024, 1, 2), None, None, None, None, None))]
+
+
+def test_fingerprint_is_stable_signed_64_bit():
+    assert fingerprint(rows()) == fingerprint(rows())
+    assert -2 ** 63 <= fingerprint(rows()) < 2 ** 63
+
+
+def test_records_hash_like_tuples():
+    assert fingerprint(rows()) == fingerprint([tuple(row) for row in rows()])
+
+
+def test_values_and_scale_change_the_fingerprint():
+    assert fingerprint(rows()) != fingerprint(rows(Decimal('1.6')))
+    assert fingerprint(rows()) != fingerprint(rows(Decimal('1.50')))
+
+
+def test_changed(fake_db):
+    detector = ChangeDetector(fake_db(), 'metadata')
+    assert detector.changed('AAPL', rows())
+    assert not detector.changed('AAPL', rows())
+    assert detector.changed('AAPL', rows(Decimal('2')))
+    assert detector.changed('MSFT', rows())
+
+
+def test_loaded_fingerprints_are_unchanged(fake_db):
+    db = fake_db(fetch=[{'ticker': 'AAPL', 'fingerprint': fingerprint(rows())}])
+    detector = ChangeDetector(db, 'metadata')
+    asyncio.run(detector.load(['AAPL']))
+    assert db.calls[0][2] == ('metadata', ['AAPL'])
+    assert not detector.changed('AAPL', rows())
+    assert detector.statement() is None
+
+
+def test_statement_takes_the_pending_fingerprints(fake_db):
+    detector = ChangeDetector(fake_db(), 'metadata')
+    detector.changed('AAPL', rows())
+    detector.changed('AAPL', rows(Decimal('2')))
+    query, dataset, tickers, values = detector.statement()
+    assert (dataset, tickers, values) == ('metadata', ['AAPL'], [fingerprint(rows(Decimal('2')))])
+    assert detector.statement() is None
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+from main import NOT_RUNNABLE, arg_parser, job_steps
+
+
+class JobStepsTest(unittest.TestCase):
+    """Steps and options of `main.py`, single actions and 'run' with targets or a job file"""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def args(self, *argv):
+        return arg_parser().parse_args(list(argv))
+
+    def job(self, text:str) -> str:
+        file_name = os.path.join(self.folder.name, 'job.toml')
+        with open(file_name, 'w') as f:
+            f.write(text)
+        return file_name
+
+    def test_single_action_is_one_step(self):
+        args = self.args('metadata', '--batch_size', '10')
+        self.assertEqual(job_steps(args), [('metadata', args)])
+
+    def test_run_targets(self):
+        steps = job_steps(self.args('run', 'tickers', 'metadata', '--batch_size', '10'))
+        self.assertEqual([(action, args.action, args.batch_size, args.targets) for action, args in steps],
+                         [('tickers', 'tickers', 10, []), ('metadata', 'metadata', 10, [])])
+
+    def test_run_needs_actions(self):
+        with self.assertRaises(SystemExit):
+            job_steps(self.args('run'))
+
+    def test_job_defaults_and_step_options(self):
+        args = self.args('run', '--job', self.job('''
+batch_size = 10
+actions = ["tickers"]
+[[steps]]
+action = "dividends"
+full_dividends = true
+[[steps]]
+action = "enqueue"
+targets = ["metadata"]
+'''))
+        steps = job_steps(args)
+        self.assertEqual([(action, step.batch_size, step.full_dividends, step.targets) for action, step in steps],
+                         [('tickers', 10, False, []), ('dividends', 10, True, []), ('enqueue', 10, False, ['metadata'])])
+
+    def test_job_process_options_are_set_before_the_steps(self):
+        args = self.args('run', '--rate', '10', '--job', self.job('rate = 50.0\ndb_name = "other"\nactions = ["tickers"]'))
+        [(_, step)] = job_steps(args)
+        self.assertEqual((args.rate, args.db_name, step.rate, step.db_name), (50.0, 'other', 50.0, 'other'))
+
+    def test_step_process_options_are_rejected(self):
+        args = self.args('run', '--job', self.job('[[steps]]\naction = "metadata"\nrate = 3.0'))
+        with self.assertRaisesRegex(SystemExit, 'whole run'):
+            job_steps(args)
+
+    def test_unknown_options_are_rejected(self):
+        for text in ('colour = 1\nactions = ["tickers"]', '[[steps]]\naction = "tickers"\ncolour = 1'):
+            with self.subTest(text=text), self.assertRaisesRegex(SystemExit, 'colour'):
+                job_steps(self.args('run', '--job', self.job(text)))
+
+    def test_steps_that_cannot_run(self):
+        for action in NOT_RUNNABLE:
+            with self.subTest(action=action), self.assertRaises(SystemExit):
+                job_steps(self.args('run', action))
+
+
+if __name__ == '__main__':
+    unittest.main()
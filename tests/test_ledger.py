@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from ledger import Ledger
+
+
+def test_new_run_is_seeded_with_the_tickers(fake_db):
+    db = fake_db(fetchone=[7])
+    ledger = Ledger(db, 'metadata')
+    asyncio.run(ledger.start(['AAPL', 'MSFT', 'AAPL']))
+    assert ledger.run_id == 7
+    assert db.calls[0][2] == ('metadata', False)
+    table, records = db.calls[1][1:]
+    assert (table, sorted(records)) == ('run_tickers', [(7, 'AAPL'), (7, 'MSFT')])
+
+
+def test_new_run_defaults_to_listed_tickers(fake_db):
+    db = fake_db(fetchone=[7])
+    asyncio.run(Ledger(db, 'metadata').start())
+    assert db.calls[1][0] == 'execute'
+    assert 'FROM tickers WHERE delisted IS NULL' in db.calls[1][1]
+
+
+def test_resume_continues_an_unfinished_run_of_its_kind(fake_db):
+    db = fake_db(fetchone=[3])
+    ledger = Ledger(db, 'metadata', resume=True)
+    asyncio.run(ledger.start(['AAPL']))
+    assert ledger.run_id == 3
+    assert db.calls[0][2] == ('metadata', False)
+    assert [call[0] for call in db.calls] == ['fetchone', 'execute']
+
+
+def test_resume_without_a_run_starts_one(fake_db):
+    ledger = Ledger(fake_db(fetchone=[None, 8]), 'metadata', resume=True)
+    asyncio.run(ledger.start(['AAPL']))
+    assert ledger.run_id == 8
+
+
+def test_queued_runs_are_kept_apart(fake_db):
+    db = fake_db(fetchone=[None, 9])
+    asyncio.run(Ledger(db, 'dividends', resume=True, queued=True).start(['AAPL']))
+    assert [call[2] for call in db.calls[:2]] == [('dividends', True), ('dividends', True)]
+
+
+def test_attached_run_is_not_created(fake_db):
+    db = fake_db()
+    ledger = Ledger(db, 'metadata', run_id=5)
+    asyncio.run(ledger.start(['AAPL']))
+    assert (ledger.run_id, db.calls) == (5, [])
+
+
+def test_pending_is_a_list_read_at_once(fake_db):
+    db = fake_db(values=['AAPL', 'MSFT'])
+    assert asyncio.run(Ledger(db, 'metadata', max_attempts=4, run_id=5).pending()) == ['AAPL', 'MSFT']
+    assert db.calls[0][2] == (5, 4)
+
+
+@pytest.mark.parametrize('counts, status', [
+    ({'done': 3}, 'finished'),
+    ({'done': 2, 'failed': 1}, 'incomplete'),
+    ({'done': 2, 'pending': 1}, None),
+    ({'claimed': 1}, None),
+])
+def test_finish(fake_db, counts, status):
+    db = fake_db(fetch=[{'status': k, 'n': n} for k, n in counts.items()])
+    assert asyncio.run(Ledger(db, 'metadata', run_id=5).finish()) == counts
+    updates = [call[2] for call in db.calls if call[0] == 'execute']
+    assert updates == ([(5, status)] if status else [])
+
+
+def test_done_statement():
+    query, run_id, tickers = Ledger(None, 'metadata', run_id=5).done_statement(['AAPL'])
+    assert "status = 'done'" in query
+    assert (run_id, tickers) == (5, ['AAPL'])
@@ -0,0 +1,65 @@
+import asyncio
+import contextlib
+import io
+from scarper import Scarper
+from pipeline import ACTIONS, scrape_all
+from benchmarks.mock_nasdaq import PAYLOADS
+
+
+class MockScarper(Scarper):
+    """Serves mock payloads, a malformed one for `broken` (ticker, dataset) pairs"""
+
+    def __init__(self, broken=()):
+        super().__init__()
+        self.broken = set(broken)
+
+    async def fetch_raw(self, dataset, ticker, strict=False, **params):
+        if (ticker, dataset) in self.broken:
+            return {'data': 'not a table'}
+        return PAYLOADS['summary' if dataset == 'metadata' else dataset](ticker)
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.added, self.failed = [], []
+
+    async def add_ticker(self, ticker, rows):
+        self.added.append((ticker, rows))
+
+    async def ticker_failed(self, ticker, error, kind='parse'):
+        self.failed.append((ticker, kind))
+
+    async def flush(self):
+        pass
+
+
+class RecordingSink:
+    db = None
+
+    def multi_writer(self, tables, max_rows=None, ledger=None, changes=None):
+        return RecordingWriter()
+
+
+def run_all(tickers, engine, broken=()):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(scrape_all(None, MockScarper(broken), tickers, engine=engine, sink=RecordingSink()))
+
+
+def tables(rows):
+    return sorted({table for table, _ in rows if table})
+
+
+def test_vector_keeps_duplicate_tickers_apart():
+    writer = run_all(['AAA', 'BBB', 'AAA'], 'vector')
+    assert sorted(ticker for ticker, _ in writer.added) == ['AAA', 'AAA', 'BBB']
+    python = run_all(['AAA', 'BBB', 'AAA'], 'python')
+    assert sorted(map(repr, writer.added)) == sorted(map(repr, python.added))
+
+
+def test_malformed_dataset_keeps_the_other_datasets():
+    for engine in ('python', 'vector'):
+        writer = run_all(['AAA', 'BBB'], engine, broken=[('AAA', 'dividends')])
+        rows = dict(writer.added)
+        assert tables(rows['AAA']) == sorted({table for _, table in ACTIONS.values()} - {'dividends'}), engine
+        assert any(table is None and isinstance(error, Exception) for table, error in rows['AAA']), engine
+        assert tables(rows['BBB']) == sorted({table for _, table in ACTIONS.values()}), engine
@@ -0,0 +1,164 @@
+import asyncio
+import contextlib
+import io
+import time
+import unittest
+import httpx
+from resilience import CircuitBreaker, FetchError, RetryPolicy, classify_exception, classify_response
+from scarper import Scarper
+from scheduler import AdaptiveScheduler
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_delay_bounds(self):
+        policy = RetryPolicy(attempts=10, base=0.5, cap=4.0)
+        for attempt in range(1, 10):
+            bound = min(4.0, 0.5 * 2 ** (attempt - 1))
+            for _ in range(200):
+                self.assertTrue(0 <= policy.delay(attempt) <= bound, attempt)
+
+    def test_delay_waits_for_retry_after_up_to_the_cap(self):
+        policy = RetryPolicy(base=0.5, cap=4.0)
+        self.assertGreaterEqual(policy.delay(1, retry_after=2.0), 2.0)
+        self.assertEqual(policy.delay(1, retry_after=60.0), 4.0)
+
+    def test_at_least_one_attempt(self):
+        with self.assertRaises(ValueError):
+            RetryPolicy(attempts=0)
+
+
+class ClassifyTest(unittest.TestCase):
+    def test_responses(self):
+        self.assertIsNone(classify_response(httpx.Response(200)))
+        throttled = classify_response(httpx.Response(429, headers={'Retry-After': '3'}))
+        self.assertEqual((throttled.kind, throttled.retry_after, throttled.transient), ('throttled', 3.0, True))
+        self.assertEqual(classify_response(httpx.Response(503)).kind, 'server')
+        self.assertEqual(classify_response(httpx.Response(404)).transient, False)
+        self.assertEqual(classify_response(httpx.Response(403)).kind, 'client')
+
+    def test_exceptions(self):
+        self.assertEqual(classify_exception(httpx.ReadTimeout('slow')).kind, 'timeout')
+        self.assertEqual(classify_exception(httpx.ConnectError('refused')).kind, 'transport')
+        self.assertEqual(classify_exception(ValueError('not json')).kind, 'malformed')
+
+
+class CircuitBreakerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.output = contextlib.redirect_stdout(io.StringIO())
+        self.output.__enter__()
+        self.breaker = CircuitBreaker('test', threshold=2, cooldown=0.05)
+
+    def tearDown(self):
+        self.output.__exit__(None, None, None)
+
+    async def test_opens_after_threshold_failures(self):
+        self.breaker.failure()
+        self.assertFalse(self.breaker.is_open)
+        self.breaker.failure()
+        self.assertTrue(self.breaker.is_open)
+        self.assertEqual(self.breaker.opened, 1)
+        start = time.monotonic()
+        await self.breaker.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    async def test_one_probe_then_close(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        await self.breaker.wait()
+        self.assertTrue(self.breaker.probing)
+        waiting = asyncio.ensure_future(self.breaker.wait())
+        await asyncio.sleep(0.03)
+        self.assertFalse(waiting.done())
+        self.breaker.success()
+        await asyncio.wait_for(waiting, 1.0)
+        self.assertFalse(self.breaker.is_open)
+        self.assertEqual(self.breaker.cooldown, 0.05)
+
+    async def test_failed_probe_reopens_for_longer(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        await self.breaker.wait()
+        self.breaker.failure()
+        self.assertEqual(self.breaker.opened, 2)
+        self.assertAlmostEqual(self.breaker.open_until - time.monotonic(), 0.1, delta=0.02)
+
+    async def test_inconclusive_probe_keeps_the_circuit_open(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        await self.breaker.wait()
+        self.breaker.inconclusive()
+        self.assertTrue(self.breaker.is_open)
+        await asyncio.wait_for(self.breaker.wait(), 1.0)
+        self.assertTrue(self.breaker.probing)
+
+    async def test_failures_in_flight_do_not_extend_the_pause(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        open_until = self.breaker.open_until
+        self.breaker.failure()
+        self.assertEqual((self.breaker.open_until, self.breaker.opened), (open_until, 1))
+
+
+class RequestRetryTest(unittest.IsolatedAsyncioTestCase):
+    """`Scarper.request_json` retries transient failures only"""
+
+    def scraper(self, statuses:list, attempts:int=3, cache=None) -> Scarper:
+        self.requests = 0
+
+        def handler(request):
+            status = statuses[min(self.requests, len(statuses) - 1)]
+            self.requests += 1
+            return httpx.Response(status, json={'data': {}})
+
+        scraper = Scarper(base_url='http://mock', retry=RetryPolicy(attempts, base=0.001),
+                          scheduler=AdaptiveScheduler(rate=1000.0), breaker_threshold=100, cache=cache)
+        scraper._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return scraper
+
+    async def request(self, scraper:Scarper):
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                return await scraper.request_json('http://mock/x', 'metadata', 'T')
+            finally:
+                await scraper.close()
+
+    async def test_transient_failures_are_retried(self):
+        self.assertEqual(await self.request(self.scraper([503, 429, 200])), {'data': {}})
+        self.assertEqual(self.requests, 3)
+
+    async def test_gives_up_after_the_attempts(self):
+        scraper = self.scraper([503], attempts=3)
+        with self.assertRaises(FetchError) as raised:
+            await self.request(scraper)
+        self.assertEqual((raised.exception.kind, raised.exception.attempts, self.requests), ('server', 3, 3))
+        self.assertEqual(scraper.failures.counts['server'], 1)
+
+    async def test_client_errors_are_not_retried(self):
+        with self.assertRaises(FetchError) as raised:
+            await self.request(self.scraper([404, 200]))
+        self.assertEqual((raised.exception.kind, self.requests), ('not_found', 1))
+
+
+    async def test_other_failures_keep_the_throttling_count(self):
+        scraper = self.scraper([429, 429, 404])
+        with self.assertRaises(FetchError):
+            await self.request(scraper)
+        self.assertEqual((self.requests, scraper.breaker('metadata').failures), (3, 2))
+
+    async def test_cache_write_errors_are_not_retried(self):
+        class FullDisk:
+            replay = False
+
+            def get(self, url, dataset=None):
+                return None
+
+            def put(self, url, body):
+                raise OSError('No space left on device')
+
+        with self.assertRaises(OSError):
+            await self.request(self.scraper([200], cache=FullDisk()))
+        self.assertEqual(self.requests, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import asyncio
+import contextlib
+import io
+import unittest
+from scheduler import AdaptiveScheduler, TokenBucket
+
+
+class AdaptiveSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    """AIMD: multiplicative backoff on congestion, additive ramp up after healthy windows"""
+
+    def release(self, scheduler:AdaptiveScheduler, status:int, times:int=1):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(times):
+                scheduler.in_flight += 1
+                scheduler.release(status)
+
+    async def test_backoff_halves_rate_and_limit(self):
+        scheduler = AdaptiveScheduler(rate=10.0, max_in_flight=8)
+        self.release(scheduler, 429)
+        self.assertEqual((scheduler.rate, scheduler.limit, scheduler.backoffs), (5.0, 4, 1))
+
+    async def test_transport_errors_and_server_errors_back_off(self):
+        for status in (0, 500, 503):
+            scheduler = AdaptiveScheduler(rate=10.0, max_in_flight=8)
+            self.release(scheduler, status)
+            self.assertEqual(scheduler.backoffs, 1, status)
+
+    async def test_burst_within_cooldown_backs_off_once(self):
+        scheduler = AdaptiveScheduler(rate=10.0, max_in_flight=8, cooldown=60.0)
+        self.release(scheduler, 429, times=5)
+        self.assertEqual((scheduler.rate, scheduler.limit, scheduler.backoffs), (5.0, 4, 1))
+
+    async def test_backoff_floors(self):
+        scheduler = AdaptiveScheduler(rate=1.0, max_in_flight=1, min_rate=0.5, cooldown=0.0)
+        self.release(scheduler, 429, times=4)
+        self.assertEqual((scheduler.rate, scheduler.limit), (0.5, 1))
+
+    async def test_ramp_up_after_a_healthy_window(self):
+        scheduler = AdaptiveScheduler(rate=10.0, max_in_flight=8, window=20, increase=1.0)
+        self.release(scheduler, 429)
+        self.release(scheduler, 200, times=19)
+        self.assertEqual((scheduler.rate, scheduler.limit), (5.0, 4))
+        self.release(scheduler, 200)
+        self.assertEqual((scheduler.rate, scheduler.limit), (6.0, 5))
+
+    async def test_ramp_up_is_capped(self):
+        scheduler = AdaptiveScheduler(rate=10.0, max_in_flight=2, max_rate=11.0, window=1)
+        self.release(scheduler, 200, times=10)
+        self.assertEqual((scheduler.rate, scheduler.limit), (11.0, 2))
+
+    async def test_congestion_resets_the_healthy_window(self):
+        scheduler = AdaptiveScheduler(rate=10.0, max_in_flight=8, window=3, cooldown=60.0)
+        self.release(scheduler, 200, times=2)
+        self.release(scheduler, 429)
+        self.release(scheduler, 200, times=2)
+        self.assertEqual(scheduler.rate, 5.0)
+
+    async def test_cancelled_requests_do_not_back_off(self):
+        scheduler = AdaptiveScheduler(rate=10.0, max_in_flight=8)
+
+        async def request():
+            async with scheduler.slot():
+                await asyncio.sleep(10)
+
+        task = asyncio.ensure_future(request())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual((scheduler.rate, scheduler.limit, scheduler.in_flight, scheduler.backoffs), (10.0, 8, 0, 0))
+
+    async def test_notifications_are_kept_until_they_run(self):
+        scheduler = AdaptiveScheduler()
+        self.release(scheduler, 200)
+        self.assertEqual(len(scheduler._notifications), 1)
+        await asyncio.gather(*scheduler._notifications)
+        await asyncio.sleep(0)
+        self.assertEqual(len(scheduler._notifications), 0)
+
+    async def test_in_flight_never_exceeds_the_limit(self):
+        scheduler = AdaptiveScheduler(rate=1000.0, max_in_flight=3)
+        peak = 0
+
+        async def request(_):
+            nonlocal peak
+            async with scheduler.slot() as slot:
+                peak = max(peak, scheduler.in_flight)
+                await asyncio.sleep(0.001)
+                slot.status = 200
+            return 1
+
+        results = [result async for result in scheduler.imap(request, range(30))]
+        self.assertEqual(len(results), 30)
+        self.assertLessEqual(peak, 3)
+
+
+class TokenBucketTest(unittest.IsolatedAsyncioTestCase):
+    async def test_rate_after_the_burst(self):
+        bucket = TokenBucket(rate=200.0, capacity=1)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(11):
+            await bucket.acquire()
+        # 10 tokens past the burst of 1 at 200/s
+        self.assertGreaterEqual(loop.time() - start, 0.045)
+
+
+if __name__ == '__main__':
+    unittest.main()
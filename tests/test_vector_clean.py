@@ -0,0 +1,85 @@
+import contextlib
+import io
+import unittest
+from decimal import Decimal
+from scarper import Scarper
+from vector_clean import VectorCleaner
+from benchmarks.bench_cleaning import payloads
+from benchmarks.mock_nasdaq import PAYLOADS
+
+
+def metadata(ticker:str, **values) -> tuple:
+    """Mock metadata payload of `ticker` with some summary values replaced"""
+    data = PAYLOADS['summary'](ticker)
+    for key, value in values.items():
+        data['data']['summaryData'][key]['value'] = value
+    return ticker, data
+
+
+class VectorCleanerTest(unittest.TestCase):
+    """`VectorCleaner.parse_batch` gives the rows of `Scarper.parse`, down to the repr the fingerprints hash"""
+
+    def setUp(self):
+        self.scraper = Scarper()
+        self.cleaner = VectorCleaner()
+
+    def expected(self, dataset:str, items:list) -> list:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return [(ticker, self.scraper.parse(dataset, ticker, data)) for ticker, data in items]
+
+    def assertSameRows(self, dataset:str, items:list):
+        self.assertEqual(repr(self.cleaner.parse_batch(dataset, items)), repr(self.expected(dataset, items)))
+
+    def test_datasets_with_noise(self):
+        for dataset in ('info', 'metadata', 'dividends', 'institutionals'):
+            with self.subTest(dataset=dataset):
+                self.assertSameRows(dataset, payloads(dataset, 200))
+
+    def test_decimal_scale_does_not_depend_on_the_batch(self):
+        alone = metadata('AAA', OneYrTarget='1.5', Yield='2%')
+        items = [alone, metadata('BBB', OneYrTarget='$2.125', Yield='0.375%'), metadata('CCC', OneYrTarget='$3')]
+        self.assertSameRows('metadata', items)
+        [(_, [row])] = self.cleaner.parse_batch('metadata', [alone])
+        [(_, [batched]), *_] = self.cleaner.parse_batch('metadata', items)
+        self.assertEqual(repr(row), repr(batched))
+        self.assertEqual(repr(batched.one_yr_target), repr(Decimal('1.5')))
+        self.assertEqual(getattr(batched, 'yield'), 2)
+
+    def test_unparseable_numbers_drop_the_row(self):
+        items = [metadata('AAA', OneYrTarget='x'), metadata('BBB', PreviousClose='1.2.3'),
+                 metadata('CCC', OneYrTarget='N/A', PreviousClose='')]
+        self.assertSameRows('metadata', items)
+        self.assertEqual([len(rows) for _, rows in self.cleaner.parse_batch('metadata', items)], [0, 0, 1])
+
+    def test_unparseable_dates_drop_the_row(self):
+        items = [metadata('AAA', ExDividendDate='31/12/2024'), metadata('BBB', DividendPaymentDate='Feb 30, 2025'),
+                 metadata('CCC', ExDividendDate='N/A', DividendPaymentDate='Jan 2, 2025')]
+        parsed = self.cleaner.parse_batch('metadata', items)
+        self.assertEqual([len(rows) for _, rows in parsed], [0, 0, 1])
+        self.assertEqual(repr(parsed[2]), repr(self.expected('metadata', items[2:])[0]))
+
+    def test_incremental_stops_at_the_stored_or_a_missing_ex_date(self):
+        data = PAYLOADS['dividends']('AAA', rows=12)
+        rows = data['data']['dividends']['rows']
+        since = Scarper().clean_date(rows[6]['exOrEffDate']).date()
+        for missing, stop in ((None, 6), (3, 3)):
+            with self.subTest(missing=missing):
+                if missing is not None:
+                    rows[missing]['exOrEffDate'] = 'N/A'
+                with contextlib.redirect_stdout(io.StringIO()):
+                    expected = self.scraper.parse('dividends', 'AAA', data, since)
+                [(_, got)] = self.cleaner.parse_batch('dividends', [('AAA', data)], {'AAA': since})
+                self.assertEqual(len(got), stop)
+                self.assertEqual(repr(got), repr(expected))
+
+    def test_malformed_payload_fails_its_ticker_only(self):
+        good = metadata('AAA')
+        parsed = self.cleaner.parse_batch('metadata', [good, ('BAD', {'data': {'summaryData': ['x']}}), good])
+        self.assertEqual([ticker for ticker, _ in parsed], ['AAA', 'BAD', 'AAA'])
+        self.assertIsInstance(parsed[1][1], Exception)
+        self.assertEqual(repr(parsed[0][1]), repr(self.expected('metadata', [good])[0][1]))
+        self.assertEqual(repr(parsed[2][1]), repr(parsed[0][1]))
+
+
+if __name__ == '__main__':
+    unittest.main()